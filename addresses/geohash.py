@@ -0,0 +1,120 @@
+from math import floor
+
+import numpy as np
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Cells of ~1.2 km x 0.6 km. Changing it requires backfilling Address.geohash.
+GEOHASH_PRECISION = 6
+
+
+def cell_size(precision=GEOHASH_PRECISION):
+    """
+    Returns the (lat_degrees, lon_degrees) size of a geohash cell.
+    """
+    bits = precision * 5
+    lon_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    return 180.0 / 2**lat_bits, 360.0 / 2**lon_bits
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    """
+    Encodes a coordinate into its geohash string.
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    geohash = []
+    bit = 0
+    char = 0
+    even = True
+    while len(geohash) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if longitude >= mid:
+                char = char * 2 + 1
+                lon_range[0] = mid
+            else:
+                char = char * 2
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                char = char * 2 + 1
+                lat_range[0] = mid
+            else:
+                char = char * 2
+                lat_range[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            geohash.append(BASE32[char])
+            bit = 0
+            char = 0
+    return "".join(geohash)
+
+
+def encode_many(latitudes, longitudes, precision=GEOHASH_PRECISION):
+    """
+    Vectorized encode: returns the geohash strings of arrays of coordinates,
+    for bulk inserts that bypass Address.save.
+    """
+    bits = precision * 5
+    lon_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    # Index of the cell along each axis; its bits, most significant first,
+    # are the bisection decisions encode makes one by one
+    lat_cells = np.floor(
+        (np.asarray(latitudes, dtype=np.float64) + 90) / 180 * 2**lat_bits
+    )
+    lon_cells = np.floor(
+        (np.asarray(longitudes, dtype=np.float64) + 180) / 360 * 2**lon_bits
+    )
+    lat_cells = np.clip(lat_cells, 0, 2**lat_bits - 1).astype(np.int64)
+    lon_cells = np.clip(lon_cells, 0, 2**lon_bits - 1).astype(np.int64)
+
+    code = np.zeros(lat_cells.shape, dtype=np.int64)
+    for bit in range(bits):
+        # Even bits bisect the longitude, odd ones the latitude
+        if bit % 2 == 0:
+            value = (lon_cells >> (lon_bits - 1 - bit // 2)) & 1
+        else:
+            value = (lat_cells >> (lat_bits - 1 - bit // 2)) & 1
+        code = (code << 1) | value
+
+    alphabet = np.array(list(BASE32))
+    chars = [
+        alphabet[(code >> (5 * (precision - 1 - i))) & 31] for i in range(precision)
+    ]
+    return ["".join(row) for row in zip(*chars)]
+
+
+def ring(latitude, longitude, radius, precision=GEOHASH_PRECISION):
+    """
+    Returns the geohashes of the cells at Chebyshev distance `radius` from the
+    cell containing the coordinate. Radius 0 is the cell itself, radius 1 its
+    eight neighbours, and so on.
+    """
+    dlat, dlon = cell_size(precision)
+    row = floor((latitude + 90) / dlat)
+    col = floor((longitude + 180) / dlon)
+    rows = int(180 / dlat)
+
+    if radius == 0:
+        offsets = [(0, 0)]
+    else:
+        offsets = [(-radius, d) for d in range(-radius, radius + 1)]
+        offsets += [(radius, d) for d in range(-radius, radius + 1)]
+        offsets += [(d, -radius) for d in range(-radius + 1, radius)]
+        offsets += [(d, radius) for d in range(-radius + 1, radius)]
+
+    cells = set()
+    for drow, dcol in offsets:
+        cell_row = row + drow
+        if not 0 <= cell_row < rows:
+            continue
+        # Encode the centre of each cell, wrapping around the antimeridian
+        cell_lat = -90 + (cell_row + 0.5) * dlat
+        cell_lon = (-180 + (col + dcol + 0.5) * dlon + 180) % 360 - 180
+        cells.add(encode(cell_lat, cell_lon, precision))
+    return sorted(cells)
@@ -0,0 +1,32 @@
+from django.db import migrations, models
+
+from addresses import geohash
+
+
+def backfill_geohash(apps, schema_editor):
+    Address = apps.get_model('addresses', 'Address')
+    batch = []
+    for address in Address.objects.only('id', 'latitude', 'longitude').iterator(chunk_size=2000):
+        address.geohash = geohash.encode(address.latitude, address.longitude)
+        batch.append(address)
+        if len(batch) >= 2000:
+            Address.objects.bulk_update(batch, ['geohash'])
+            batch = []
+    if batch:
+        Address.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('addresses', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='address',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
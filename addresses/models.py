@@ -1,10 +1,20 @@
 from django.db import models
+from addresses import geohash
 
 class Address(models.Model):
     street = models.CharField(max_length=255)
     city = models.CharField(max_length=100)
     latitude = models.FloatField()
     longitude = models.FloatField()
+    geohash = models.CharField(max_length=12, blank=True, editable=False, db_index=True)
+
+    def save(self, *args, **kwargs):
+        # Keep the cell id in sync with the coordinates it is derived from
+        self.geohash = geohash.encode(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.street}, {self.city}"
@@ -0,0 +1,81 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from addresses import geohash
+from addresses.models import Address
+from delivery_system.response_cache import response_cache
+
+
+class GeohashTest(TestCase):
+    """Test the geohash helpers."""
+
+    def test_encode(self):
+        """Test encoding against a well-known geohash."""
+        self.assertEqual(geohash.encode(57.64911, 10.40744, 11), "u4pruydqqvj")
+
+    def test_ring(self):
+        """Test that rings grow outwards around the cell of the point."""
+        center = geohash.encode(4.693408, -74.112279)
+
+        self.assertEqual(geohash.ring(4.693408, -74.112279, 0), [center])
+        neighbours = geohash.ring(4.693408, -74.112279, 1)
+        self.assertEqual(len(neighbours), 8)
+        self.assertNotIn(center, neighbours)
+        self.assertEqual(len(geohash.ring(4.693408, -74.112279, 2)), 16)
+
+    def test_encode_many(self):
+        """Test that vectorized encoding matches encode."""
+        latitudes = [57.64911, 4.693408, -33.9, 0.0, 89.99]
+        longitudes = [10.40744, -74.112279, 151.2, 0.0, -179.99]
+
+        self.assertEqual(
+            geohash.encode_many(latitudes, longitudes),
+            [geohash.encode(lat, lon) for lat, lon in zip(latitudes, longitudes)],
+        )
+        self.assertEqual(
+            geohash.encode_many([57.64911], [10.40744], 11), ["u4pruydqqvj"]
+        )
+
+
+class AddressModelTest(TestCase):
+    """Test the Address model."""
+
+    def test_geohash_is_maintained_on_save(self):
+        """Test that the geohash follows the coordinates."""
+        address = Address.objects.create(
+            street="Calle 123", city="Bogotá", latitude=4.60971, longitude=-74.08175
+        )
+        self.assertEqual(address.geohash, geohash.encode(4.60971, -74.08175))
+
+        address.latitude = 4.8
+        address.save(update_fields=["latitude"])
+        address.refresh_from_db()
+        self.assertEqual(address.geohash, geohash.encode(4.8, -74.08175))
+
+
+class AddressListViewTest(TestCase):
+    """Test the paginated address list."""
+
+    def setUp(self):
+        """Set up a few addresses and an authenticated client."""
+        self.addresses = [
+            Address.objects.create(
+                street=f"Calle {i}", city="Bogotá", latitude=4.6, longitude=-74.08
+            )
+            for i in range(4)
+        ]
+        response_cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=User.objects.create(username="reader"))
+
+    def test_cursor_walks_every_address_once(self):
+        """Test that following `next` returns each address exactly once."""
+        url = reverse("address-list-create") + "?page_size=3"
+        ids = []
+        while url:
+            response = self.client.get(url)
+            ids.extend(row["id"] for row in response.data["results"])
+            url = response.data["next"]
+
+        self.assertEqual(ids, [address.id for address in self.addresses])
@@ -2,15 +2,31 @@ from rest_framework import generics
 from .models import Address
 from .serializers import AddressSerializer
 from rest_framework.permissions import IsAuthenticated
+from delivery_system.pagination import KeysetPagination
+from delivery_system.response_cache import CachedResponseMixin
+from drivers.models import Driver
  
 # Vista para crear y listar direcciones
-class AddressListCreateView(generics.ListCreateAPIView):
-    queryset = Address.objects.all()
+class AddressListCreateView(CachedResponseMixin, generics.ListCreateAPIView):
+    queryset = Address.objects.only("id", "street", "city", "latitude", "longitude")
     serializer_class = AddressSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    cache_list_scope = "addresses"
 
 # Vista para obtener, actualizar y eliminar una dirección especifica
-class AddressRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class AddressRetrieveUpdateDestroyView(CachedResponseMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Address.objects.all()
     serializer_class = AddressSerializer
     permission_classes = [IsAuthenticated]
+    cache_object_scope = "address"
+
+    def get_cache_scopes(self, pk=None):
+        # Location pings move a driver's address with a bare UPDATE that only
+        # knows the driver, so the entry also depends on the drivers there
+        driver_ids = Driver.objects.filter(current_address_id=pk).values_list(
+            "id", flat=True
+        )
+        return super().get_cache_scopes(pk) + [
+            f"driver:{driver_id}" for driver_id in driver_ids
+        ]
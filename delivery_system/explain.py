@@ -0,0 +1,98 @@
+import json
+import re
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+# Statements worth explaining; SAVEPOINT, INSERT and friends are skipped
+EXPLAINABLE = ("SELECT", "UPDATE", "DELETE", "WITH")
+
+# SQLite reports a full table scan as "SCAN <table>" with no "USING ... INDEX"
+SQLITE_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+
+# ...and a walk of the primary key the same way. It is only told apart for
+# unfiltered statements ordered by the key with a LIMIT, i.e. first keyset
+# pages, which stop after LIMIT rows (an index scan on PostgreSQL).
+SQLITE_KEY_WALK = re.compile(
+    r'^SELECT .* FROM "(\w+)"(?: (?:INNER|LEFT OUTER) JOIN .*)? '
+    r'ORDER BY "\1"\."id" (?:ASC|DESC) LIMIT \d+$'
+)
+
+# Tables small enough for a sequential scan to be the right plan
+SMALL_TABLES = {"django_content_type", "django_migrations"}
+
+
+def _postgresql_scans(plan):
+    scans = []
+    if plan.get("Node Type") == "Seq Scan":
+        scans.append(plan["Relation Name"])
+    for child in plan.get("Plans", ()):
+        scans.extend(_postgresql_scans(child))
+    return scans
+
+
+def sequential_scans(sql, using=connection):
+    """
+    Runs EXPLAIN on a statement and returns the tables it reads with a
+    sequential scan. Supports PostgreSQL and SQLite.
+    """
+    with using.cursor() as cursor:
+        if using.vendor == "postgresql":
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}")
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return _postgresql_scans(plan[0]["Plan"])
+        if using.vendor == "sqlite":
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            details = [row[-1] for row in cursor.fetchall()]
+            scans = [
+                match.group(1)
+                for detail in details
+                if (match := SQLITE_SCAN.match(detail))
+            ]
+            walk = SQLITE_KEY_WALK.match(sql)
+            if walk and " WHERE " not in sql and "TEMP B-TREE" not in " ".join(details):
+                scans = [table for table in scans if table != walk.group(1)]
+            return scans
+    raise NotImplementedError(f"EXPLAIN checks are not supported on {using.vendor}")
+
+
+def analyze(using=connection):
+    """
+    Refreshes the planner statistics, e.g. right after seeding test data.
+    """
+    with using.cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+
+@contextmanager
+def assert_no_sequential_scans(tables=None, using=connection):
+    """
+    Captures the queries run inside the block and fails if the plan of any
+    of them reads one of `tables` (every table when None) sequentially.
+    SMALL_TABLES are never reported.
+    Only meaningful on a seeded, analyzed database: planners rightly prefer
+    sequential scans on small tables.
+    """
+    with CaptureQueriesContext(using) as captured:
+        yield captured
+
+    offenders = []
+    for query in captured.captured_queries:
+        sql = query["sql"]
+        if not sql.lstrip().upper().startswith(EXPLAINABLE):
+            continue
+        scanned = [
+            table
+            for table in sequential_scans(sql, using)
+            if (tables is None or table in tables) and table not in SMALL_TABLES
+        ]
+        if scanned:
+            offenders.append(f"{', '.join(scanned)}: {sql}")
+    if offenders:
+        raise AssertionError(
+            "Sequential scans in %d queries:\n%s"
+            % (len(offenders), "\n".join(offenders))
+        )
@@ -0,0 +1,309 @@
+import contextvars
+import hmac
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+from django.utils.decorators import sync_and_async_middleware
+from django.views import View
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class Histogram:
+    """
+    Prometheus histogram: observation counts per bucket, and their sum,
+    for each combination of label values.
+    """
+
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def clear(self):
+        with self._lock:
+            self._series = {}
+
+    def collect(self):
+        """
+        Returns the (name, labels, value) samples of every series, with
+        cumulative buckets as Prometheus expects.
+        """
+        with self._lock:
+            series = {
+                labels: (list(counts), total)
+                for labels, (counts, total) in self._series.items()
+            }
+        samples = []
+        for labels, (counts, total) in sorted(series.items()):
+            labels = dict(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip([*self.buckets, "+Inf"], counts):
+                cumulative += count
+                samples.append(
+                    (f"{self.name}_bucket", {**labels, "le": bound}, cumulative)
+                )
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return [(self.name, "histogram", self.documentation, samples)]
+
+
+class MetricsRegistry:
+    """
+    Metrics of this process in the Prometheus text format. Histograms are
+    registered once; collectors are callables returning
+    (name, type, documentation, [(name, labels, value), ...]) families,
+    read at scrape time from counters kept elsewhere (e.g. ors.stats()).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._collectors = []
+
+    def register(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+        return collector
+
+    def histogram(self, *args, **kwargs):
+        histogram = Histogram(*args, **kwargs)
+        self.register(histogram.collect)
+        return histogram
+
+    def render(self):
+        lines = []
+        with self._lock:
+            collectors = list(self._collectors)
+        for collector in collectors:
+            for name, kind, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for sample, labels, value in samples:
+                    lines.append(
+                        f"{sample}{_format_labels(labels)} {_format_value(value)}"
+                    )
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = {
+        name: str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        for name, value in labels.items()
+    }
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped.items()) + "}"
+
+
+def _format_value(value):
+    if value is None:
+        return "NaN"
+    return str(int(value) if isinstance(value, bool) else value)
+
+
+registry = MetricsRegistry()
+
+request_duration = registry.histogram(
+    "http_request_duration_seconds",
+    "Time from the request entering the middleware to the response leaving it.",
+    labelnames=("view", "method", "status"),
+)
+request_phase_duration = registry.histogram(
+    "http_request_phase_seconds",
+    "Time spent in each phase of a request (phases can overlap, e.g. db).",
+    labelnames=("view", "phase"),
+)
+request_queries = registry.histogram(
+    "http_request_db_queries",
+    "SQL queries run per request.",
+    buckets=QUERY_BUCKETS,
+    labelnames=("view",),
+)
+
+
+class RequestTimer:
+    """
+    Phase durations (seconds) and SQL query count of one request.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.queries = 0
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def header(self, total):
+        """
+        Returns the Server-Timing header value, durations in milliseconds.
+        """
+        metrics = []
+        for phase, seconds in self.phases.items():
+            metric = f"{phase};dur={seconds * 1000:.1f}"
+            if phase == "db":
+                metric += f';desc="{self.queries} queries"'
+            metrics.append(metric)
+        metrics.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(metrics)
+
+
+# Timer of the request being served. Contexts are copied into sync_to_async
+# threads, so phases and queries of async views are recorded too.
+_current = contextvars.ContextVar("request_timer", default=None)
+
+
+@contextmanager
+def timed(phase):
+    """
+    Adds the time spent in the block to `phase` of the current request.
+    Costs two clock reads outside of a request or without the middleware.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer = _current.get()
+        if timer is not None:
+            timer.add(phase, time.perf_counter() - started)
+
+
+def _time_query(execute, sql, params, many, context):
+    timer = _current.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.add("db", time.perf_counter() - started)
+        timer.queries += 1
+
+
+def install_query_timer(connection):
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    install_query_timer(connection)
+
+
+connection_created.connect(_on_connection_created)
+
+
+def _start():
+    # Connections opened before this module was imported
+    for connection in connections.all(initialized_only=True):
+        install_query_timer(connection)
+    timer = RequestTimer()
+    return timer, _current.set(timer)
+
+
+def _finish(request, response, timer, token):
+    _current.reset(token)
+    total = time.perf_counter() - timer.started
+    match = getattr(request, "resolver_match", None)
+    view = (match.url_name if match else None) or "unmatched"
+    request_duration.observe(total, view, request.method, str(response.status_code))
+    for phase, seconds in timer.phases.items():
+        request_phase_duration.observe(seconds, view, phase)
+    request_queries.observe(timer.queries, view)
+    if getattr(settings, "SERVER_TIMING", True):
+        response["Server-Timing"] = timer.header(total)
+    return response
+
+
+@sync_and_async_middleware
+def timing_middleware(get_response):
+    """
+    Times every request: its total and per-phase durations and SQL queries
+    go to the request histograms and, with SERVER_TIMING, to a
+    Server-Timing response header. Phases are the `timed` blocks the
+    request went through, plus db. Works in sync and async stacks.
+    """
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            timer, token = _start()
+            response = await get_response(request)
+            return _finish(request, response, timer, token)
+
+    else:
+
+        def middleware(request):
+            timer, token = _start()
+            response = get_response(request)
+            return _finish(request, response, timer, token)
+
+    return middleware
+
+
+class TimedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication recording its time as the auth phase.
+    """
+
+    def authenticate(self, request):
+        with timed("auth"):
+            return super().authenticate(request)
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer recording its time as the render phase.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timed("render"):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class MetricsView(View):
+    """
+    Prometheus text exposition of this process's metrics. Scrapers send
+    METRICS_TOKEN as a bearer token; admin users can use their JWT.
+    """
+
+    http_method_names = ["get"]
+
+    def get(self, request):
+        if not self.allowed(request):
+            return HttpResponse("Forbidden\n", status=403, content_type="text/plain")
+        return HttpResponse(
+            registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+        )
+
+    def allowed(self, request):
+        header = request.headers.get("Authorization", "")
+        token = getattr(settings, "METRICS_TOKEN", "")
+        if token and hmac.compare_digest(header.encode(), f"Bearer {token}".encode()):
+            return True
+        try:
+            authenticated = JWTAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return False
+        return authenticated is not None and authenticated[0].is_staff
@@ -0,0 +1,296 @@
+import hashlib
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from rest_framework import status
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from delivery_system.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    Cache of serialized API representations with versioned invalidation.
+
+    Every entry records the versions of the scopes it was built from, e.g.
+    "driver:12" for a detail and "drivers" for the list. Writers bump the
+    versions of the scopes they touch once their transaction commits, which
+    makes every dependent entry stale without having to find or delete it.
+    Versions are read before the representation is built, so a write that
+    commits in between leaves the entry under an already stale version
+    instead of caching old data under the new one.
+
+    Entries live in the Django cache named by RESPONSE_CACHE_BACKEND, which
+    has to be shared by every process that writes: web workers, but also
+    the dispatch commands. A bump made in a per-process (locmem) cache is
+    never seen by the others, so the cache refuses to serve from one when
+    WEB_CONCURRENCY runs several workers.
+    """
+
+    def __init__(self, backend=None, ttl=None):
+        self.backend = backend or getattr(settings, "RESPONSE_CACHE_BACKEND", "default")
+        self.ttl = ttl or getattr(settings, "RESPONSE_CACHE_TTL", 60)
+        self._lock = threading.Lock()
+        self._refused = False
+        self._bumped_at = {}
+        self._scheduled = set()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache(self):
+        return caches[self.backend]
+
+    def per_process(self):
+        return isinstance(self.cache, LocMemCache)
+
+    def enabled(self):
+        if not getattr(settings, "RESPONSE_CACHE_ENABLED", True):
+            return False
+        if self.per_process() and getattr(settings, "WEB_CONCURRENCY", 1) > 1:
+            if not self._refused:
+                self._refused = True
+                logger.warning(
+                    "Response cache disabled: %r is per process and "
+                    "WEB_CONCURRENCY runs several workers",
+                    self.backend,
+                )
+            return False
+        return True
+
+    def versions(self, scopes):
+        """
+        Returns the current {scope: version} of the given scopes. A scope
+        seen for the first time (or evicted) starts at a fresh timestamp, so
+        entries stored under an evicted version can never match again.
+        """
+        keys = {f"version:{scope}": scope for scope in scopes}
+        found = self.cache.get_many(list(keys))
+        for key in keys.keys() - found.keys():
+            self.cache.add(key, time.time_ns(), timeout=None)
+            found[key] = self.cache.get(key)
+        return {keys[key]: version for key, version in found.items()}
+
+    def get(self, key):
+        """
+        Returns the cached representation, or None if it is missing or any
+        of its scopes changed since it was stored.
+        """
+        entry = self.cache.get(f"response:{key}")
+        hit = entry is not None and self.versions(entry[0]) == entry[0]
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return entry[1] if hit else None
+
+    def set(self, key, versions, data):
+        self.cache.set(f"response:{key}", (versions, data), timeout=self.ttl)
+
+    def _bump(self, scopes):
+        # A single set per key on every backend, where incr can be a racy
+        # get and set: versions only need to differ from the previous one
+        version = time.time_ns()
+        self.cache.set_many(
+            {f"version:{scope}": version for scope in scopes}, timeout=None
+        )
+
+    def invalidate(self, *scopes):
+        """
+        Bumps the versions of the given scopes when the current transaction
+        commits (immediately outside of one).
+        """
+        scopes = [scope for scope in scopes if scope]
+        if scopes:
+            transaction.on_commit(lambda: self._bump(scopes))
+
+    def invalidate_coalesced(self, interval, *scopes):
+        """
+        Like invalidate, but bumps each scope at most once per `interval`
+        seconds in this process: a bump due sooner is deferred to the end of
+        the interval, so dependent entries are never more than `interval`
+        seconds stale and are rebuilt at most once per interval.
+        """
+        scopes = [scope for scope in scopes if scope]
+        if scopes:
+            transaction.on_commit(lambda: self._bump_coalesced(scopes, interval))
+
+    def _bump_coalesced(self, scopes, interval):
+        now = time.monotonic()
+        due = []
+        with self._lock:
+            for scope in scopes:
+                if scope in self._scheduled:
+                    continue
+                wait = self._bumped_at.get(scope, -interval) + interval - now
+                if wait <= 0:
+                    self._bumped_at[scope] = now
+                    due.append(scope)
+                else:
+                    self._scheduled.add(scope)
+                    timer = threading.Timer(wait, self._bump_deferred, [scope])
+                    timer.daemon = True
+                    timer.start()
+        if due:
+            self._bump(due)
+
+    def _bump_deferred(self, scope):
+        with self._lock:
+            self._scheduled.discard(scope)
+            self._bumped_at[scope] = time.monotonic()
+        try:
+            self._bump([scope])
+        except Exception:
+            logger.exception("Deferred bump of %r failed", scope)
+
+    def clear(self):
+        """
+        Drops every entry of the backend and resets the counters.
+        """
+        self.cache.clear()
+        with self._lock:
+            self._refused = False
+            self._bumped_at = {}
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Returns the hit/miss counters of this process.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+response_cache = ResponseCache()
+
+
+@registry.register
+def response_cache_metrics():
+    """
+    Prometheus family of the response cache lookups of this process.
+    """
+    stats = response_cache.stats()
+    return [
+        (
+            "response_cache_lookups_total",
+            "counter",
+            "Response cache lookups.",
+            [
+                ("response_cache_lookups_total", {"result": "hit"}, stats["hits"]),
+                ("response_cache_lookups_total", {"result": "miss"}, stats["misses"]),
+            ],
+        )
+    ]
+
+
+def invalidate_drivers(driver_ids):
+    """
+    Invalidates the detail of each driver and the driver list.
+    """
+    response_cache.invalidate(
+        "drivers", *(f"driver:{driver_id}" for driver_id in driver_ids)
+    )
+
+
+def invalidate_positions(driver_ids, address_ids=()):
+    """
+    Invalidates the details of drivers that moved, and of their addresses.
+    Pings arrive too often for the driver and address lists to be rebuilt
+    on every one, so those are bumped at most once per
+    RESPONSE_CACHE_LIST_INTERVAL_SECONDS seconds instead.
+    """
+    response_cache.invalidate(
+        *(f"driver:{driver_id}" for driver_id in driver_ids),
+        *(f"address:{address_id}" for address_id in address_ids),
+    )
+    response_cache.invalidate_coalesced(
+        getattr(settings, "RESPONSE_CACHE_LIST_INTERVAL_SECONDS", 1.0),
+        "drivers",
+        "addresses",
+    )
+
+
+def invalidate_addresses(address_ids):
+    """
+    Invalidates the detail of each address, the address list and the driver
+    list, which nests the addresses.
+    """
+    response_cache.invalidate(
+        "addresses", "drivers", *(f"address:{address_id}" for address_id in address_ids)
+    )
+
+
+class CachedResponseMixin:
+    """
+    Serves GET list/retrieve responses of a generic view from the response
+    cache. `cache_list_scope` is the scope of the list and
+    `cache_object_scope` the prefix of the per-object scopes.
+    """
+
+    cache_list_scope = None
+    cache_object_scope = None
+
+    def get_cache_scopes(self, pk=None):
+        if pk is None:
+            return [self.cache_list_scope]
+        return [f"{self.cache_object_scope}:{pk}"]
+
+    def cached_response(self, request, get_scopes, handler):
+        """
+        Returns the cached representation for the request URL or builds it
+        with `handler`. `get_scopes` is only called on a miss.
+        """
+        if not response_cache.enabled():
+            return handler()
+        key = hashlib.sha1(request.build_absolute_uri().encode()).hexdigest()
+        data = response_cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        versions = response_cache.versions(get_scopes())
+        response = handler()
+        if response.status_code == status.HTTP_200_OK:
+            response_cache.set(key, versions, response.data)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request,
+            self.get_cache_scopes,
+            lambda: super(CachedResponseMixin, self).list(request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        return self.cached_response(
+            request,
+            lambda: self.get_cache_scopes(pk),
+            lambda: super(CachedResponseMixin, self).retrieve(request, *args, **kwargs),
+        )
+
+
+class ResponseCacheStatsView(APIView):
+    """
+    Hit ratio of the response cache in the worker serving the request.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({"backend": response_cache.backend, **response_cache.stats()})
@@ -48,6 +48,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'delivery_system.metrics.timing_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -94,7 +95,11 @@ DATABASES = {
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'delivery_system.metrics.TimedJWTAuthentication',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'delivery_system.metrics.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -151,3 +156,181 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Dispatch
+# In-memory grid of available drivers used to prefilter candidates in
+# services.helpers.find_nearest_driver (cell size in degrees, ~1.1 km).
+# When disabled, candidates come from the indexed Address.geohash column,
+# widening ring by ring around the pickup cell up to DRIVER_GEOHASH_MAX_RINGS.
+
+DRIVER_SPATIAL_INDEX = os.getenv('DRIVER_SPATIAL_INDEX', 'True') == 'True'
+
+DRIVER_GEOHASH_MAX_RINGS = int(os.getenv('DRIVER_GEOHASH_MAX_RINGS', 10))
+
+DRIVER_INDEX_CELL_DEGREES = float(os.getenv('DRIVER_INDEX_CELL_DEGREES', 0.01))
+
+DRIVER_INDEX_REFRESH_SECONDS = int(os.getenv('DRIVER_INDEX_REFRESH_SECONDS', 60))
+
+# Cache of OpenRouteService route summaries. Coordinates are snapped to
+# ROUTE_CACHE_PRECISION decimals (4 is ~11 m). Set ROUTE_CACHE_BACKEND to a
+# CACHES alias to share entries between workers.
+
+ROUTE_CACHE_PRECISION = int(os.getenv('ROUTE_CACHE_PRECISION', 4))
+
+ROUTE_CACHE_MAX_ENTRIES = int(os.getenv('ROUTE_CACHE_MAX_ENTRIES', 4096))
+
+ROUTE_CACHE_TTL = int(os.getenv('ROUTE_CACHE_TTL', 300))
+
+ROUTE_CACHE_BACKEND = os.getenv('ROUTE_CACHE_BACKEND')
+
+# When enabled, POST /services/ stores the request as pending and returns 202;
+# drivers are then assigned by `manage.py process_service_requests`.
+
+SERVICE_ASSIGNMENT_ASYNC = os.getenv('SERVICE_ASSIGNMENT_ASYNC', 'False') == 'True'
+
+# Batched dispatch (`manage.py dispatch_services`): pending requests collected
+# over DISPATCH_WINDOW_SECONDS are matched to drivers all at once.
+
+DISPATCH_WINDOW_SECONDS = float(os.getenv('DISPATCH_WINDOW_SECONDS', 2.0))
+
+DISPATCH_MAX_BATCH = int(os.getenv('DISPATCH_MAX_BATCH', 100))
+
+DISPATCH_CANDIDATES_PER_REQUEST = int(os.getenv('DISPATCH_CANDIDATES_PER_REQUEST', 5))
+
+DISPATCH_PARALLEL_THRESHOLD = int(os.getenv('DISPATCH_PARALLEL_THRESHOLD', 200))
+
+DISPATCH_ROUTE_GROUP_SIZE = int(os.getenv('DISPATCH_ROUTE_GROUP_SIZE', 8))
+
+ORS_MATRIX_MAX_ELEMENTS = int(os.getenv('ORS_MATRIX_MAX_ELEMENTS', 3500))
+
+# OpenRouteService calls: per-request timeout, routing budget of one driver
+# assignment, hedging of slow requests (0 disables) and a circuit breaker
+# that falls back to straight-line ranking after consecutive failures.
+
+ORS_TIMEOUT_SECONDS = float(os.getenv('ORS_TIMEOUT_SECONDS', 5))
+
+ORS_ASSIGNMENT_DEADLINE_SECONDS = float(os.getenv('ORS_ASSIGNMENT_DEADLINE_SECONDS', 3))
+
+ORS_HEDGE_AFTER_SECONDS = float(os.getenv('ORS_HEDGE_AFTER_SECONDS', 0.5))
+
+ORS_BREAKER_THRESHOLD = int(os.getenv('ORS_BREAKER_THRESHOLD', 5))
+
+ORS_BREAKER_COOLDOWN_SECONDS = float(os.getenv('ORS_BREAKER_COOLDOWN_SECONDS', 30))
+
+ORS_MAX_WORKERS = int(os.getenv('ORS_MAX_WORKERS', 16))
+
+# Calls allowed to wait for one of the ORS_MAX_WORKERS threads before new ones
+# are refused, and keep-alive HTTP connections kept open to ORS per process.
+
+ORS_MAX_QUEUE = int(os.getenv('ORS_MAX_QUEUE', 64))
+
+ORS_HTTP_POOL_SIZE = int(os.getenv('ORS_HTTP_POOL_SIZE', 16))
+
+# Drivers routed per assignment: those within CANDIDATES_SPREAD times the
+# closest one's straight-line distance, between CANDIDATES_MIN and
+# CANDIDATES_MAX. A CANDIDATES_AUDIT_RATE share of assignments also routes the
+# rest, to measure how often a faster driver was left out.
+
+CANDIDATES_MIN = int(os.getenv('CANDIDATES_MIN', 3))
+
+CANDIDATES_MAX = int(os.getenv('CANDIDATES_MAX', 15))
+
+CANDIDATES_SPREAD = float(os.getenv('CANDIDATES_SPREAD', 2.0))
+
+CANDIDATES_AUDIT_RATE = float(os.getenv('CANDIDATES_AUDIT_RATE', 0.02))
+
+# Candidates that cannot beat a route already known are not routed: their
+# straight-line distance at ROUTING_MAX_SPEED_KMH (an upper bound of the
+# profile's speed) already takes longer. Directions requests go out closest
+# first, ROUTE_PRUNING_BATCH at a time.
+
+ROUTE_PRUNING = os.getenv('ROUTE_PRUNING', 'True') == 'True'
+
+ROUTE_PRUNING_BATCH = int(os.getenv('ROUTE_PRUNING_BATCH', 5))
+
+ROUTING_MAX_SPEED_KMH = float(os.getenv('ROUTING_MAX_SPEED_KMH', 30))
+
+# Routing backend: 'ors' (OpenRouteService API) or 'graph', an in-process
+# road graph built from an OSM extract with `manage.py build_road_graph`.
+
+ROUTING_BACKEND = os.getenv('ROUTING_BACKEND', 'ors')
+
+ROAD_GRAPH_PATH = os.getenv('ROAD_GRAPH_PATH', str(BASE_DIR / 'road_graph.npz'))
+
+# Precomputed cell-to-cell travel times (`manage.py build_travel_grid`). When
+# set, candidates are scored from the memory-mapped grid and ORS only refines
+# the best TRAVEL_GRID_REFINE_TOP of them.
+
+TRAVEL_GRID_PATH = os.getenv('TRAVEL_GRID_PATH')
+
+TRAVEL_GRID_REFINE_TOP = int(os.getenv('TRAVEL_GRID_REFINE_TOP', 0))
+
+# Bulk driver location uploads (POST /drivers/locations/) are applied in
+# chunks of this many records.
+
+LOCATION_INGEST_CHUNK_SIZE = int(os.getenv('LOCATION_INGEST_CHUNK_SIZE', 1000))
+
+# Cached representations of the driver and address read endpoints,
+# invalidated by version bumps on writes. The versions have to be shared by
+# every process that writes (web workers and the dispatch commands), so the
+# cache is only enabled by default on a shared backend: Redis at
+# RESPONSE_CACHE_URL (the docker-compose default) or, on a single host, the
+# files of RESPONSE_CACHE_DIR. The per-process locmem fallback is refused
+# when WEB_CONCURRENCY runs several workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+if os.getenv('RESPONSE_CACHE_URL'):
+    CACHES['responses'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('RESPONSE_CACHE_URL'),
+    }
+elif os.getenv('RESPONSE_CACHE_DIR'):
+    CACHES['responses'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('RESPONSE_CACHE_DIR'),
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    }
+
+RESPONSE_CACHE_BACKEND = 'responses' if 'responses' in CACHES else 'default'
+
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', str('responses' in CACHES)) == 'True'
+
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', 1))
+
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 60))
+
+# Location pings invalidate the driver and address lists at most once per
+# this many seconds, which bounds how stale the positions they show can be.
+RESPONSE_CACHE_LIST_INTERVAL_SECONDS = float(os.getenv('RESPONSE_CACHE_LIST_INTERVAL_SECONDS', 1.0))
+
+# Local ETA model (`manage.py train_eta_model`). With ETA_MODEL_RANKING the
+# candidates are ranked locally and ORS only refines the best ETA_REFINE_TOP.
+
+ETA_MODEL_RANKING = os.getenv('ETA_MODEL_RANKING', 'False') == 'True'
+
+ETA_REFINE_TOP = int(os.getenv('ETA_REFINE_TOP', 2))
+
+ETA_ZONE_PRECISION = int(os.getenv('ETA_ZONE_PRECISION', 5))
+
+ETA_SLOT_HOURS = int(os.getenv('ETA_SLOT_HOURS', 3))
+
+ETA_TRAINING_DAYS = int(os.getenv('ETA_TRAINING_DAYS', 30))
+
+ETA_MIN_SAMPLES = int(os.getenv('ETA_MIN_SAMPLES', 20))
+
+ETA_MODEL_REFRESH_SECONDS = int(os.getenv('ETA_MODEL_REFRESH_SECONDS', 300))
+
+# Per-request timings (delivery_system.metrics.timing_middleware): a
+# Server-Timing header with the phases of each response, and Prometheus
+# histograms at /metrics/, readable by admin users or with METRICS_TOKEN
+# as a bearer token.
+
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'True') == 'True'
+
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
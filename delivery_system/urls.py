@@ -18,6 +18,8 @@ from django.contrib import admin
 from django.urls import path
 from django.urls import include
 from rest_framework_simplejwt import views as jwt_views
+from delivery_system.metrics import MetricsView
+from delivery_system.response_cache import ResponseCacheStatsView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -29,4 +31,7 @@ urlpatterns = [
     path('api/token/', jwt_views.TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', jwt_views.TokenRefreshView.as_view(), name='token_refresh'),
 
+    path('cache/stats/', ResponseCacheStatsView.as_view(), name='response-cache-stats'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+
 ]
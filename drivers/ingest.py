@@ -0,0 +1,296 @@
+import json
+import math
+import struct
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count
+
+from addresses import geohash
+from addresses.models import Address
+from delivery_system.response_cache import invalidate_addresses, invalidate_positions
+from services.models import ServiceRequest
+from .location import move_driver_address
+from .models import Driver
+from .spatial_index import driver_index
+
+# driver_id (int64), latitude, longitude, unix timestamp (float64), little endian
+BINARY_RECORD = struct.Struct("<qddd")
+
+# Timestamps outside [1970, 2100) are rejected as invalid
+MAX_TIMESTAMP = datetime(2100, 1, 1, tzinfo=timezone.utc).timestamp()
+
+
+def parse_ndjson(stream):
+    """
+    Yields (driver_id, latitude, longitude, ts) records from a stream of
+    newline-delimited JSON objects with driver_id, lat, lon and ts (unix
+    seconds) keys. Malformed lines yield None.
+    """
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+            yield (
+                int(record["driver_id"]),
+                float(record["lat"]),
+                float(record["lon"]),
+                float(record["ts"]),
+            )
+        except (ValueError, KeyError, TypeError):
+            yield None
+
+
+def parse_binary(stream, chunk_records=1024):
+    """
+    Yields records from a stream of packed BINARY_RECORD structs. A trailing
+    partial record yields None.
+    """
+    size = BINARY_RECORD.size
+    buffer = b""
+    while True:
+        data = stream.read(size * chunk_records)
+        if not data:
+            break
+        buffer += data
+        whole = len(buffer) - len(buffer) % size
+        yield from BINARY_RECORD.iter_unpack(buffer[:whole])
+        buffer = buffer[whole:]
+    if buffer:
+        yield None
+
+
+def _valid(record):
+    driver_id, latitude, longitude, ts = record
+    return (
+        driver_id > 0
+        and -90 <= latitude <= 90
+        and -180 <= longitude <= 180
+        and math.isfinite(ts)
+        and 0 <= ts < MAX_TIMESTAMP
+    )
+
+
+def _update_from_values(
+    table, assignments, columns, rows, condition="", returning=None
+):
+    values = ", ".join(["(" + ", ".join(["%s"] * len(columns)) + ")"] * len(rows))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {table} AS t SET {assignments} "
+            f"FROM (VALUES {values}) AS v({', '.join(columns)}) "
+            f"WHERE t.id = v.id {condition}"
+            + (f" RETURNING {returning}" if returning else ""),
+            [value for row in rows for value in row],
+        )
+        return cursor.fetchall() if returning else None
+
+
+def _stamp_newer(moves):
+    """
+    Sets location_updated_at of the drivers whose stored position is older
+    than their move, and returns the {driver_id: current_address_id} of
+    those. Runs before any address is touched, inside the batch transaction,
+    so the stamped drivers stay locked until their addresses are moved and
+    a concurrent chunk can neither apply older records nor interleave.
+    """
+    if connection.vendor == "postgresql":
+        rows = _update_from_values(
+            Driver._meta.db_table,
+            "location_updated_at = v.ts",
+            ["id", "ts"],
+            [(driver_id, ts) for driver_id, _, _, _, ts in moves],
+            "AND (t.location_updated_at IS NULL OR t.location_updated_at < v.ts)",
+            returning="t.id, t.current_address_id",
+        )
+        return dict(rows)
+
+    # Elsewhere the state read before the transaction is repeated under lock
+    timestamps = {driver_id: ts for driver_id, _, _, _, ts in moves}
+    stamped = {
+        driver_id: address_id
+        for driver_id, address_id, updated_at in Driver.objects.select_for_update()
+        .filter(id__in=timestamps)
+        .values_list("id", "current_address_id", "location_updated_at")
+        if updated_at is None or updated_at < timestamps[driver_id]
+    }
+    Driver.objects.bulk_update(
+        [
+            Driver(id=driver_id, location_updated_at=timestamps[driver_id])
+            for driver_id in stamped
+        ],
+        ["location_updated_at"],
+    )
+    return stamped
+
+
+def apply_location_batch(records):
+    """
+    Applies one chunk of (driver_id, latitude, longitude, ts) records.
+
+    Only the newest record per driver is kept; older ones are counted as
+    superseded if they came first, out of order otherwise. Records not
+    newer than the driver's location_updated_at are discarded as out of
+    order: first from an unlocked read, then for good by the conditional
+    UPDATE that stamps the drivers (_stamp_newer) before any address
+    moves. Drivers with their own address row are moved with one set-based
+    UPDATE per table (UPDATE ... FROM (VALUES ...) on PostgreSQL,
+    bulk_update elsewhere); drivers sharing their address go through
+    move_driver_address, which gives them their own row.
+    Returns a dict of counts.
+    """
+    counts = {
+        "received": len(records),
+        "applied": 0,
+        "out_of_order": 0,
+        "superseded": 0,
+        "unknown": 0,
+    }
+
+    latest = {}
+    for driver_id, latitude, longitude, ts in records:
+        if driver_id in latest:
+            if latest[driver_id][2] >= ts:
+                counts["out_of_order"] += 1
+                continue
+            counts["superseded"] += 1
+        latest[driver_id] = (latitude, longitude, ts)
+
+    state = {
+        driver_id: (address_id, updated_at)
+        for driver_id, address_id, updated_at in Driver.objects.filter(
+            id__in=latest
+        ).values_list("id", "current_address_id", "location_updated_at")
+    }
+
+    moves = []
+    for driver_id, (latitude, longitude, ts) in latest.items():
+        if driver_id not in state:
+            counts["unknown"] += 1
+            continue
+        address_id, updated_at = state[driver_id]
+        timestamp = datetime.fromtimestamp(ts, tz=timezone.utc)
+        if updated_at is not None and updated_at >= timestamp:
+            counts["out_of_order"] += 1
+            continue
+        moves.append((driver_id, address_id, latitude, longitude, timestamp))
+
+    if not moves:
+        return counts
+
+    address_ids = [move[1] for move in moves]
+    shared = set(
+        Driver.objects.filter(current_address_id__in=address_ids)
+        .values("current_address_id")
+        .annotate(drivers=Count("id"))
+        .filter(drivers__gt=1)
+        .values_list("current_address_id", flat=True)
+    )
+    shared.update(
+        ServiceRequest.objects.filter(pickup_address_id__in=address_ids).values_list(
+            "pickup_address_id", flat=True
+        )
+    )
+
+    with transaction.atomic():
+        stamped = _stamp_newer(moves)
+        applied = [move for move in moves if move[0] in stamped]
+        # Drivers given a new address row since the state was read are
+        # moved one by one, like the ones sharing their address
+        exclusive = [
+            move
+            for move in applied
+            if move[1] not in shared and stamped[move[0]] == move[1]
+        ]
+        if exclusive and connection.vendor == "postgresql":
+            _update_from_values(
+                Address._meta.db_table,
+                "latitude = v.latitude, longitude = v.longitude, geohash = v.geohash",
+                ["id", "latitude", "longitude", "geohash"],
+                [
+                    (
+                        address_id,
+                        latitude,
+                        longitude,
+                        geohash.encode(latitude, longitude),
+                    )
+                    for _, address_id, latitude, longitude, _ in exclusive
+                ],
+            )
+        elif exclusive:
+            Address.objects.bulk_update(
+                [
+                    Address(
+                        id=address_id,
+                        latitude=latitude,
+                        longitude=longitude,
+                        geohash=geohash.encode(latitude, longitude),
+                    )
+                    for _, address_id, latitude, longitude, _ in exclusive
+                ],
+                ["latitude", "longitude", "geohash"],
+            )
+
+        moved = {move[0] for move in exclusive}
+        new_rows = [
+            move_driver_address(driver_id, latitude, longitude)
+            for driver_id, _, latitude, longitude, _ in applied
+            if driver_id not in moved
+        ]
+
+        invalidate_positions(
+            [move[0] for move in applied], [move[1] for move in exclusive]
+        )
+        if any(new_rows):
+            invalidate_addresses([])
+
+    # update() bypasses post_save, so the spatial index is told directly
+    for driver_id, _, latitude, longitude, _ in applied:
+        driver_index.move(driver_id, latitude, longitude)
+
+    counts["out_of_order"] += len(moves) - len(applied)
+    counts["applied"] = len(applied)
+    return counts
+
+
+def ingest_locations(records, chunk_size=None):
+    """
+    Applies a stream of parsed records chunk by chunk, so the whole body is
+    never held in memory. Returns the totals and the counts of each chunk.
+    """
+    chunk_size = chunk_size or getattr(settings, "LOCATION_INGEST_CHUNK_SIZE", 1000)
+    totals = {
+        "received": 0,
+        "applied": 0,
+        "out_of_order": 0,
+        "superseded": 0,
+        "unknown": 0,
+        "invalid": 0,
+    }
+    batches = []
+
+    def flush(chunk, invalid):
+        batch = apply_location_batch(chunk)
+        batch["received"] += invalid
+        batch["invalid"] = invalid
+        batches.append(batch)
+        for key, value in batch.items():
+            totals[key] += value
+
+    chunk = []
+    invalid = 0
+    for record in records:
+        if record is None or not _valid(record):
+            invalid += 1
+        else:
+            chunk.append(record)
+        if len(chunk) + invalid >= chunk_size:
+            flush(chunk, invalid)
+            chunk, invalid = [], 0
+    if chunk or invalid:
+        flush(chunk, invalid)
+
+    return {**totals, "batches": batches}
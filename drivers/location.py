@@ -0,0 +1,83 @@
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from addresses import geohash
+from addresses.models import Address
+from delivery_system.response_cache import invalidate_addresses, invalidate_positions
+from services.models import ServiceRequest
+from .models import Driver
+from .spatial_index import driver_index
+
+
+def older_than(timestamp):
+    """
+    Filters drivers whose stored position is older than `timestamp`.
+    """
+    return Q(location_updated_at__isnull=True) | Q(location_updated_at__lt=timestamp)
+
+
+def update_driver_location(driver_id, latitude, longitude, timestamp=None):
+    """
+    Moves a driver to a new position by updating its current Address row in
+    place with a single UPDATE, instead of creating a new Address per ping.
+    Addresses shared with other drivers or used as a pickup address are
+    never moved; the driver gets its own address row on the first ping
+    instead.
+    The position is stamped as the driver's location_updated_at (`timestamp`,
+    now by default) and only applied when newer than the stored one, so
+    pings and bulk uploads (drivers.ingest) can interleave in any order and
+    the newest position still wins. Returns False if the driver does not
+    exist.
+    """
+    timestamp = timestamp or timezone.now()
+    with transaction.atomic(savepoint=False):
+        # Stamped first: the driver's row lock then orders concurrent moves
+        stamped = Driver.objects.filter(older_than(timestamp), id=driver_id).update(
+            location_updated_at=timestamp
+        )
+        if not stamped:
+            # A newer position is already stored, or there is no such driver
+            return Driver.objects.filter(id=driver_id).exists()
+        new_row = move_driver_address(driver_id, latitude, longitude)
+
+        # update() bypasses post_save, so the response cache and the spatial
+        # index are told directly. The address detail depends on its drivers,
+        # and only a new row changes the lists.
+        invalidate_positions([driver_id])
+        if new_row:
+            invalidate_addresses([])
+    driver_index.move(driver_id, latitude, longitude)
+    return True
+
+
+def move_driver_address(driver_id, latitude, longitude):
+    """
+    Moves the address row of a driver whose location_updated_at was just
+    stamped, or gives the driver its own row when the address is shared.
+    Returns True when a new row was created.
+    """
+    cell = geohash.encode(latitude, longitude)
+    shared_with_driver = Driver.objects.filter(current_address=OuterRef("pk")).exclude(
+        id=driver_id
+    )
+    used_as_pickup = ServiceRequest.objects.filter(pickup_address=OuterRef("pk"))
+    updated = (
+        Address.objects.filter(driver__id=driver_id)
+        .exclude(Exists(shared_with_driver))
+        .exclude(Exists(used_as_pickup))
+        .update(latitude=latitude, longitude=longitude, geohash=cell)
+    )
+    if updated:
+        return False
+
+    driver = Driver.objects.select_related("current_address").get(id=driver_id)
+    with transaction.atomic():
+        address = Address.objects.create(
+            street=driver.current_address.street,
+            city=driver.current_address.city,
+            latitude=latitude,
+            longitude=longitude,
+        )
+        Driver.objects.filter(id=driver_id).update(current_address=address)
+    return True
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drivers', '0002_remove_driver_name_driver_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='driver',
+            name='location_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
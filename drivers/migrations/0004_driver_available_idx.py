@@ -0,0 +1,21 @@
+# Generated by Django 4.2 on 2026-10-18 18:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drivers', '0003_driver_location_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='driver',
+            index=models.Index(
+                condition=models.Q(('is_available', True)),
+                fields=['current_address'],
+                name='driver_available_idx',
+            ),
+        ),
+    ]
@@ -6,6 +6,17 @@ class Driver(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='driver_profile')
     current_address = models.ForeignKey(Address, on_delete=models.CASCADE)
     is_available = models.BooleanField(default=True)
+    location_updated_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Only available drivers are ever searched for a pickup
+            models.Index(
+                fields=['current_address'],
+                condition=models.Q(is_available=True),
+                name='driver_available_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.user.username
@@ -0,0 +1,59 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from addresses.models import Address
+from delivery_system.response_cache import invalidate_addresses, invalidate_drivers
+from services.models import ServiceRequest
+from .models import Driver
+from .spatial_index import driver_index
+
+
+@receiver(post_save, sender=Driver)
+def index_driver(sender, instance, **kwargs):
+    if instance.is_available and instance.current_address_id:
+        address = instance.current_address
+        driver_index.upsert(instance.id, address.latitude, address.longitude)
+    else:
+        driver_index.remove(instance.id)
+
+
+@receiver(post_delete, sender=Driver)
+def unindex_driver(sender, instance, **kwargs):
+    driver_index.remove(instance.id)
+
+
+@receiver(post_save, sender=Address)
+def reindex_address_drivers(sender, instance, created, **kwargs):
+    # A brand-new address cannot be anyone's current address yet
+    if created:
+        return
+    driver_ids = Driver.objects.filter(
+        current_address=instance, is_available=True
+    ).values_list("id", flat=True)
+    for driver_id in driver_ids:
+        driver_index.upsert(driver_id, instance.latitude, instance.longitude)
+
+
+@receiver(post_save, sender=Driver)
+@receiver(post_delete, sender=Driver)
+def invalidate_driver_responses(sender, instance, **kwargs):
+    invalidate_drivers([instance.id])
+
+
+@receiver(post_save, sender=Address)
+@receiver(post_delete, sender=Address)
+def invalidate_address_responses(sender, instance, **kwargs):
+    invalidate_addresses([instance.id])
+    if not kwargs.get("created"):
+        # Drivers nest their current address
+        invalidate_drivers(
+            Driver.objects.filter(current_address=instance).values_list("id", flat=True)
+        )
+
+
+@receiver(post_save, sender=ServiceRequest)
+@receiver(post_delete, sender=ServiceRequest)
+def invalidate_service_driver_responses(sender, instance, **kwargs):
+    # Assigning or closing a service changes the driver's availability
+    if instance.assigned_driver_id:
+        invalidate_drivers([instance.assigned_driver_id])
@@ -0,0 +1,202 @@
+import threading
+import time
+from math import cos, floor, pi, radians
+
+import numpy as np
+
+from django.conf import settings
+
+
+class DriverSpatialIndex:
+    """
+    Process-local uniform grid over the coordinates of available drivers.
+
+    Drivers are bucketed into square lat/lon cells so a nearest-k lookup only
+    visits the rings of cells around the pickup point instead of every
+    available driver. The index is kept up to date by the signals in
+    drivers.signals and is fully rebuilt from the database when it is first
+    used and every DRIVER_INDEX_REFRESH_SECONDS, which reconciles changes made
+    by other worker processes.
+    """
+
+    def __init__(self, cell_degrees=None, refresh_seconds=None):
+        self.cell_degrees = cell_degrees or getattr(
+            settings, "DRIVER_INDEX_CELL_DEGREES", 0.01
+        )
+        self.refresh_seconds = refresh_seconds or getattr(
+            settings, "DRIVER_INDEX_REFRESH_SECONDS", 60
+        )
+        self._lock = threading.RLock()
+        self._cells = {}
+        self._positions = {}
+        self._bounds = None
+        self._loaded_at = None
+
+    def __len__(self):
+        return len(self._positions)
+
+    def _cell(self, latitude, longitude):
+        return (
+            floor(latitude / self.cell_degrees),
+            floor(longitude / self.cell_degrees),
+        )
+
+    def clear(self):
+        """
+        Empties the index and forces a rebuild on the next lookup.
+        """
+        with self._lock:
+            self._cells = {}
+            self._positions = {}
+            self._bounds = None
+            self._loaded_at = None
+
+    def rebuild(self):
+        """
+        Reloads every available driver with an address from the database.
+        """
+        from drivers.models import Driver
+
+        rows = Driver.objects.filter(
+            is_available=True, current_address__isnull=False
+        ).values_list("id", "current_address__latitude", "current_address__longitude")
+
+        with self._lock:
+            self._cells = {}
+            self._positions = {}
+            self._bounds = None
+            for driver_id, latitude, longitude in rows:
+                self._insert(driver_id, latitude, longitude)
+            self._loaded_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        if (
+            self._loaded_at is None
+            or time.monotonic() - self._loaded_at > self.refresh_seconds
+        ):
+            self.rebuild()
+
+    def _insert(self, driver_id, latitude, longitude):
+        cell = self._cell(latitude, longitude)
+        self._positions[driver_id] = (latitude, longitude, cell)
+        self._cells.setdefault(cell, set()).add(driver_id)
+        # Bounding box of occupied cells; only grows until the next rebuild.
+        if self._bounds is None:
+            self._bounds = (cell[0], cell[0], cell[1], cell[1])
+        else:
+            min_row, max_row, min_col, max_col = self._bounds
+            self._bounds = (
+                min(min_row, cell[0]),
+                max(max_row, cell[0]),
+                min(min_col, cell[1]),
+                max(max_col, cell[1]),
+            )
+
+    def upsert(self, driver_id, latitude, longitude):
+        """
+        Adds a driver to the index or moves it to its new position.
+        """
+        with self._lock:
+            self._discard(driver_id)
+            self._insert(driver_id, latitude, longitude)
+
+    def move(self, driver_id, latitude, longitude):
+        """
+        Updates the position of a driver already in the index. Unavailable
+        drivers are not in the index and are left out.
+        """
+        with self._lock:
+            if driver_id in self._positions:
+                self._discard(driver_id)
+                self._insert(driver_id, latitude, longitude)
+
+    def remove(self, driver_id):
+        """
+        Removes a driver from the index, e.g. when it becomes unavailable.
+        """
+        with self._lock:
+            self._discard(driver_id)
+
+    def _discard(self, driver_id):
+        position = self._positions.pop(driver_id, None)
+        if position is None:
+            return
+        cell = position[2]
+        bucket = self._cells.get(cell)
+        if bucket is not None:
+            bucket.discard(driver_id)
+            if not bucket:
+                del self._cells[cell]
+
+    def _ring(self, center, radius):
+        row, col = center
+        if radius == 0:
+            yield center
+            return
+        for dcol in range(-radius, radius + 1):
+            yield (row - radius, col + dcol)
+            yield (row + radius, col + dcol)
+        for drow in range(-radius + 1, radius):
+            yield (row + drow, col - radius)
+            yield (row + drow, col + radius)
+
+    def nearest(self, latitude, longitude, k):
+        """
+        Returns up to k (driver_id, distance_km) tuples ordered by Haversine
+        distance from the given point.
+
+        Rings of cells are visited outwards from the point's cell until k
+        drivers have been found and no unvisited cell can hold a closer one.
+        """
+        from services.helpers import EARTH_RADIUS_KM, haversine_many, top_k_indices
+
+        with self._lock:
+            self._ensure_fresh()
+            if not self._positions:
+                return []
+
+            center = self._cell(latitude, longitude)
+            min_row, max_row, min_col, max_col = self._bounds
+            max_radius = max(
+                abs(center[0] - min_row),
+                abs(center[0] - max_row),
+                abs(center[1] - min_col),
+                abs(center[1] - max_col),
+            )
+            km_per_degree = EARTH_RADIUS_KM * pi / 180
+
+            ids, lats, lons = [], [], []
+            visited_cells = 0
+            for radius in range(max_radius + 1):
+                if visited_cells > len(self._cells):
+                    # Sparse index: scanning every driver is cheaper than
+                    # walking more (mostly empty) rings.
+                    ids = list(self._positions)
+                    lats = [self._positions[driver_id][0] for driver_id in ids]
+                    lons = [self._positions[driver_id][1] for driver_id in ids]
+                    break
+
+                for cell in self._ring(center, radius):
+                    visited_cells += 1
+                    for driver_id in self._cells.get(cell, ()):
+                        driver_lat, driver_lon, _ = self._positions[driver_id]
+                        ids.append(driver_id)
+                        lats.append(driver_lat)
+                        lons.append(driver_lon)
+
+                if len(ids) >= k:
+                    # Anything outside the visited rings is at least `radius`
+                    # cells away; longitude cells are the narrower ones.
+                    widest_lat = min(abs(latitude) + radius * self.cell_degrees, 89)
+                    cell_km = (
+                        self.cell_degrees * km_per_degree * cos(radians(widest_lat))
+                    )
+                    distances = haversine_many(latitude, longitude, lats, lons)
+                    if np.partition(distances, k - 1)[k - 1] <= radius * cell_km:
+                        break
+
+            distances = haversine_many(latitude, longitude, lats, lons)
+            return [(ids[i], float(distances[i])) for i in top_k_indices(distances, k)]
+
+
+driver_index = DriverSpatialIndex()
@@ -1,7 +1,23 @@
-from django.test import TestCase
+import json
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
 from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework.test import APIClient
+from addresses import geohash
 from addresses.models import Address
+from delivery_system.response_cache import ResponseCache, response_cache
+from drivers import ingest
+from drivers.ingest import BINARY_RECORD, ingest_locations
+from drivers.location import update_driver_location
 from drivers.models import Driver
+from drivers.spatial_index import driver_index
+from services.service_request_management import claim_driver
+from services.helpers import haversine_distance
 
 
 class DriverModelTest(TestCase):
@@ -111,3 +127,522 @@ class DriverSerializerTest(TestCase):
 
         # Verify that the driver's availability matches the provided data
         self.assertEqual(driver.is_available, self.driver_data["is_available"])
+
+
+class DriverSpatialIndexTest(TestCase):
+    """Test the in-memory spatial index of available drivers."""
+
+    def setUp(self):
+        """Start every test from an empty index."""
+        driver_index.clear()
+
+    def create_driver(self, username, latitude, longitude, is_available=True):
+        address = Address.objects.create(
+            street="Calle 1", city="Bogotá", latitude=latitude, longitude=longitude
+        )
+        user = User.objects.create(username=username)
+        return Driver.objects.create(
+            user=user, current_address=address, is_available=is_available
+        )
+
+    def test_nearest_orders_by_distance(self):
+        """Test that the closest drivers are returned first."""
+        far = self.create_driver("far", 4.80, -74.15)
+        near = self.create_driver("near", 4.61, -74.08)
+        middle = self.create_driver("middle", 4.65, -74.10)
+
+        result = driver_index.nearest(4.60971, -74.08175, 2)
+
+        self.assertEqual([driver_id for driver_id, _ in result], [near.id, middle.id])
+        self.assertNotIn(far.id, [driver_id for driver_id, _ in result])
+
+    def test_nearest_matches_full_scan(self):
+        """Test that ring search returns the same drivers as a full scan."""
+        drivers = [
+            self.create_driver(f"driver{i}", 4.5 + i * 0.013, -74.2 + (i % 7) * 0.015)
+            for i in range(30)
+        ]
+        pickup = (4.7, -74.15)
+        expected = sorted(
+            drivers,
+            key=lambda d: haversine_distance(
+                *pickup, d.current_address.latitude, d.current_address.longitude
+            ),
+        )[:5]
+
+        result = driver_index.nearest(*pickup, 5)
+
+        self.assertEqual(
+            [driver_id for driver_id, _ in result], [d.id for d in expected]
+        )
+
+    def test_availability_and_moves_are_tracked(self):
+        """Test that signals keep the index in sync with driver changes."""
+        driver = self.create_driver("moving", 4.61, -74.08)
+        driver_index.nearest(4.61, -74.08, 1)
+
+        driver.current_address.latitude = 4.85
+        driver.current_address.save()
+        result = driver_index.nearest(4.85, -74.08, 1)
+        self.assertEqual(result[0][0], driver.id)
+        self.assertAlmostEqual(result[0][1], 0.0)
+
+        driver.is_available = False
+        driver.save()
+        self.assertEqual(driver_index.nearest(4.85, -74.08, 1), [])
+
+        driver.is_available = True
+        driver.save()
+        driver.delete()
+        self.assertEqual(driver_index.nearest(4.85, -74.08, 1), [])
+
+
+class DriverLocationViewTest(TestCase):
+    """Test the driver location ping endpoint."""
+
+    def setUp(self):
+        """Set up a driver with its own address and an authenticated client."""
+        driver_index.clear()
+        self.address = Address.objects.create(
+            street="Calle 123", city="Bogotá", latitude=4.60971, longitude=-74.08175
+        )
+        self.user = User.objects.create(username="pinger")
+        self.driver = Driver.objects.create(
+            user=self.user, current_address=self.address, is_available=True
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse("driver-location", kwargs={"pk": self.driver.pk})
+
+    def test_ping_updates_address_in_place(self):
+        """Test that a ping moves the driver with two UPDATEs and no new rows."""
+        driver_index.nearest(4.6, -74.08, 1)
+        addresses_before = Address.objects.count()
+
+        # One UPDATE stamps location_updated_at, the other moves the address
+        with self.assertNumQueries(2):
+            response = self.client.post(
+                self.url, {"latitude": 4.7, "longitude": -74.05}, format="json"
+            )
+
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(Address.objects.count(), addresses_before)
+        self.address.refresh_from_db()
+        self.assertEqual((self.address.latitude, self.address.longitude), (4.7, -74.05))
+        self.assertEqual(self.address.geohash, geohash.encode(4.7, -74.05))
+        self.assertEqual(driver_index.nearest(4.7, -74.05, 1), [(self.driver.id, 0.0)])
+
+    def test_shared_address_is_not_moved(self):
+        """Test that a driver sharing its address gets its own row instead."""
+        other_user = User.objects.create(username="neighbour")
+        other = Driver.objects.create(user=other_user, current_address=self.address)
+
+        response = self.client.post(
+            self.url, {"latitude": 4.7, "longitude": -74.05}, format="json"
+        )
+
+        self.assertEqual(response.status_code, 204)
+        self.driver.refresh_from_db()
+        other.refresh_from_db()
+        self.assertNotEqual(self.driver.current_address_id, self.address.id)
+        self.assertEqual(self.driver.current_address.latitude, 4.7)
+        self.assertEqual(other.current_address.latitude, 4.60971)
+
+    def test_ping_and_upload_keep_the_newest_position(self):
+        """Test that a ping is stamped, so older uploaded records lose to it."""
+        response = self.client.post(
+            self.url, {"latitude": 4.7, "longitude": -74.05}, format="json"
+        )
+        self.assertEqual(response.status_code, 204)
+        self.driver.refresh_from_db()
+        stamped = self.driver.location_updated_at
+        self.assertIsNotNone(stamped)
+
+        record = (self.driver.id, 4.9, -74.0, stamped.timestamp() - 1)
+        self.assertEqual(ingest_locations([record])["out_of_order"], 1)
+
+        # Nor does a ping stamped before the stored position move the driver
+        self.assertTrue(
+            update_driver_location(
+                self.driver.id, 4.8, -74.0, stamped - timedelta(seconds=1)
+            )
+        )
+        self.address.refresh_from_db()
+        self.assertEqual(self.address.latitude, 4.7)
+
+    def test_invalid_pings(self):
+        """Test validation errors and unknown drivers."""
+        response = self.client.post(self.url, {"latitude": "north"}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post(
+            self.url, {"latitude": 95, "longitude": -74.05}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post(
+            reverse("driver-location", kwargs={"pk": self.driver.pk + 100}),
+            {"latitude": 4.7, "longitude": -74.05},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class DriverLocationBatchViewTest(TestCase):
+    """Test the bulk driver location upload endpoint."""
+
+    def setUp(self):
+        """Set up a few drivers with their own addresses."""
+        driver_index.clear()
+        self.user = User.objects.create(username="fleet")
+        self.drivers = []
+        for i in range(3):
+            address = Address.objects.create(
+                street=f"Calle {i}", city="Bogotá", latitude=4.6, longitude=-74.08
+            )
+            user = User.objects.create(username=f"driver_{i}")
+            self.drivers.append(
+                Driver.objects.create(
+                    user=user, current_address=address, is_available=True
+                )
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse("driver-location-batch")
+
+    def post_ndjson(self, records):
+        body = "\n".join(json.dumps(record) for record in records)
+        return self.client.post(self.url, body, content_type="application/x-ndjson")
+
+    def test_ndjson_upload_moves_drivers(self):
+        """Test that every driver is moved and the newest record wins."""
+        driver_index.nearest(4.6, -74.08, 1)
+        first, second, third = self.drivers
+        response = self.post_ndjson(
+            [
+                {"driver_id": first.id, "lat": 4.7, "lon": -74.05, "ts": 100},
+                {"driver_id": second.id, "lat": 4.65, "lon": -74.1, "ts": 100},
+                {"driver_id": first.id, "lat": 4.8, "lon": -74.0, "ts": 50},
+                {"driver_id": third.id + 100, "lat": 4.65, "lon": -74.1, "ts": 100},
+                {"driver_id": third.id, "lat": 95, "lon": -74.1, "ts": 100},
+            ]
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["received"], 5)
+        self.assertEqual(response.data["applied"], 2)
+        self.assertEqual(response.data["out_of_order"], 1)
+        self.assertEqual(response.data["superseded"], 0)
+        self.assertEqual(response.data["unknown"], 1)
+        self.assertEqual(response.data["invalid"], 1)
+
+        first.refresh_from_db()
+        self.assertEqual(first.current_address.latitude, 4.7)
+        self.assertEqual(first.current_address.geohash, geohash.encode(4.7, -74.05))
+        self.assertEqual(first.location_updated_at.timestamp(), 100)
+        self.assertEqual(driver_index.nearest(4.7, -74.05, 1), [(first.id, 0.0)])
+
+    def test_bad_timestamps_are_invalid(self):
+        """Test that non-finite or out of range timestamps are rejected."""
+        driver = self.drivers[0]
+        response = self.post_ndjson(
+            [
+                {"driver_id": driver.id, "lat": 4.7, "lon": -74.05, "ts": 1e20},
+                {"driver_id": driver.id, "lat": 4.7, "lon": -74.05, "ts": -5},
+            ]
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["invalid"], 2)
+        self.assertEqual(response.data["applied"], 0)
+
+        body = b"".join(
+            BINARY_RECORD.pack(driver.id, 4.7, -74.05, ts)
+            for ts in (float("nan"), float("inf"), 100)
+        )
+        response = self.client.post(
+            self.url, body, content_type="application/octet-stream"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["invalid"], 2)
+        self.assertEqual(response.data["applied"], 1)
+        driver.refresh_from_db()
+        self.assertEqual(driver.location_updated_at.timestamp(), 100)
+
+    def test_superseded_records_are_not_out_of_order(self):
+        """Test that a record replaced by a later, newer one is superseded."""
+        driver = self.drivers[0]
+        response = self.post_ndjson(
+            [
+                {"driver_id": driver.id, "lat": 4.7, "lon": -74.05, "ts": 100},
+                {"driver_id": driver.id, "lat": 4.8, "lon": -74.05, "ts": 110},
+            ]
+        )
+
+        self.assertEqual(response.data["applied"], 1)
+        self.assertEqual(response.data["superseded"], 1)
+        self.assertEqual(response.data["out_of_order"], 0)
+        driver.refresh_from_db()
+        self.assertEqual(driver.current_address.latitude, 4.8)
+
+    def test_stale_records_are_ignored(self):
+        """Test that records older than the stored position are discarded."""
+        driver = self.drivers[0]
+        self.post_ndjson(
+            [{"driver_id": driver.id, "lat": 4.7, "lon": -74.05, "ts": 100}]
+        )
+        response = self.post_ndjson(
+            [{"driver_id": driver.id, "lat": 4.9, "lon": -74.05, "ts": 90}]
+        )
+
+        self.assertEqual(response.data["out_of_order"], 1)
+        driver.refresh_from_db()
+        self.assertEqual(driver.current_address.latitude, 4.7)
+
+    def test_concurrent_newer_record_wins(self):
+        """Test that a newer position stored after the state read is kept."""
+        driver = self.drivers[0]
+        stamp = ingest._stamp_newer
+
+        def newer_chunk_commits_first(moves):
+            update_driver_location(
+                driver.id, 4.8, -74.0, datetime.fromtimestamp(200, tz=dt_timezone.utc)
+            )
+            return stamp(moves)
+
+        with patch("drivers.ingest._stamp_newer", newer_chunk_commits_first):
+            counts = ingest.apply_location_batch([(driver.id, 4.7, -74.05, 100)])
+
+        self.assertEqual(counts["applied"], 0)
+        self.assertEqual(counts["out_of_order"], 1)
+        driver.refresh_from_db()
+        self.assertEqual(driver.current_address.latitude, 4.8)
+        self.assertEqual(driver.location_updated_at.timestamp(), 200)
+
+    def test_binary_upload_is_chunked(self):
+        """Test the packed binary format and chunked application."""
+        body = b"".join(
+            BINARY_RECORD.pack(driver.id, 4.61 + i / 100, -74.08, 200)
+            for i, driver in enumerate(self.drivers)
+        )
+
+        with self.settings(LOCATION_INGEST_CHUNK_SIZE=2):
+            response = self.client.post(
+                self.url, body + b"\x00", content_type="application/octet-stream"
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["applied"], 3)
+        self.assertEqual(response.data["invalid"], 1)
+        self.assertEqual(len(response.data["batches"]), 2)
+        self.assertEqual(
+            sorted(
+                Address.objects.filter(driver__in=self.drivers).values_list(
+                    "latitude", flat=True
+                )
+            ),
+            [4.61, 4.62, 4.63],
+        )
+
+    def test_shared_address_gets_own_row(self):
+        """Test that a driver sharing its address is given a new address."""
+        first, second, _ = self.drivers
+        second.current_address = first.current_address
+        second.save()
+
+        self.post_ndjson(
+            [{"driver_id": first.id, "lat": 4.7, "lon": -74.05, "ts": 100}]
+        )
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertNotEqual(first.current_address_id, second.current_address_id)
+        self.assertEqual(first.current_address.latitude, 4.7)
+        self.assertEqual(second.current_address.latitude, 4.6)
+        self.assertIsNotNone(first.location_updated_at)
+
+    def test_unsupported_content_type(self):
+        """Test that other media types are rejected."""
+        response = self.client.post(self.url, {"driver_id": 1}, format="json")
+        self.assertEqual(response.status_code, 415)
+
+
+class DriverListViewTest(TestCase):
+    """Test the paginated driver list."""
+
+    def setUp(self):
+        """Set up a handful of drivers."""
+        response_cache.clear()
+        self.user = User.objects.create(username="dispatcher")
+        for i in range(5):
+            address = Address.objects.create(
+                street=f"Calle {i}", city="Bogotá", latitude=4.6, longitude=-74.08
+            )
+            Driver.objects.create(
+                user=User.objects.create(username=f"listed_{i}"),
+                current_address=address,
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_list_is_paginated_with_constant_queries(self):
+        """Test that every page is served by a single query."""
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("driver-list-create") + "?page_size=3")
+
+        self.assertEqual(len(response.data["results"]), 3)
+        self.assertEqual(response.data["results"][0]["user"], "listed_0")
+        self.assertEqual(
+            response.data["results"][0]["current_address"]["street"], "Calle 0"
+        )
+
+        with self.assertNumQueries(1):
+            response = self.client.get(response.data["next"])
+
+        self.assertEqual(
+            [row["user"] for row in response.data["results"]], ["listed_3", "listed_4"]
+        )
+        self.assertIsNone(response.data["next"])
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=True)
+class DriverResponseCacheTest(TestCase):
+    """Test the cached driver and address read endpoints."""
+
+    def setUp(self):
+        """Set up a driver with its own address and an empty cache."""
+        driver_index.clear()
+        response_cache.clear()
+        self.address = Address.objects.create(
+            street="Calle 123", city="Bogotá", latitude=4.60971, longitude=-74.08175
+        )
+        self.user = User.objects.create(username="cached")
+        self.driver = Driver.objects.create(
+            user=self.user, current_address=self.address, is_available=True
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.detail_url = reverse(
+            "driver-retrieve-update-destroy", kwargs={"pk": self.driver.pk}
+        )
+        self.address_url = reverse(
+            "address-retrieve-update-destroy", kwargs={"pk": self.address.pk}
+        )
+
+    def test_repeated_reads_skip_the_database(self):
+        """Test that a second poll is served from the cache."""
+        self.client.get(self.detail_url)
+        self.client.get(reverse("driver-list-create"))
+
+        with self.assertNumQueries(0):
+            detail = self.client.get(self.detail_url)
+            listing = self.client.get(reverse("driver-list-create"))
+
+        self.assertEqual(detail.data["user"], "cached")
+        self.assertEqual(listing.data["results"][0]["id"], self.driver.id)
+        self.assertEqual(response_cache.stats()["hits"], 2)
+        self.assertEqual(response_cache.stats()["hit_ratio"], 0.5)
+
+    def test_writes_invalidate_dependent_entries(self):
+        """Test that driver, address and service writes are seen on the next read."""
+        self.client.get(self.detail_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.driver.is_available = False
+            self.driver.save()
+        self.assertFalse(self.client.get(self.detail_url).data["is_available"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.address.street = "Carrera 7"
+            self.address.save()
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response.data["current_address"]["street"], "Carrera 7")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.driver.is_available = True
+            self.driver.save()
+            claim_driver(self.driver)
+        self.assertFalse(self.client.get(self.detail_url).data["is_available"])
+
+    def test_location_ping_invalidates_address_detail(self):
+        """Test that a ping, which only knows the driver, refreshes its address."""
+        self.client.get(self.address_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("driver-location", kwargs={"pk": self.driver.pk}),
+                {"latitude": 4.7, "longitude": -74.05},
+                format="json",
+            )
+
+        self.assertEqual(self.client.get(self.address_url).data["latitude"], 4.7)
+
+    @override_settings(RESPONSE_CACHE_LIST_INTERVAL_SECONDS=0.2)
+    def test_location_pings_invalidate_the_lists_at_a_coalesced_rate(self):
+        """Test that pings bump the lists at most once per interval."""
+        list_url = reverse("driver-list-create")
+        location_url = reverse("driver-location", kwargs={"pk": self.driver.pk})
+
+        def ping(latitude):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(
+                    location_url,
+                    {"latitude": latitude, "longitude": -74.05},
+                    format="json",
+                )
+
+        def latitude_listed():
+            return self.client.get(list_url).data["results"][0]["current_address"][
+                "latitude"
+            ]
+
+        self.client.get(list_url)
+        ping(4.7)
+        self.assertEqual(latitude_listed(), 4.7)
+        detail = self.client.get(self.detail_url)
+        self.assertEqual(detail.data["current_address"]["latitude"], 4.7)
+
+        # Within the interval the list stays cached; its bump is deferred
+        ping(4.8)
+        with self.assertNumQueries(0):
+            self.assertEqual(latitude_listed(), 4.7)
+        self.assertEqual(
+            self.client.get(self.detail_url).data["current_address"]["latitude"], 4.8
+        )
+        time.sleep(0.3)
+        self.assertEqual(latitude_listed(), 4.8)
+
+    @override_settings(WEB_CONCURRENCY=2)
+    def test_per_process_backend_is_refused_with_several_workers(self):
+        """Test that a locmem cache is not used when other workers would miss bumps."""
+        with self.assertLogs("delivery_system.response_cache", "WARNING"):
+            self.client.get(self.detail_url)
+        with self.assertNumQueries(1):
+            self.client.get(self.detail_url)
+        self.assertEqual(response_cache.stats()["hits"], 0)
+
+    def test_entry_built_during_a_write_is_never_served(self):
+        """Test that versions read before a concurrent bump keep the entry stale."""
+        versions = response_cache.versions(["driver:1"])
+        response_cache._bump(["driver:1"])
+        response_cache.set("race", versions, {"stale": True})
+
+        self.assertIsNone(response_cache.get("race"))
+
+    def test_file_backend(self):
+        """Test versioning on a file-based cache shared between processes."""
+        with tempfile.TemporaryDirectory() as directory, self.settings(
+            CACHES={
+                "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+                "files": {
+                    "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                    "LOCATION": directory,
+                },
+            }
+        ):
+            cache = ResponseCache(backend="files")
+            cache.set("detail", cache.versions(["driver:1"]), {"id": 1})
+            self.assertEqual(cache.get("detail"), {"id": 1})
+
+            cache._bump(["driver:1"])
+            self.assertIsNone(cache.get("detail"))
@@ -1,7 +1,9 @@
 from django.urls import path
-from .views import DriverListCreateView, DriverRetrieveUpdateDestroyView
+from .views import DriverListCreateView, DriverRetrieveUpdateDestroyView, DriverLocationView, DriverLocationBatchView
 
 urlpatterns = [
     path('drivers/', DriverListCreateView.as_view(), name='driver-list-create'),
     path('drivers/<int:pk>/', DriverRetrieveUpdateDestroyView.as_view(), name='driver-retrieve-update-destroy'),
+    path('drivers/locations/', DriverLocationBatchView.as_view(), name='driver-location-batch'),
+    path('drivers/<int:pk>/location/', DriverLocationView.as_view(), name='driver-location'),
 ]
@@ -1,14 +1,30 @@
-from rest_framework import generics
+from rest_framework import generics, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from .models import Driver
+from .ingest import ingest_locations, parse_binary, parse_ndjson
+from .location import update_driver_location
 from .serializers import DriverSerializer
 from rest_framework.permissions import IsAuthenticated
+from delivery_system.pagination import KeysetPagination
+from delivery_system.response_cache import CachedResponseMixin
 
 
 # View to create and list drivers
-class DriverListCreateView(generics.ListCreateAPIView):
-    queryset = Driver.objects.all()
+class DriverListCreateView(CachedResponseMixin, generics.ListCreateAPIView):
+    queryset = Driver.objects.select_related("user", "current_address").only(
+        "id",
+        "is_available",
+        "user__username",
+        "current_address__street",
+        "current_address__city",
+        "current_address__latitude",
+        "current_address__longitude",
+    )
     serializer_class = DriverSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    cache_list_scope = "drivers"
 
     def perform_create(self, serializer):
         user = self.request.user
@@ -16,7 +32,62 @@ class DriverListCreateView(generics.ListCreateAPIView):
 
 
 # View to get, update, and delete a specific driver
-class DriverRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Driver.objects.all()
+class DriverRetrieveUpdateDestroyView(
+    CachedResponseMixin, generics.RetrieveUpdateDestroyAPIView
+):
+    queryset = Driver.objects.select_related("user", "current_address")
     serializer_class = DriverSerializer
     permission_classes = [IsAuthenticated]
+    cache_object_scope = "driver"
+
+
+# View for high-frequency position pings; skips the serializers on purpose
+class DriverLocationView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, pk):
+        try:
+            latitude = float(request.data["latitude"])
+            longitude = float(request.data["longitude"])
+        except (KeyError, TypeError, ValueError):
+            return Response(
+                {"error": "latitude and longitude must be numbers"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+            return Response(
+                {"error": "latitude or longitude out of range"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if not update_driver_location(pk, latitude, longitude):
+            return Response(
+                {"error": "Driver not found."}, status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+# View for bulk position uploads; the body is parsed and applied chunk by chunk
+class DriverLocationBatchView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        content_type = request.content_type.split(";")[0].strip()
+        stream = request.stream
+        if stream is None:
+            return Response(
+                {"error": "Request body is empty"}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if content_type == "application/x-ndjson":
+            records = parse_ndjson(iter(stream.readline, b""))
+        elif content_type == "application/octet-stream":
+            records = parse_binary(stream)
+        else:
+            return Response(
+                {"error": "Use application/x-ndjson or application/octet-stream"},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            )
+
+        return Response(ingest_locations(records), status=status.HTTP_200_OK)
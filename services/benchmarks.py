@@ -0,0 +1,310 @@
+import random
+import time
+from contextlib import ExitStack
+from unittest.mock import patch
+
+import numpy as np
+import openrouteservice
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from addresses import geohash
+from addresses.models import Address
+from drivers.models import Driver
+from drivers.spatial_index import driver_index
+from services.fake_ors import FakeORSServer
+from services.helpers import route_cache
+from services.ors_client import AsyncORSClient
+from services.models import ServiceRequest
+from users.models import UserProfile
+
+# Maximum number of SQL queries per request, JWT user lookup included. They do
+# not depend on the seeded volume or the page size; raising one needs a reason.
+QUERY_BUDGETS = {
+    "token": 1,
+    "services-list": 2,
+    "services-retrieve": 2,
+    "services-create": 8,
+    "services-create-async": 8,
+    "services-complete": 8,
+    "drivers-list": 2,
+    "drivers-retrieve": 2,
+    "addresses-list": 2,
+    "addresses-retrieve": 2,
+}
+
+# Same bounding box used by seed_data
+LAT_RANGE = (4.5, 4.9)
+LON_RANGE = (-74.2, -74.1)
+
+PASSWORD = "benchmark"
+
+
+def seed_volume(services=2000, drivers=500, clients=50, busy_ratio=0.7, seed=0):
+    """
+    Bulk-creates a realistic data set: clients, drivers with their own
+    addresses, up to `busy_ratio` of them busy on an in-progress service, and
+    a service history spread over every status. Returns the users the
+    scenarios authenticate as.
+    """
+    rng = random.Random(seed)
+    password = make_password(PASSWORD)
+
+    def coordinate():
+        return rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)
+
+    # bulk_create skips post_save, so profiles are created explicitly below
+    users = User.objects.bulk_create(
+        [User(username=f"bench_client_{i}", password=password) for i in range(clients)]
+        + [
+            User(username=f"bench_driver_{i}", password=password)
+            for i in range(drivers)
+        ]
+    )
+    client_users, driver_users = users[:clients], users[clients:]
+    UserProfile.objects.bulk_create(
+        [UserProfile(user=user, is_driver=False) for user in client_users]
+        + [UserProfile(user=user, is_driver=True) for user in driver_users]
+    )
+
+    # bulk_create skips Address.save, so the geohash is set here
+    addresses = Address.objects.bulk_create(
+        [
+            Address(
+                street=f"Calle {i}",
+                city="Bogotá",
+                latitude=lat,
+                longitude=lon,
+                geohash=geohash.encode(lat, lon),
+            )
+            for i, (lat, lon) in enumerate(
+                coordinate() for _ in range(drivers + services)
+            )
+        ]
+    )
+    # Drivers on an in-progress service are busy, as in production
+    statuses = [
+        rng.choice(
+            [
+                ServiceRequest.Status.COMPLETED,
+                ServiceRequest.Status.COMPLETED,
+                ServiceRequest.Status.CANCELLED,
+                ServiceRequest.Status.IN_PROGRESS,
+            ]
+        )
+        for _ in range(services)
+    ]
+    busy = rng.sample(
+        range(drivers),
+        min(
+            int(drivers * busy_ratio), statuses.count(ServiceRequest.Status.IN_PROGRESS)
+        ),
+    )
+    driver_rows = Driver.objects.bulk_create(
+        [
+            Driver(user=user, current_address=address, is_available=True)
+            for user, address in zip(driver_users, addresses[:drivers])
+        ]
+    )
+    for row in busy:
+        driver_rows[row].is_available = False
+    Driver.objects.bulk_update([driver_rows[row] for row in busy], ["is_available"])
+
+    busy_drivers = iter(driver_rows[row] for row in busy)
+    service_rows = []
+    for address, status in zip(addresses[drivers:], statuses):
+        driver = rng.choice(driver_rows)
+        if status == ServiceRequest.Status.IN_PROGRESS:
+            driver = next(busy_drivers, None)
+            if driver is None:
+                status = ServiceRequest.Status.COMPLETED
+                driver = rng.choice(driver_rows)
+        service_rows.append(
+            ServiceRequest(
+                client=rng.choice(client_users),
+                pickup_address=address,
+                assigned_driver=driver,
+                estimated_time_minutes=rng.randint(1, 60),
+                status=status,
+            )
+        )
+    ServiceRequest.objects.bulk_create(service_rows)
+    return {"client": client_users[0], "driver": driver_users[0]}
+
+
+def _percentile(timings, q):
+    return round(float(np.percentile(timings, q)), 3) if timings else None
+
+
+class EndpointBenchmark:
+    """
+    Calls every endpoint `iterations` times through the full Django stack
+    and records the status code, the maximum number of queries and the
+    p50/p95 wall-clock latency of each one. ORS is replaced by a local
+    FakeORSServer answering after a fixed `ors_latency` (seconds), so
+    latencies are comparable between runs and commits.
+    """
+
+    def __init__(self, users, iterations=20, ors_latency=0.05, seed=0):
+        self.users = users
+        self.iterations = iterations
+        self.ors_latency = ors_latency
+        self.rng = random.Random(seed)
+        self.api = APIClient()
+
+    def authenticate(self, user):
+        response = self.api.post(
+            reverse("token_obtain_pair"),
+            {"username": user.username, "password": PASSWORD},
+            format="json",
+        )
+        self.api.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+
+    def scenarios(self):
+        """
+        Returns (name, user, request) tuples; `request` performs one call.
+        """
+        service_id = ServiceRequest.objects.values_list("id", flat=True).first()
+        driver_id = Driver.objects.values_list("id", flat=True).first()
+        address_id = Address.objects.values_list("id", flat=True).first()
+        client, driver = self.users["client"], self.users["driver"]
+
+        def token():
+            api = APIClient()
+            return api.post(
+                reverse("token_obtain_pair"),
+                {"username": client.username, "password": PASSWORD},
+                format="json",
+            )
+
+        def create(name="service-list-create"):
+            latitude, longitude = (
+                self.rng.uniform(*LAT_RANGE),
+                self.rng.uniform(*LON_RANGE),
+            )
+            return self.api.post(
+                reverse(name),
+                {
+                    "pickup_address": {
+                        "street": "Benchmark pickup",
+                        "city": "Bogotá",
+                        "latitude": latitude,
+                        "longitude": longitude,
+                    }
+                },
+                format="json",
+            )
+
+        open_services = iter(
+            ServiceRequest.objects.filter(
+                status=ServiceRequest.Status.IN_PROGRESS
+            ).values_list("id", flat=True)
+        )
+
+        def complete():
+            return self.api.patch(
+                reverse("complete-service", kwargs={"pk": next(open_services)}),
+                {"status": "completed"},
+                format="json",
+            )
+
+        def get(name, **kwargs):
+            return lambda: self.api.get(reverse(name, kwargs=kwargs))
+
+        return [
+            ("token", None, token),
+            ("services-list", client, get("service-list-create")),
+            (
+                "services-retrieve",
+                client,
+                get("service-retrieve-update-destroy", pk=service_id),
+            ),
+            ("services-create", client, create),
+            ("services-create-async", client, lambda: create("service-create-async")),
+            ("services-complete", driver, complete),
+            ("drivers-list", client, get("driver-list-create")),
+            (
+                "drivers-retrieve",
+                client,
+                get("driver-retrieve-update-destroy", pk=driver_id),
+            ),
+            ("addresses-list", client, get("address-list-create")),
+            (
+                "addresses-retrieve",
+                client,
+                get("address-retrieve-update-destroy", pk=address_id),
+            ),
+        ]
+
+    def run(self):
+        driver_index.clear()
+        route_cache.clear()
+        report = {}
+        with ExitStack() as stack:
+            fake = stack.enter_context(FakeORSServer(latency=self.ors_latency))
+            stack.enter_context(
+                patch(
+                    "services.helpers.client",
+                    openrouteservice.Client(
+                        base_url=fake.url, retry_over_query_limit=False
+                    ),
+                )
+            )
+            stack.enter_context(
+                patch(
+                    "services.helpers.async_client", AsyncORSClient(base_url=fake.url)
+                )
+            )
+            for name, user, request in self.scenarios():
+                if user is not None:
+                    self.authenticate(user)
+                # Warm-up call: fills the spatial index and other lazy state
+                request()
+                timings, queries, statuses = [], 0, set()
+                for _ in range(self.iterations):
+                    with CaptureQueriesContext(connection) as captured:
+                        start = time.perf_counter()
+                        response = request()
+                        timings.append((time.perf_counter() - start) * 1000)
+                    queries = max(queries, len(captured.captured_queries))
+                    statuses.add(response.status_code)
+                report[name] = {
+                    "status": sorted(statuses),
+                    "queries": queries,
+                    "budget": QUERY_BUDGETS[name],
+                    "p50_ms": _percentile(timings, 50),
+                    "p95_ms": _percentile(timings, 95),
+                }
+            report["_meta"] = {
+                "iterations": self.iterations,
+                "ors_latency_ms": self.ors_latency * 1000,
+                "ors_calls": dict(fake.calls),
+            }
+        return report
+
+
+def over_budget(report):
+    """
+    Returns the names of the endpoints that exceeded their query budget.
+    """
+    return [
+        name
+        for name, row in report.items()
+        if not name.startswith("_") and row["queries"] > row["budget"]
+    ]
+
+
+def compare_reports(baseline, current):
+    """
+    Returns (name, baseline_row, current_row) for the endpoints in both
+    reports, to diff a run against the one of an earlier commit.
+    """
+    return [
+        (name, baseline[name], row)
+        for name, row in current.items()
+        if not name.startswith("_") and name in baseline
+    ]
@@ -0,0 +1,278 @@
+import concurrent.futures
+import concurrent.futures.process
+import logging
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from scipy.optimize import linear_sum_assignment
+
+from delivery_system.response_cache import invalidate_drivers
+from drivers.models import Driver
+from drivers.spatial_index import driver_index
+from services.helpers import get_route_matrix, haversine_distance, nearest_available
+from services.models import ServiceRequest
+
+logger = logging.getLogger(__name__)
+
+# Cost given to request/driver pairs that cannot be matched
+INFEASIBLE = 1e9
+
+
+def _solve_block(costs):
+    rows, cols = linear_sum_assignment(costs)
+    feasible = costs[rows, cols] < INFEASIBLE
+    return rows[feasible], cols[feasible]
+
+
+def _components(feasible):
+    """
+    Splits the bipartite request/driver graph into connected components.
+    Requests in different components never compete for the same driver, so
+    each component can be solved on its own without losing optimality.
+    """
+    n_rows, n_cols = feasible.shape
+    parent = list(range(n_rows + n_cols))
+
+    def find(node):
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    for row, col in zip(*np.nonzero(feasible)):
+        parent[find(row)] = find(n_rows + col)
+
+    components = {}
+    for row in range(n_rows):
+        components.setdefault(find(row), ([], []))[0].append(row)
+    for col in range(n_cols):
+        root = find(n_rows + col)
+        if root in components:
+            components[root][1].append(col)
+    return list(components.values())
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _solver_pool():
+    """
+    Returns the process pool large batches are solved in. It is started on
+    first use and kept for the life of the process: starting worker
+    processes takes longer than solving most batches.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = concurrent.futures.ProcessPoolExecutor()
+        return _pool
+
+
+def _reset_solver_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = None
+
+
+def solve_assignment(costs, parallel_threshold=None):
+    """
+    Solves the min-cost matching between requests (rows) and drivers
+    (columns). Non-finite costs mark pairs that cannot be matched.
+    Returns a list of (row, col) pairs. Batches with more than
+    parallel_threshold requests are split into independent components that
+    are solved in a process pool.
+    """
+    if parallel_threshold is None:
+        parallel_threshold = getattr(settings, "DISPATCH_PARALLEL_THRESHOLD", 200)
+    costs = np.where(np.isfinite(costs), costs, INFEASIBLE)
+    if not costs.size:
+        return []
+
+    if costs.shape[0] <= parallel_threshold:
+        rows, cols = _solve_block(costs)
+        return list(zip(rows.tolist(), cols.tolist()))
+
+    blocks = [
+        (rows, cols) for rows, cols in _components(costs < INFEASIBLE) if rows and cols
+    ]
+    sub_costs = [costs[np.ix_(rows, cols)] for rows, cols in blocks]
+    try:
+        results = list(_solver_pool().map(_solve_block, sub_costs))
+    except concurrent.futures.process.BrokenProcessPool:
+        logger.warning("Solver process pool broke, solving this batch in process")
+        _reset_solver_pool()
+        results = [_solve_block(block) for block in sub_costs]
+    pairs = []
+    for (rows, cols), (sub_rows, sub_cols) in zip(blocks, results):
+        pairs.extend((rows[r], cols[c]) for r, c in zip(sub_rows, sub_cols))
+    return pairs
+
+
+def route_batch(pending, drivers, nearest_ids):
+    """
+    Returns the (len(pending), len(drivers)) array of route durations from
+    each pickup to its candidate drivers (nearest_ids), NaN elsewhere.
+
+    Spatially close requests are routed together so each matrix request
+    only spans the drivers their candidate sets share. Groups that cannot be
+    routed (ORS failing, circuit open, routing queue full) are logged and
+    left unmatched, to be retried with the next batch.
+    """
+    columns = {driver.id: col for col, driver in enumerate(drivers)}
+    durations = np.full((len(pending), len(drivers)), np.nan)
+    group_size = getattr(settings, "DISPATCH_ROUTE_GROUP_SIZE", 8)
+    order = sorted(
+        range(len(pending)), key=lambda row: pending[row].pickup_address.geohash
+    )
+    for start in range(0, len(order), group_size):
+        group = order[start : start + group_size]
+        group_drivers = [
+            driver
+            for driver in drivers
+            if any(driver.id in nearest_ids[row] for row in group)
+        ]
+        if not group_drivers:
+            continue
+        origins = [
+            (
+                pending[row].pickup_address.longitude,
+                pending[row].pickup_address.latitude,
+            )
+            for row in group
+        ]
+        try:
+            _, group_durations = get_route_matrix(origins, group_drivers)
+        except Exception as e:
+            logger.warning(
+                "Could not route %s pending requests, leaving them for the next batch: %s",
+                len(group),
+                e,
+            )
+            continue
+        for i, row in enumerate(group):
+            for j, driver in enumerate(group_drivers):
+                if driver.id in nearest_ids[row]:
+                    durations[row, columns[driver.id]] = group_durations[i, j]
+    return durations
+
+
+def dispatch_pending_batch(max_batch=None, candidates_per_request=None):
+    """
+    Assigns drivers to a batch of pending service requests at once.
+
+    Reads up to max_batch pending requests and the closest available
+    drivers of each pickup, and routes them (route_batch) before locking
+    anything, so concurrent claims and location updates of those drivers
+    never wait on ORS. The requests still pending and the drivers still
+    available are then locked (SKIP LOCKED), the assignment that minimises
+    the total ETA over the batch is solved among them, and all assignments
+    are committed in a single transaction.
+    Returns the number of requests assigned.
+    """
+    max_batch = max_batch or getattr(settings, "DISPATCH_MAX_BATCH", 100)
+    candidates_per_request = candidates_per_request or getattr(
+        settings, "DISPATCH_CANDIDATES_PER_REQUEST", 5
+    )
+
+    pending = list(
+        ServiceRequest.objects.select_related("pickup_address")
+        .filter(status=ServiceRequest.Status.PENDING)
+        .order_by("created_at", "id")[:max_batch]
+    )
+    if not pending:
+        return 0
+
+    # Each request only competes for its own nearest drivers
+    nearest_ids = [
+        {
+            driver_id
+            for driver_id, _ in nearest_available(
+                service.pickup_address.latitude,
+                service.pickup_address.longitude,
+                candidates_per_request,
+            )
+        }
+        for service in pending
+    ]
+    drivers = list(
+        Driver.objects.select_related("current_address").filter(
+            id__in=set().union(*nearest_ids),
+            is_available=True,
+            current_address__isnull=False,
+        )
+    )
+    if not drivers:
+        return 0
+
+    durations = route_batch(pending, drivers, nearest_ids)
+    if np.isnan(durations).all():
+        return 0
+
+    with transaction.atomic():
+        # Requests taken by another dispatcher and drivers claimed since
+        # they were routed drop out of the matching
+        locked_services = set(
+            ServiceRequest.objects.select_for_update(skip_locked=True)
+            .filter(
+                id__in=[service.id for service in pending],
+                status=ServiceRequest.Status.PENDING,
+            )
+            .values_list("id", flat=True)
+        )
+        locked_drivers = {
+            driver.id: driver
+            for driver in Driver.objects.select_for_update(
+                skip_locked=True, of=("self",)
+            )
+            .select_related("current_address")
+            .filter(id__in=[driver.id for driver in drivers], is_available=True)
+        }
+        durations[[service.id not in locked_services for service in pending], :] = (
+            np.nan
+        )
+        durations[:, [driver.id not in locked_drivers for driver in drivers]] = np.nan
+
+        assigned_services = []
+        assigned_drivers = []
+        for row, col in solve_assignment(durations):
+            service, driver = pending[row], locked_drivers[drivers[col].id]
+            service.assigned_driver = driver
+            service.estimated_time_minutes = int(durations[row, col])
+            service.eta_source = ServiceRequest.EtaSource.ROUTED
+            service.pickup_distance_km = haversine_distance(
+                driver.current_address.latitude,
+                driver.current_address.longitude,
+                service.pickup_address.latitude,
+                service.pickup_address.longitude,
+            )
+            service.status = ServiceRequest.Status.IN_PROGRESS
+            driver.is_available = False
+            assigned_services.append(service)
+            assigned_drivers.append(driver)
+
+        ServiceRequest.objects.bulk_update(
+            assigned_services,
+            [
+                "assigned_driver",
+                "estimated_time_minutes",
+                "eta_source",
+                "pickup_distance_km",
+                "status",
+            ],
+        )
+        Driver.objects.bulk_update(assigned_drivers, ["is_available"])
+        invalidate_drivers([driver.id for driver in assigned_drivers])
+
+    # bulk_update bypasses post_save, so keep the spatial index in step
+    for driver in assigned_drivers:
+        driver_index.remove(driver.id)
+
+    logger.info(
+        "Dispatched %s of %s pending requests", len(assigned_services), len(pending)
+    )
+    return len(assigned_services)
@@ -0,0 +1,185 @@
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from addresses import geohash
+from services.models import EtaSpeedFactor, ServiceRequest
+
+# 15 km/h along roads 1.3 times longer than the straight line, the same
+# travel model as services.fake_ors.FakeORSServer
+DEFAULT_MINUTES_PER_KM = 60 / 15 * 1.3
+
+# Road distance per straight-line kilometre, used for unrefined estimates
+ROAD_FACTOR = 1.3
+
+
+class EtaModel:
+    """
+    Local travel time estimator: straight-line distance times a learned
+    minutes-per-kilometre factor for the pickup's zone (a geohash prefix)
+    and time-of-day slot.
+
+    Factors fall back from (zone, slot) to the zone over the whole day, then
+    to the slot over every zone, then to the global factor and finally to
+    DEFAULT_MINUTES_PER_KM when there is no history yet. They are loaded
+    from EtaSpeedFactor, written by `manage.py train_eta_model`, and
+    reloaded every ETA_MODEL_REFRESH_SECONDS.
+    """
+
+    def __init__(self, zone_precision=None, slot_hours=None, refresh_seconds=None):
+        self.zone_precision = zone_precision or getattr(
+            settings, "ETA_ZONE_PRECISION", 5
+        )
+        self.slot_hours = slot_hours or getattr(settings, "ETA_SLOT_HOURS", 3)
+        self.refresh_seconds = refresh_seconds or getattr(
+            settings, "ETA_MODEL_REFRESH_SECONDS", 300
+        )
+        self._lock = threading.Lock()
+        self._factors = {}
+        self._loaded_at = None
+
+    def zone(self, latitude, longitude):
+        return geohash.encode(latitude, longitude, self.zone_precision)
+
+    def slot(self, when=None):
+        return timezone.localtime(when or timezone.now()).hour // self.slot_hours
+
+    def clear(self):
+        """
+        Forgets the loaded factors; they are read again on the next estimate.
+        """
+        with self._lock:
+            self._factors = {}
+            self._loaded_at = None
+
+    def load(self):
+        factors = {
+            (zone, slot): minutes_per_km
+            for zone, slot, minutes_per_km in EtaSpeedFactor.objects.values_list(
+                "zone", "slot", "minutes_per_km"
+            )
+        }
+        with self._lock:
+            self._factors = factors
+            self._loaded_at = time.monotonic()
+
+    def factor(self, zone, slot):
+        """
+        Returns the minutes per straight-line kilometre for a zone and slot.
+        """
+        if (
+            self._loaded_at is None
+            or time.monotonic() - self._loaded_at > self.refresh_seconds
+        ):
+            self.load()
+        for key in ((zone, slot), (zone, None), ("", slot), ("", None)):
+            if key in self._factors:
+                return self._factors[key]
+        return DEFAULT_MINUTES_PER_KM
+
+    def estimate(self, distances_km, latitude, longitude, when=None):
+        """
+        Estimates the minutes needed to cover the straight-line distances
+        (a scalar or an array) to the point at `latitude`, `longitude`.
+        """
+        factor = self.factor(self.zone(latitude, longitude), self.slot(when))
+        return np.asarray(distances_km, dtype=np.float64) * factor
+
+
+eta_model = EtaModel()
+
+
+class LocalEstimate(int):
+    """
+    Whole minutes estimated without routing, tagged with their
+    ServiceRequest.EtaSource so they are stored as such and never trained on.
+    """
+
+    def __new__(cls, minutes, source):
+        estimate = super().__new__(cls, minutes)
+        estimate.source = source
+        return estimate
+
+    def __reduce__(self):
+        return LocalEstimate, (int(self), self.source)
+
+
+def eta_source(minutes):
+    """
+    Returns the ServiceRequest.EtaSource of a ranked duration: routed unless
+    it is a LocalEstimate.
+    """
+    return getattr(minutes, "source", ServiceRequest.EtaSource.ROUTED)
+
+
+def fit_speed_factors(samples, zone_precision, slot_hours, min_samples):
+    """
+    Fits minutes-per-km factors from (latitude, longitude, when, distance_km,
+    minutes) samples. Each group gets the median ratio of its samples, which
+    shrugs off the odd driver stuck in traffic. Groups with fewer than
+    min_samples samples are left to the fallbacks.
+    Returns (zone, slot, minutes_per_km, samples) tuples.
+    """
+    groups = {}
+    for latitude, longitude, when, distance_km, minutes in samples:
+        zone = geohash.encode(latitude, longitude, zone_precision)
+        slot = timezone.localtime(when).hour // slot_hours
+        ratio = minutes / distance_km
+        for key in ((zone, slot), (zone, None), ("", slot), ("", None)):
+            groups.setdefault(key, []).append(ratio)
+
+    return [
+        (zone, slot, float(np.median(ratios)), len(ratios))
+        for (zone, slot), ratios in groups.items()
+        if len(ratios) >= min_samples or (zone, slot) == ("", None)
+    ]
+
+
+def train_eta_model(days=None, min_samples=None, min_distance_km=0.05):
+    """
+    Refits the speed factors from the routed service requests of the last
+    `days` days and replaces the stored ones in one transaction. Requests
+    whose ETA came from the model itself or the travel grid are left out.
+    Returns the number of samples used.
+    """
+    days = days or getattr(settings, "ETA_TRAINING_DAYS", 30)
+    min_samples = min_samples or getattr(settings, "ETA_MIN_SAMPLES", 20)
+    since = timezone.now() - timedelta(days=days)
+    samples = list(
+        ServiceRequest.objects.filter(
+            created_at__gte=since,
+            status=ServiceRequest.Status.COMPLETED,
+            pickup_distance_km__gte=min_distance_km,
+            estimated_time_minutes__isnull=False,
+            eta_source=ServiceRequest.EtaSource.ROUTED,
+        ).values_list(
+            "pickup_address__latitude",
+            "pickup_address__longitude",
+            "created_at",
+            "pickup_distance_km",
+            "estimated_time_minutes",
+        )
+    )
+    if not samples:
+        return 0
+
+    factors = fit_speed_factors(
+        samples, eta_model.zone_precision, eta_model.slot_hours, min_samples
+    )
+    with transaction.atomic():
+        EtaSpeedFactor.objects.all().delete()
+        EtaSpeedFactor.objects.bulk_create(
+            [
+                EtaSpeedFactor(
+                    zone=zone, slot=slot, minutes_per_km=factor, samples=count
+                )
+                for zone, slot, factor, count in factors
+            ]
+        )
+    eta_model.clear()
+    return len(samples)
@@ -0,0 +1,154 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from services.helpers import haversine_distance
+
+
+def latency_distribution(spec, seed=0):
+    """
+    Returns the FakeORSServer latency described by `spec`, in seconds:
+    "0.2" or "fixed:0.2", "uniform:LOW,HIGH", "exponential:MEAN" or
+    "lognormal:MEDIAN,SIGMA" (heavy tailed, like a real routing server).
+    """
+    kind, _, params = spec.partition(":") if ":" in spec else ("fixed", "", spec)
+    try:
+        values = [float(value) for value in params.split(",")]
+    except ValueError:
+        raise ValueError(f"Invalid latency '{spec}'")
+    rng = random.Random(seed)
+    if kind == "fixed" and len(values) == 1:
+        return values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda: rng.uniform(*values)
+    if kind == "exponential" and len(values) == 1:
+        return lambda: rng.expovariate(1 / values[0]) if values[0] else 0.0
+    if kind == "lognormal" and len(values) == 2:
+        median, sigma = values
+        return lambda: median * rng.lognormvariate(0, sigma)
+    raise ValueError(f"Invalid latency '{spec}'")
+
+
+class FakeORSServer:
+    """
+    Minimal local stand-in for the OpenRouteService HTTP API.
+
+    Serves the directions (geojson) and matrix endpoints used by
+    services.helpers, answering with Haversine distance times ROAD_FACTOR at
+    a constant speed after an optional artificial latency. Point an
+    openrouteservice.Client at `url` (or set OPENROUTE_SERVICE_URL) to use it.
+    """
+
+    ROAD_FACTOR = 1.3
+
+    def __init__(self, speed_kmh=15.0, latency=0.0, host="127.0.0.1", port=0):
+        self.speed_kmh = speed_kmh
+        self.latency = latency
+        self.calls = {"directions": 0, "matrix": 0}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def route(self, origin, destination):
+        """
+        Returns the fake (distance_m, duration_s) between two lng/lat pairs.
+        """
+        distance_km = (
+            haversine_distance(origin[1], origin[0], destination[1], destination[0])
+            * self.ROAD_FACTOR
+        )
+        return distance_km * 1000, distance_km / self.speed_kmh * 3600
+
+    def _count(self, endpoint):
+        with self._lock:
+            self.calls[endpoint] += 1
+
+    def _sleep(self):
+        latency = self.latency() if callable(self.latency) else self.latency
+        if latency:
+            time.sleep(latency)
+
+    def directions(self, body):
+        self._count("directions")
+        coordinates = body["coordinates"]
+        distance, duration = self.route(coordinates[0], coordinates[-1])
+        return {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "properties": {
+                        "summary": {"distance": distance, "duration": duration}
+                    },
+                    "geometry": {"type": "LineString", "coordinates": coordinates},
+                }
+            ],
+        }
+
+    def matrix(self, body):
+        self._count("matrix")
+        locations = body["locations"]
+        sources = body.get("sources") or range(len(locations))
+        destinations = body.get("destinations") or range(len(locations))
+        routes = [
+            [self.route(locations[s], locations[d]) for d in destinations]
+            for s in sources
+        ]
+        return {
+            "distances": [[route[0] for route in row] for row in routes],
+            "durations": [[route[1] for route in row] for row in routes],
+        }
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, so pooled clients reuse their connections
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                fake._sleep()
+                if self.path.startswith("/v2/directions/"):
+                    payload = fake.directions(body)
+                elif self.path.startswith("/v2/matrix/"):
+                    payload = fake.matrix(body)
+                else:
+                    self.send_error(404)
+                    return
+
+                data = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
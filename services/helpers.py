@@ -1,15 +1,351 @@
 import openrouteservice
+import numpy as np
+from django.conf import settings
 from drivers.models import Driver
+from drivers.spatial_index import driver_index
+import asyncio
 import os
-import concurrent.futures
-from math import radians, cos, sin, asin, sqrt
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from math import radians, cos, sin, asin, sqrt, pi
+from django.core.cache import caches
+from addresses import geohash
+from delivery_system.metrics import registry, timed
+from services.eta import ROAD_FACTOR as ETA_ROAD_FACTOR, LocalEstimate, eta_model
+from services.models import ServiceRequest
+from asgiref.sync import sync_to_async
+from services.ors_client import (
+    AsyncORSClient,
+    AsyncRoutingClient,
+    CircuitBreaker,
+    Deadline,
+    PooledORSClient,
+    RoutingClient,
+)
+from services.road_graph import LocalRoutingClient
+from services.travel_grid import get_travel_grid
 
 ORS_API_KEY = os.getenv("OPENROUTE_SERVICE_KEY")
-client = openrouteservice.Client(key=ORS_API_KEY)
+ORS_BASE_URL = os.getenv("OPENROUTE_SERVICE_URL", "https://api.openrouteservice.org")
+ORS_TIMEOUT_SECONDS = getattr(settings, "ORS_TIMEOUT_SECONDS", 5)
+
+# ROUTING_BACKEND="graph" answers the same matrix/directions calls from an
+# in-process road graph (`manage.py build_road_graph`) instead of ORS
+if getattr(settings, "ROUTING_BACKEND", "ors") == "graph":
+    client = LocalRoutingClient(settings.ROAD_GRAPH_PATH)
+else:
+    # A pooled session lets the routing workers keep their connections
+    # alive between assignments
+    client = PooledORSClient(
+        key=ORS_API_KEY,
+        base_url=ORS_BASE_URL,
+        timeout=ORS_TIMEOUT_SECONDS,
+        retry_timeout=ORS_TIMEOUT_SECONDS,
+    )
+
+# Deadline, circuit breaker, hedging and a bounded queue for the calls made
+# with `client`. Local queries are CPU bound, so duplicating them would not help.
+ors = RoutingClient(
+    hedge_after=0 if isinstance(client, LocalRoutingClient) else None,
+    session=getattr(client, "session", None),
+)
+
+# asyncio twins used by the ASGI creation view; both clients share the
+# circuit, since they call the same server
+async_client = AsyncORSClient(
+    key=ORS_API_KEY, base_url=ORS_BASE_URL, timeout=ORS_TIMEOUT_SECONDS
+)
+aors = AsyncRoutingClient(breaker=ors.breaker)
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6356.752
+
+ROUTE_PROFILE = "cycling-road"
+
+
+class RouteCache:
+    """
+    LRU + TTL cache of (distance_km, duration_minutes) route summaries.
+
+    Keys are the origin and destination snapped to ROUTE_CACHE_PRECISION
+    decimal places plus the routing profile, so nearly identical pickups and
+    driver positions share an entry. When ROUTE_CACHE_BACKEND names a Django
+    cache alias, entries are also shared with the other workers through it.
+    """
+
+    def __init__(self, max_entries=None, ttl=None, precision=None, backend=None):
+        # 0 is a valid value for each of these (e.g. ttl=0 disables caching)
+        self.max_entries = (
+            max_entries
+            if max_entries is not None
+            else getattr(settings, "ROUTE_CACHE_MAX_ENTRIES", 4096)
+        )
+        self.ttl = ttl if ttl is not None else getattr(settings, "ROUTE_CACHE_TTL", 300)
+        self.precision = (
+            precision
+            if precision is not None
+            else getattr(settings, "ROUTE_CACHE_PRECISION", 4)
+        )
+        self.backend = backend or getattr(settings, "ROUTE_CACHE_BACKEND", None)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, origin, destination, profile=ROUTE_PROFILE):
+        """
+        Builds the cache key for two (longitude, latitude) pairs.
+        """
+        coords = ",".join(
+            f"{value:.{self.precision}f}" for value in (*origin, *destination)
+        )
+        return f"route:{profile}:{coords}"
+
+    def get(self, origin, destination, profile=ROUTE_PROFILE):
+        """
+        Returns the cached summary or None, counting the hit or miss.
+        """
+        key = self.key(origin, destination, profile)
+        now = time.monotonic()
+        value = self._get_local(key, now)
+        if value is not None or not self.backend:
+            return self._found(key, value, now)
+        return self._found(key, caches[self.backend].get(key), now)
+
+    async def aget(self, origin, destination, profile=ROUTE_PROFILE):
+        """
+        Async version of get: the in-process lookup stays synchronous, the
+        shared backend is awaited so it never blocks the event loop.
+        """
+        key = self.key(origin, destination, profile)
+        now = time.monotonic()
+        value = self._get_local(key, now)
+        if value is not None or not self.backend:
+            return self._found(key, value, now)
+        return self._found(key, await caches[self.backend].aget(key), now)
+
+    def set(self, origin, destination, value, profile=ROUTE_PROFILE):
+        """
+        Stores a summary locally and, if configured, in the shared backend.
+        """
+        key = self.key(origin, destination, profile)
+        with self._lock:
+            self._store(key, value, time.monotonic())
+        if self.backend:
+            caches[self.backend].set(key, value, timeout=self.ttl)
+
+    async def aset(self, origin, destination, value, profile=ROUTE_PROFILE):
+        """
+        Async version of set.
+        """
+        key = self.key(origin, destination, profile)
+        with self._lock:
+            self._store(key, value, time.monotonic())
+        if self.backend:
+            await caches[self.backend].aset(key, value, timeout=self.ttl)
+
+    def _get_local(self, key, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    return value
+                del self._entries[key]
+        return None
+
+    def _found(self, key, value, now):
+        # Counts the lookup, keeping a shared hit in the local tier
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if key not in self._entries:
+                self._store(key, tuple(value), now)
+        return tuple(value)
+
+    def _store(self, key, value, now):
+        self._entries[key] = (value, now + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Drops the local entries and resets the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Returns the entry count and hit/miss counters.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+route_cache = RouteCache()
+
+
+class CandidateSizer:
+    """
+    Chooses how many of the closest drivers to route for a pickup.
+
+    Candidates farther than `spread` times the closest one's straight-line
+    distance are rarely faster, so they are dropped. Around a driver sitting
+    on the pickup that distance says nothing; the typical spacing between
+    drivers there (from the local density) is used instead. The count stays
+    within [min_candidates, max_candidates]: a handful downtown, more at
+    the city edge where the closest drivers are all about as far.
+
+    A sample of `audit_rate` assignments also routes the dropped drivers
+    and counts how often one of them was faster, so the sizing can be
+    checked in production.
+    """
+
+    def __init__(
+        self, min_candidates=None, max_candidates=None, spread=None, audit_rate=None
+    ):
+        self.min_candidates = min_candidates or getattr(settings, "CANDIDATES_MIN", 3)
+        self.max_candidates = max_candidates or getattr(settings, "CANDIDATES_MAX", 15)
+        self.spread = spread or getattr(settings, "CANDIDATES_SPREAD", 2.0)
+        self.audit_rate = (
+            audit_rate
+            if audit_rate is not None
+            else getattr(settings, "CANDIDATES_AUDIT_RATE", 0.02)
+        )
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.assignments = 0
+            self.candidates = 0
+            self.audits = 0
+            self.misses = 0
+
+    def size(self, distances_km):
+        """
+        Returns how many of the candidates, closest first, to keep.
+        """
+        distances_km = np.asarray(distances_km, dtype=np.float64)
+        if len(distances_km) <= self.min_candidates:
+            size = len(distances_km)
+        else:
+            # With a uniform density the k-th closest driver is about
+            # sqrt(k) spacings away
+            spacing = distances_km[-1] / np.sqrt(len(distances_km))
+            radius = self.spread * max(distances_km[0], spacing)
+            size = int(
+                np.clip(
+                    np.count_nonzero(distances_km <= radius),
+                    self.min_candidates,
+                    self.max_candidates,
+                )
+            )
+        with self._lock:
+            self.assignments += 1
+            self.candidates += size
+        return size
+
+    def should_audit(self):
+        return random.random() < self.audit_rate
+
+    def record_audit(self, missed):
+        with self._lock:
+            self.audits += 1
+            self.misses += bool(missed)
+
+    def stats(self):
+        """
+        Returns the mean candidate count and the audited miss rate.
+        """
+        with self._lock:
+            return {
+                "assignments": self.assignments,
+                "mean_candidates": (
+                    self.candidates / self.assignments if self.assignments else None
+                ),
+                "audits": self.audits,
+                "misses": self.misses,
+                "miss_rate": self.misses / self.audits if self.audits else None,
+            }
+
+
+candidate_sizer = CandidateSizer()
+
+routed_candidates = registry.histogram(
+    "routing_candidates",
+    "Candidate drivers ranked per assignment.",
+    buckets=(1, 2, 3, 5, 8, 10, 15, 20, 30, 50),
+)
+
+
+@registry.register
+def routing_metrics():
+    """
+    Prometheus families of the routing clients, the route cache and the
+    candidate audits, read from their counters at scrape time.
+    """
+    events, circuit = [], []
+    for name, routing in (("ors", ors), ("async_ors", aors)):
+        stats = routing.stats()
+        for event in routing.counters:
+            events.append(
+                ("ors_events_total", {"client": name, "event": event}, stats[event])
+            )
+        is_open = stats["circuit"] != CircuitBreaker.CLOSED
+        circuit.append(("ors_circuit_open", {"client": name}, is_open))
+    cache = route_cache.stats()
+    sizer = candidate_sizer.stats()
+    hits = sizer["audits"] - sizer["misses"]
+    return [
+        ("ors_events_total", "counter", "Routing calls and their outcomes.", events),
+        ("ors_circuit_open", "gauge", "1 while the ORS circuit is open.", circuit),
+        (
+            "ors_queue_depth",
+            "gauge",
+            "Routing calls waiting for a thread.",
+            [("ors_queue_depth", {}, ors.stats()["queue_depth"])],
+        ),
+        (
+            "route_cache_lookups_total",
+            "counter",
+            "Route cache lookups.",
+            [
+                ("route_cache_lookups_total", {"result": "hit"}, cache["hits"]),
+                ("route_cache_lookups_total", {"result": "miss"}, cache["misses"]),
+            ],
+        ),
+        (
+            "candidate_audits_total",
+            "counter",
+            "Audited assignments, missed when a dropped driver was faster.",
+            [
+                ("candidate_audits_total", {"result": "hit"}, hits),
+                ("candidate_audits_total", {"result": "miss"}, sizer["misses"]),
+            ],
+        ),
+    ]
 
 
 def haversine_distance(lat1, lon1, lat2, lon2):
-    R = 6356.752  # Earth radius in kilometers
+    R = EARTH_RADIUS_KM
     lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
     dlon = lon2 - lon1
     dlat = lat2 - lat1
@@ -18,81 +354,677 @@ def haversine_distance(lat1, lon1, lat2, lon2):
     return R * c
 
 
-def find_nearest_driver(pickup_address, candidates_limit=10):
+def haversine_many(lat, lon, lats, lons):
     """
-    Finds the nearest available driver based on pickup address.
-    First prefilters candidates using Haversine distance.
-    Then gets real distance via OpenRouteService.
+    Vectorized haversine_distance from one point to arrays of points.
+    Returns a NumPy array of distances in kilometers.
+    """
+    lat, lon = np.radians(lat), np.radians(lon)
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+    dlon = lons - lon
+    dlat = lats - lat
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def top_k_indices(distances, k):
+    """
+    Returns the indices of the k smallest distances, closest first, without
+    sorting the whole array.
+    """
+    if k < len(distances):
+        indices = np.argpartition(distances, k - 1)[:k]
+    else:
+        indices = np.arange(len(distances))
+    return indices[np.argsort(distances[indices], kind="stable")]
+
+
+def _rank_rows(pickup_lat, pickup_lon, rows, candidates_limit):
+    coords = np.array(rows, dtype=np.float64).reshape(-1, 3)
+    if not len(coords):
+        return []
+
+    distances = haversine_many(pickup_lat, pickup_lon, coords[:, 1], coords[:, 2])
+    nearest = top_k_indices(distances, candidates_limit)
+    return [(int(coords[i, 0]), float(distances[i])) for i in nearest]
+
+
+def prefilter_candidates(pickup_lat, pickup_lon, candidates_limit):
+    """
+    Returns up to candidates_limit (driver_id, distance_km) tuples for the
+    closest available drivers, using the indexed Address.geohash column.
+    Only the pickup's cell is queried at first, then ring by ring its
+    neighbours, until enough drivers were found that no farther cell can hold
+    a closer one. Falls back to a full scan after DRIVER_GEOHASH_MAX_RINGS.
     """
     available_drivers = Driver.objects.filter(
         is_available=True, current_address__isnull=False
     )
+    columns = ("id", "current_address__latitude", "current_address__longitude")
+    max_rings = getattr(settings, "DRIVER_GEOHASH_MAX_RINGS", 10)
+    cell_lat, cell_lon = geohash.cell_size()
+    km_per_degree = EARTH_RADIUS_KM * pi / 180
 
-    if not available_drivers:
-        raise Exception("No available drivers")
+    rows = []
+    for radius in range(max_rings + 1):
+        cells = geohash.ring(pickup_lat, pickup_lon, radius)
+        rows.extend(
+            available_drivers.filter(current_address__geohash__in=cells).values_list(
+                *columns
+            )
+        )
+        if len(rows) >= candidates_limit:
+            # Unvisited cells are at least `radius` cells away from the pickup
+            widest_lat = min(abs(pickup_lat) + radius * cell_lat, 89)
+            cell_km = km_per_degree * min(cell_lat, cell_lon * cos(radians(widest_lat)))
+            candidates = _rank_rows(pickup_lat, pickup_lon, rows, candidates_limit)
+            if candidates[-1][1] <= radius * cell_km:
+                return candidates
+
+    # Sparse fleet around the pickup: rank every available driver
+    rows = list(available_drivers.values_list(*columns))
+    return _rank_rows(pickup_lat, pickup_lon, rows, candidates_limit)
+
+
+def nearest_available(pickup_lat, pickup_lon, candidates_limit):
+    """
+    Returns up to candidates_limit (driver_id, distance_km) tuples for the
+    closest available drivers, from the in-memory spatial index or, when
+    DRIVER_SPATIAL_INDEX is off, from the geohash ring query.
+    """
+    if getattr(settings, "DRIVER_SPATIAL_INDEX", True):
+        return driver_index.nearest(pickup_lat, pickup_lon, candidates_limit)
+    return prefilter_candidates(pickup_lat, pickup_lon, candidates_limit)
+
+
+def driver_coordinates(driver):
+    return (driver.current_address.longitude, driver.current_address.latitude)
+
+
+def get_driver_route(pickup_coords, driver):
+    """
+    Gets the (distance_km, duration_minutes) route from the pickup to the
+    driver with a full OpenRouteService directions request. Meant to be run
+    through `ors`, which applies the deadline and the circuit breaker.
+    """
+    try:
+        driver_coords = driver_coordinates(driver)
+        route = client.directions(
+            coordinates=[pickup_coords, driver_coords],
+            profile=ROUTE_PROFILE,
+            format="geojson",
+        )
+        route_summary = route["features"][0]["properties"]["summary"]
+        if not route_summary:
+            return None
+
+        distance_km = route_summary["distance"] / 1000
+        duration_minutes = int(route_summary["duration"] / 60)
+        route_cache.set(pickup_coords, driver_coords, (distance_km, duration_minutes))
+        return (distance_km, duration_minutes)
+    except Exception as e:
+        raise RuntimeError(
+            f"Error calculating route for driver {driver.id if driver else 'unknown'}: {str(e)}"
+        )
+
+
+def get_matrix_routes(pickup_coords, drivers, deadline=None):
+    """
+    Gets the routes from the pickup to every driver with a single
+    OpenRouteService one-to-many matrix request.
+    Returns a dict of driver id -> (distance_km, duration_minutes), leaving
+    out drivers the matrix could not route.
+    """
+    driver_coords = [driver_coordinates(driver) for driver in drivers]
+    matrix = ors.call(
+        lambda: client.distance_matrix(
+            locations=[pickup_coords, *driver_coords],
+            profile=ROUTE_PROFILE,
+            sources=[0],
+            destinations=list(range(1, len(drivers) + 1)),
+            metrics=["distance", "duration"],
+        ),
+        deadline,
+    )
+
+    routes = {}
+    rows = zip(drivers, driver_coords, matrix["distances"][0], matrix["durations"][0])
+    for driver, coords, distance, duration in rows:
+        if distance is None or duration is None:
+            continue
+        route = (distance / 1000, int(duration / 60))
+        route_cache.set(pickup_coords, coords, route)
+        routes[driver.id] = route
+    return routes
+
+
+def get_route_matrix(origins, drivers):
+    """
+    Gets (distance_km, duration_minutes) arrays of shape
+    (len(origins), len(drivers)) from every origin to every driver.
+    Cached pairs are reused; all remaining pairs are requested with
+    many-to-many OpenRouteService matrix calls (a single one unless the batch
+    exceeds ORS_MATRIX_MAX_ELEMENTS). Unroutable pairs are NaN.
+    """
+    driver_coords = [driver_coordinates(driver) for driver in drivers]
+    distances = np.full((len(origins), len(drivers)), np.nan)
+    durations = np.full((len(origins), len(drivers)), np.nan)
+
+    missing_rows = []
+    for row, origin in enumerate(origins):
+        for col, coords in enumerate(driver_coords):
+            cached = route_cache.get(origin, coords)
+            if cached is None:
+                missing_rows.append(row)
+                break
+            distances[row, col], durations[row, col] = cached
+
+    # Stay under the per-request element limit of the matrix endpoint
+    max_elements = getattr(settings, "ORS_MATRIX_MAX_ELEMENTS", 3500)
+    rows_per_request = max(1, max_elements // max(len(drivers), 1))
+    for start in range(0, len(missing_rows), rows_per_request):
+        chunk = missing_rows[start : start + rows_per_request]
+        locations = [origins[row] for row in chunk] + driver_coords
+        # Large batch requests are not hedged: a duplicate would double the
+        # load of the slowest requests
+        matrix = ors.call(
+            lambda: client.distance_matrix(
+                locations=locations,
+                profile=ROUTE_PROFILE,
+                sources=list(range(len(chunk))),
+                destinations=list(range(len(chunk), len(locations))),
+                metrics=["distance", "duration"],
+            ),
+            hedge=False,
+        )
+        for i, row in enumerate(chunk):
+            cells = zip(matrix["distances"][i], matrix["durations"][i])
+            for col, (distance, duration) in enumerate(cells):
+                if distance is None or duration is None:
+                    continue
+                route = (distance / 1000, int(duration / 60))
+                route_cache.set(origins[row], driver_coords[col], route)
+                distances[row, col], durations[row, col] = route
+
+    return distances, durations
+
+
+def get_candidate_routes(pickup_coords, candidates, deadline=None):
+    """
+    Gets the route to every candidate: cached routes first, then one matrix
+    request for the rest. Full directions requests are only made for
+    candidates the matrix could not answer. Candidates whose requests fail
+    or miss the deadline are left out instead of failing the others.
+    """
+    routes, pending = get_cached_routes(pickup_coords, candidates)
+    if pending:
+        routes.update(get_matrix_routes_or_none(pickup_coords, pending, deadline))
+        pending = [driver for driver in pending if driver.id not in routes]
+    routes.update(get_directions_routes(pickup_coords, pending, deadline))
+    return routes
+
+
+def get_cached_routes(pickup_coords, candidates):
+    """
+    Returns the cached routes by driver id and the candidates without one.
+    """
+    routes = {}
+    pending = []
+    for driver in candidates:
+        cached = route_cache.get(pickup_coords, driver_coordinates(driver))
+        if cached is not None:
+            routes[driver.id] = cached
+        else:
+            pending.append(driver)
+    return routes, pending
+
+
+def get_matrix_routes_or_none(pickup_coords, drivers, deadline=None):
+    """
+    get_matrix_routes, returning no routes when the request fails so the
+    callers fall back to directions requests.
+    """
+    try:
+        return get_matrix_routes(pickup_coords, drivers, deadline)
+    except Exception as e:
+        logger.warning("ORS matrix request failed, using directions: %s", e)
+        return {}
+
+
+def get_directions_routes(pickup_coords, drivers, deadline=None, give_up=None):
+    """
+    Routes every driver with its own directions request, concurrently.
+    `give_up` is passed on to ors.call_many to stop waiting on the requests
+    no longer needed.
+    """
+    if not drivers:
+        return {}
+    results, errors = ors.call_many(
+        {
+            driver.id: (lambda driver=driver: get_driver_route(pickup_coords, driver))
+            for driver in drivers
+        },
+        deadline,
+        give_up=give_up,
+    )
+    for driver_id, error in errors.items():
+        logger.warning("Skipping driver %s without a route: %s", driver_id, error)
+    return {driver_id: route for driver_id, route in results.items() if route}
+
+
+def lower_bound_minutes(distances_km):
+    """
+    Returns the fewest whole minutes a route can take over each
+    straight-line distance: roads are never shorter than the straight line,
+    and no one rides faster than ROUTING_MAX_SPEED_KMH.
+    """
+    max_speed = getattr(settings, "ROUTING_MAX_SPEED_KMH", 30)
+    return np.floor(np.asarray(distances_km, dtype=np.float64) / max_speed * 60)
+
+
+def get_pruned_routes(pickup_coords, candidates, distances_km, deadline=None):
+    """
+    get_candidate_routes without the candidates that cannot win: once some
+    route is known, a candidate whose lower bound ETA is slower can be
+    skipped without changing the driver chosen.
+
+    Cached routes prune the matrix request, which may then not be needed
+    at all. Directions requests (when the matrix fails) are issued closest
+    first, ROUTE_PRUNING_BATCH at a time, and the ones in flight are
+    abandoned as soon as a faster route is in. Skipped candidates count as
+    `pruned` in ors.stats(), abandoned requests as `abandoned`.
+    Returns the routes and the candidates skipped or abandoned, closest
+    first, which are still worth claiming if the routed ones are taken.
+    """
+    bounds = dict(
+        zip((driver.id for driver in candidates), lower_bound_minutes(distances_km))
+    )
+    routes, pending = get_cached_routes(pickup_coords, candidates)
+    skipped = set()
+
+    def fastest(found):
+        durations = [route[1] for route in found.values() if route]
+        return min(durations) if durations else None
+
+    def prune(drivers):
+        best = fastest(routes)
+        if best is None:
+            return drivers
+        kept = [driver for driver in drivers if bounds[driver.id] <= best]
+        ors.record_pruned(len(drivers) - len(kept))
+        skipped.update(driver.id for driver in drivers if bounds[driver.id] > best)
+        return kept
 
+    def give_up(results, pending_ids):
+        best = fastest({**routes, **results})
+        if best is None:
+            return set()
+        abandoned = {driver_id for driver_id in pending_ids if bounds[driver_id] > best}
+        skipped.update(abandoned)
+        return abandoned
+
+    pending = prune(pending)
+    if pending:
+        routes.update(get_matrix_routes_or_none(pickup_coords, pending, deadline))
+        pending = [driver for driver in pending if driver.id not in routes]
+
+    batch_size = getattr(settings, "ROUTE_PRUNING_BATCH", 5)
+    pending = prune(pending)
+    while pending and not (deadline and deadline.expired()):
+        batch, pending = pending[:batch_size], pending[batch_size:]
+        routes.update(get_directions_routes(pickup_coords, batch, deadline, give_up))
+        pending = prune(pending)
+
+    pruned = [
+        driver
+        for driver in candidates
+        if driver.id in skipped and driver.id not in routes
+    ]
+    return routes, pruned
+
+
+def rank_nearest_drivers(pickup_address, candidates_limit=None):
+    """
+    Ranks the available drivers closest to the pickup address.
+    First prefilters candidates using Haversine distance over the in-memory
+    spatial index of available drivers (or an expanding geohash ring query
+    when the index is disabled), keeping candidates_limit of them or, by
+    default, as many as candidate_sizer deems worth routing.
+    Then gets real distance for all candidates via one OpenRouteService
+    matrix request, within ORS_ASSIGNMENT_DEADLINE_SECONDS, without routing
+    those that cannot beat a route already known (ROUTE_PRUNING); they are
+    ranked last, by their local estimate. When no
+    candidate could be routed (ORS down or its circuit open), they are
+    ranked by straight-line distance with the local ETA model instead.
+    With a precomputed travel grid (TRAVEL_GRID_PATH), candidates are scored
+    from the grid instead and ORS only refines the best
+    TRAVEL_GRID_REFINE_TOP of them.
+    Returns (driver, distance_km, duration_minutes) tuples, fastest first, so
+    callers can fall through to the next one without routing again.
+    """
     pickup_lat = pickup_address.latitude
     pickup_lon = pickup_address.longitude
+    nearest, nearest_km, size = sized_candidates(pickup_address, candidates_limit)
+    candidates, distances_km = nearest[:size], nearest_km[:size]
 
-    # Prefilter: calculate Haversine distance
-    driver_distances = []
-    for driver in available_drivers:
-        driver_lat = driver.current_address.latitude
-        driver_lon = driver.current_address.longitude
-        distance = haversine_distance(pickup_lat, pickup_lon, driver_lat, driver_lon)
-        driver_distances.append((driver, distance))
+    pickup_coords = (pickup_lon, pickup_lat)
+    with timed("routing"):
+        deadline = Deadline(getattr(settings, "ORS_ASSIGNMENT_DEADLINE_SECONDS", 3))
+        grid = get_travel_grid()
+        if grid is not None:
+            minutes = grid.minutes(
+                pickup_lat,
+                pickup_lon,
+                [driver.current_address.latitude for driver in candidates],
+                [driver.current_address.longitude for driver in candidates],
+            )
+            return rank_with_eta_model(
+                pickup_coords,
+                candidates,
+                distances_km,
+                refine_top=getattr(settings, "TRAVEL_GRID_REFINE_TOP", 0),
+                deadline=deadline,
+                minutes=minutes,
+            )
+        if getattr(settings, "ETA_MODEL_RANKING", False):
+            return rank_with_eta_model(
+                pickup_coords, candidates, distances_km, deadline=deadline
+            )
+        pruned = []
+        if getattr(settings, "ROUTE_PRUNING", True):
+            routes, pruned = get_pruned_routes(
+                pickup_coords, candidates, distances_km, deadline
+            )
+        else:
+            routes = get_candidate_routes(pickup_coords, candidates, deadline)
+        if size < len(nearest) and candidate_sizer.should_audit():
+            spare = get_candidate_routes(pickup_coords, nearest[size:], deadline)
+            routes = audit_candidate_set(nearest, size, routes, spare)
+            candidates, distances_km = nearest, nearest_km
+        return rank_routed(pickup_coords, candidates, distances_km, routes, pruned)
 
-    # Sort by distance and take only the N closest candidates
-    driver_distances.sort(key=lambda x: x[1])
-    candidates = [driver for driver, _ in driver_distances[:candidates_limit]]
 
-    pickup_coords = (pickup_address.longitude, pickup_address.latitude)
+def sized_candidates(pickup_address, candidates_limit=None):
+    """
+    Returns the closest available drivers, their straight-line distances
+    and how many of them to rank: all candidates_limit of them, or the
+    number candidate_sizer picks out of up to CANDIDATES_MAX.
+    """
+    with timed("candidates"):
+        candidates, distances_km = nearest_candidates(
+            pickup_address, candidates_limit or candidate_sizer.max_candidates
+        )
+    if candidates_limit:
+        size = len(candidates)
+    else:
+        size = candidate_sizer.size(distances_km)
+    routed_candidates.observe(size)
+    return candidates, distances_km, size
+
+
+def audit_candidate_set(candidates, size, routes, spare):
+    """
+    Records whether one of the candidates the sizing left out (all but the
+    first `size`, routed to `spare` for the audit) beats the routed ones.
+    Returns the routes of every candidate.
+    """
+    kept = [route[1] for route in routes.values() if route]
+    best = min(kept) if kept else None
+    beaten = [
+        (route[1], rank, driver)
+        for rank, driver in enumerate(candidates[size:], size + 1)
+        if best is not None and (route := spare.get(driver.id)) and route[1] < best
+    ]
+    candidate_sizer.record_audit(bool(beaten))
+    if beaten:
+        _, rank, driver = min(beaten, key=lambda x: x[:2])
+        logger.info(
+            "Fastest driver %s ranked %d by distance, outside the %d routed",
+            driver.id,
+            rank,
+            size,
+        )
+    return {**routes, **spare}
+
+
+def nearest_candidates(pickup_address, candidates_limit=10):
+    """
+    Returns the available drivers closest to the pickup address (with their
+    current address) and their straight-line distances in km, closest
+    first. Raises if there is none.
+    """
+    pickup_lat = pickup_address.latitude
+    pickup_lon = pickup_address.longitude
+
+    # Prefilter: take the N closest drivers by Haversine distance
+    nearest = nearest_available(pickup_lat, pickup_lon, candidates_limit)
+    nearest_ids = [driver_id for driver_id, _ in nearest]
+    straight_km = dict(nearest)
+
+    if not nearest_ids:
+        raise Exception("No available drivers")
+
+    # The index may lag behind other processes, so availability is re-checked
+    available_drivers = Driver.objects.filter(
+        id__in=nearest_ids, is_available=True, current_address__isnull=False
+    ).select_related("current_address")
+    drivers_by_id = {driver.id: driver for driver in available_drivers}
+    candidates = [
+        drivers_by_id[driver_id]
+        for driver_id in nearest_ids
+        if driver_id in drivers_by_id
+    ]
+
+    if not candidates:
+        raise Exception("No available drivers")
+
+    return candidates, [straight_km[driver.id] for driver in candidates]
+
+
+def rank_routed(pickup_coords, candidates, distances_km, routes, pruned=()):
+    """
+    Orders the routed candidates by duration, skipping the ones without a
+    route. Falls back to straight-line ranking when none could be routed.
+    The `pruned` candidates (see get_pruned_routes) follow the routed ones,
+    ordered by their local ETA model estimate, so claiming can still fall
+    through to them when every routed driver is taken.
+    """
+    # Stable sort: equal durations keep the Haversine order
+    ranked = [
+        (driver, *routes[driver.id]) for driver in candidates if routes.get(driver.id)
+    ]
+    ranked.sort(key=lambda x: x[2])
+
+    if not ranked:
+        logger.warning("No ORS route to any candidate, ranking by straight line")
+        return rank_with_eta_model(
+            pickup_coords, candidates, distances_km, refine_top=0
+        )
+
+    pruned_ids = {driver.id for driver in pruned}
+    rest = [
+        (driver, distance_km)
+        for driver, distance_km in zip(candidates, distances_km)
+        if driver.id in pruned_ids and not routes.get(driver.id)
+    ]
+    if rest:
+        drivers, rest_km = zip(*rest)
+        ranked += rank_with_eta_model(
+            pickup_coords, list(drivers), list(rest_km), refine_top=0
+        )
+    return ranked
+
+
+def rank_with_eta_model(
+    pickup_coords,
+    candidates,
+    distances_km,
+    refine_top=None,
+    deadline=None,
+    minutes=None,
+):
+    """
+    Ranks candidates with the local ETA model, without any network call,
+    and asks OpenRouteService only for the routes of the best refine_top
+    (ETA_REFINE_TOP) of them. Candidates ORS could not route keep their
+    local estimate, so an ORS outage degrades the ETAs instead of failing
+    the assignment. `minutes` may carry better local estimates (e.g. from
+    the travel grid); its NaN entries fall back to the ETA model.
+    Returns (driver, distance_km, duration_minutes) tuples, fastest first;
+    unrouted durations are LocalEstimates carrying their source.
+    """
+    if refine_top is None:
+        refine_top = getattr(settings, "ETA_REFINE_TOP", 2)
+    distances_km = np.asarray(distances_km, dtype=np.float64)
+    estimates = eta_model.estimate(distances_km, pickup_coords[1], pickup_coords[0])
+    if minutes is not None:
+        minutes = np.asarray(minutes, dtype=np.float64)
+        estimates = np.where(np.isnan(minutes), estimates, minutes)
+    sources = np.full(len(estimates), ServiceRequest.EtaSource.MODEL, dtype=object)
+    if minutes is not None:
+        sources[~np.isnan(minutes)] = ServiceRequest.EtaSource.GRID
+    minutes = estimates
+    order = np.argsort(minutes, kind="stable")
+
+    routes = {}
+    top = [candidates[i] for i in order[:refine_top]]
+    if top:
+        try:
+            routes = get_candidate_routes(pickup_coords, top, deadline)
+        except Exception as e:
+            logger.warning("ORS refinement failed, using local ETAs: %s", e)
+
+    ranked = []
+    for i in order:
+        driver = candidates[i]
+        if routes.get(driver.id):
+            ranked.append((driver, *routes[driver.id]))
+        else:
+            estimate = LocalEstimate(int(round(minutes[i])), sources[i])
+            ranked.append((driver, distances_km[i] * ETA_ROAD_FACTOR, estimate))
+    # Stable sort: refined routes may overtake each other or local estimates
+    ranked.sort(key=lambda x: x[2])
+    return ranked
 
-    def get_driver_route(driver):
+
+async def aget_candidate_routes(pickup_coords, candidates, deadline=None):
+    """
+    Async version of get_candidate_routes, awaiting the ORS requests on the
+    running event loop with the pooled `async_client`, and the shared route
+    cache tier with the async cache API.
+    """
+    routes = {}
+    pending = []
+    cached_routes = await asyncio.gather(
+        *(
+            route_cache.aget(pickup_coords, driver_coordinates(driver))
+            for driver in candidates
+        )
+    )
+    for driver, cached in zip(candidates, cached_routes):
+        if cached is not None:
+            routes[driver.id] = cached
+        else:
+            pending.append(driver)
+
+    if pending:
+        driver_coords = [driver_coordinates(driver) for driver in pending]
         try:
-            driver_coords = (
-                driver.current_address.longitude,
-                driver.current_address.latitude,
+            matrix = await aors.call(
+                lambda: async_client.distance_matrix(
+                    locations=[pickup_coords, *driver_coords],
+                    profile=ROUTE_PROFILE,
+                    sources=[0],
+                    destinations=list(range(1, len(pending) + 1)),
+                    metrics=["distance", "duration"],
+                ),
+                deadline,
             )
-            route = client.directions(
-                coordinates=[pickup_coords, driver_coords],
-                profile="cycling-road",
-                format="geojson",
+            rows = zip(
+                pending, driver_coords, matrix["distances"][0], matrix["durations"][0]
             )
-            route_summary = route["features"][0]["properties"]["summary"]
-            if not route_summary:
-                return None
-
-            distance_km = route_summary["distance"] / 1000
-            duration_minutes = int(route_summary["duration"] / 60)
-            return (driver, distance_km, duration_minutes)
+            stored = []
+            for driver, coords, distance, duration in rows:
+                if distance is None or duration is None:
+                    continue
+                route = (distance / 1000, int(duration / 60))
+                stored.append(route_cache.aset(pickup_coords, coords, route))
+                routes[driver.id] = route
+            await asyncio.gather(*stored)
         except Exception as e:
-            raise RuntimeError(
-                f"Error calculating route for driver {driver.id if driver else 'unknown'}: {str(e)}"
-            )
+            logger.warning("ORS matrix request failed, using directions: %s", e)
+        pending = [driver for driver in pending if driver.id not in routes]
+
+    async def directions(driver):
+        route = await async_client.directions(
+            coordinates=[pickup_coords, driver_coordinates(driver)],
+            profile=ROUTE_PROFILE,
+            format="geojson",
+        )
+        summary = route["features"][0]["properties"]["summary"]
+        if not summary:
+            return None
+        result = (summary["distance"] / 1000, int(summary["duration"] / 60))
+        await route_cache.aset(pickup_coords, driver_coordinates(driver), result)
+        return result
+
+    if pending:
+        results, errors = await aors.call_many(
+            {
+                driver.id: (lambda driver=driver: directions(driver))
+                for driver in pending
+            },
+            deadline,
+        )
+        for driver_id, error in errors.items():
+            logger.warning("Skipping driver %s without a route: %s", driver_id, error)
+        routes.update(
+            (driver_id, route) for driver_id, route in results.items() if route
+        )
+
+    return routes
+
 
-    nearest_driver = None
-    min_distance = float("inf")
-    estimated_time_minutes = None
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-        futures = {
-            executor.submit(get_driver_route, driver): driver for driver in candidates
-        }
-
-        for future in concurrent.futures.as_completed(futures):
-            result = future.result()
-            if result:
-                driver, distance_km, duration_minutes = result
-                if (
-                    estimated_time_minutes is None
-                    or duration_minutes < estimated_time_minutes
-                ):
-                    nearest_driver = driver
-                    min_distance = distance_km
-                    estimated_time_minutes = duration_minutes
-
-    if nearest_driver is None:
-        raise Exception("No driver found with a valid route")
-
-    return nearest_driver, min_distance, estimated_time_minutes
+async def arank_nearest_drivers(pickup_address, candidates_limit=None):
+    """
+    Async version of rank_nearest_drivers for the ASGI creation view: the
+    route requests of all concurrent assignments wait on one event loop
+    instead of holding a thread each. The database lookups run in Django's
+    thread for sync code. Rankings that do not call ORS (travel grid, local
+    ETA model, in-process road graph) are CPU bound and simply run the sync
+    version in that thread.
+    """
+    if (
+        isinstance(client, LocalRoutingClient)
+        or get_travel_grid() is not None
+        or getattr(settings, "ETA_MODEL_RANKING", False)
+    ):
+        return await sync_to_async(rank_nearest_drivers)(
+            pickup_address, candidates_limit
+        )
+
+    nearest, nearest_km, size = await sync_to_async(sized_candidates)(
+        pickup_address, candidates_limit
+    )
+    candidates, distances_km = nearest[:size], nearest_km[:size]
+    pickup_coords = (pickup_address.longitude, pickup_address.latitude)
+    deadline = Deadline(getattr(settings, "ORS_ASSIGNMENT_DEADLINE_SECONDS", 3))
+    with timed("routing"):
+        routes = await aget_candidate_routes(pickup_coords, candidates, deadline)
+        if size < len(nearest) and candidate_sizer.should_audit():
+            spare = await aget_candidate_routes(pickup_coords, nearest[size:], deadline)
+            routes = audit_candidate_set(nearest, size, routes, spare)
+            candidates, distances_km = nearest, nearest_km
+    return await sync_to_async(rank_routed)(
+        pickup_coords, candidates, distances_km, routes
+    )
+
+
+def find_nearest_driver(pickup_address, candidates_limit=None):
+    """
+    Finds the nearest available driver based on pickup address.
+    Returns the (driver, distance_km, duration_minutes) of the best ranked
+    candidate from rank_nearest_drivers.
+    """
+    return rank_nearest_drivers(pickup_address, candidates_limit)[0]
@@ -0,0 +1,183 @@
+import asyncio
+import concurrent.futures
+import json
+import random
+import time
+from contextlib import ExitStack
+from unittest.mock import patch
+
+import numpy as np
+import openrouteservice
+from asgiref.sync import ThreadSensitiveContext
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from drivers.spatial_index import driver_index
+from services.benchmarks import LAT_RANGE, LON_RANGE, seed_volume
+from services.fake_ors import FakeORSServer
+from services.helpers import aors, ors, route_cache
+from services.ors_client import AsyncORSClient
+
+
+class Command(BaseCommand):
+    help = "Compare service creation throughput of the WSGI view and the async ASGI view under concurrent load"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=200,
+            help="Service requests created per mode",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=100,
+            help="Requests in flight at once in ASGI mode",
+        )
+        parser.add_argument(
+            "--wsgi-threads",
+            type=int,
+            default=8,
+            help="Worker threads of the WSGI mode, as in a threaded server",
+        )
+        parser.add_argument("--drivers", type=int, default=2000)
+        parser.add_argument(
+            "--ors-latency",
+            type=float,
+            default=0.2,
+            help="Fixed latency of the fake ORS server in seconds",
+        )
+        parser.add_argument("--mode", choices=["wsgi", "asgi", "both"], default="both")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        # Seed and measure in a throwaway test database, never the real one
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            # Every request claims a driver, so there must be enough for all
+            users = seed_volume(
+                services=0,
+                drivers=max(options["drivers"], 2 * options["requests"]),
+                clients=1,
+                seed=options["seed"],
+            )
+            token = RefreshToken.for_user(users["client"]).access_token
+            self.auth = {"Authorization": f"Bearer {token}"}
+            self.rng = random.Random(options["seed"])
+
+            modes = ["wsgi", "asgi"] if options["mode"] == "both" else [options["mode"]]
+            report = {}
+            with ExitStack() as stack:
+                fake = stack.enter_context(
+                    FakeORSServer(latency=options["ors_latency"])
+                )
+                stack.enter_context(
+                    patch(
+                        "services.helpers.client",
+                        openrouteservice.Client(
+                            base_url=fake.url, retry_over_query_limit=False
+                        ),
+                    )
+                )
+                stack.enter_context(
+                    patch(
+                        "services.helpers.async_client",
+                        AsyncORSClient(base_url=fake.url),
+                    )
+                )
+                for mode in modes:
+                    driver_index.clear()
+                    route_cache.clear()
+                    ors.reset()
+                    aors.reset()
+                    run = self.run_wsgi if mode == "wsgi" else self.run_asgi
+                    start = time.perf_counter()
+                    timings, statuses = run(options)
+                    elapsed = time.perf_counter() - start
+                    report[mode] = {
+                        "throughput": len(timings) / elapsed,
+                        "p50_ms": float(np.percentile(timings, 50)),
+                        "p95_ms": float(np.percentile(timings, 95)),
+                        "p99_ms": float(np.percentile(timings, 99)),
+                        "status": dict(sorted(statuses.items())),
+                    }
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(
+            f"{'mode':<6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  status"
+        )
+        for mode, row in report.items():
+            self.stdout.write(
+                f"{mode:<6} {row['throughput']:>8.1f} {row['p50_ms']:>9.1f} "
+                f"{row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f}  {json.dumps(row['status'])}"
+            )
+
+    def payload(self):
+        return {
+            "pickup_address": {
+                "street": "Benchmark pickup",
+                "city": "Bogotá",
+                "latitude": self.rng.uniform(*LAT_RANGE),
+                "longitude": self.rng.uniform(*LON_RANGE),
+            }
+        }
+
+    def run_wsgi(self, options):
+        url = reverse("service-list-create")
+        payloads = [self.payload() for _ in range(options["requests"])]
+
+        def create(payload):
+            start = time.perf_counter()
+            try:
+                response = Client(raise_request_exception=False).post(
+                    url, payload, content_type="application/json", headers=self.auth
+                )
+            finally:
+                # Servers close the connection at the end of each request
+                connection.close()
+            return (time.perf_counter() - start) * 1000, response.status_code
+
+        with concurrent.futures.ThreadPoolExecutor(options["wsgi_threads"]) as executor:
+            results = list(executor.map(create, payloads))
+        return self.summarize(results)
+
+    def run_asgi(self, options):
+        url = reverse("service-create-async")
+        payloads = [self.payload() for _ in range(options["requests"])]
+
+        async def create(client, semaphore, payload):
+            async with semaphore:
+                # Like ASGIHandler: each request gets its own thread for sync code
+                # and its own database connection, dropped with the thread
+                async with ThreadSensitiveContext():
+                    start = time.perf_counter()
+                    response = await client.post(
+                        url, payload, content_type="application/json", headers=self.auth
+                    )
+                    return (time.perf_counter() - start) * 1000, response.status_code
+
+        async def main():
+            client = AsyncClient(raise_request_exception=False)
+            semaphore = asyncio.Semaphore(options["concurrency"])
+            return await asyncio.gather(
+                *(create(client, semaphore, payload) for payload in payloads)
+            )
+
+        # The event loop gets a thread of its own, as under an ASGI server, so
+        # requests never see the connection this thread seeded the data with
+        with concurrent.futures.ThreadPoolExecutor(1) as loop_thread:
+            return self.summarize(loop_thread.submit(asyncio.run, main()).result())
+
+    def summarize(self, results):
+        statuses = {}
+        for _, status in results:
+            statuses[status] = statuses.get(status, 0) + 1
+        return [timing for timing, _ in results], statuses
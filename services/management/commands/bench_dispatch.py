@@ -0,0 +1,114 @@
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from addresses import geohash
+from services.dispatch import solve_assignment
+from services.helpers import haversine_many, top_k_indices
+
+# Same travel model as services.fake_ors.FakeORSServer
+ROAD_FACTOR = 1.3
+SPEED_KMH = 15.0
+
+
+class Command(BaseCommand):
+    help = "Compare greedy and batched dispatch on a simulated burst of requests"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--drivers", type=int, default=500)
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=200,
+            help="Requests arriving within one dispatch window",
+        )
+        parser.add_argument("--candidates", type=int, default=5)
+        parser.add_argument("--group-size", type=int, default=8)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        k = options["candidates"]
+        # Same bounding box used by seed_data
+        drivers = np.array(
+            [
+                (rng.uniform(4.5, 4.9), rng.uniform(-74.2, -74.1))
+                for _ in range(options["drivers"])
+            ]
+        )
+        pickups = np.array(
+            [
+                (rng.uniform(4.5, 4.9), rng.uniform(-74.2, -74.1))
+                for _ in range(options["requests"])
+            ]
+        )
+
+        def eta(pickup, driver_rows):
+            km = haversine_many(
+                pickup[0], pickup[1], drivers[driver_rows, 0], drivers[driver_rows, 1]
+            )
+            return km * ROAD_FACTOR / SPEED_KMH * 60
+
+        # Greedy: each request takes the best of its k nearest free drivers
+        started = time.perf_counter()
+        free = np.ones(len(drivers), dtype=bool)
+        greedy_etas = []
+        for pickup in pickups:
+            free_rows = np.flatnonzero(free)
+            if not len(free_rows):
+                break
+            distances = haversine_many(
+                pickup[0], pickup[1], drivers[free_rows, 0], drivers[free_rows, 1]
+            )
+            candidates = free_rows[top_k_indices(distances, k)]
+            etas = eta(pickup, candidates)
+            best = int(np.argmin(etas))
+            free[candidates[best]] = False
+            greedy_etas.append(etas[best])
+        greedy_seconds = time.perf_counter() - started
+        greedy_routes = len(pickups) * k
+
+        # Batch: one cost matrix over every request's k nearest drivers
+        started = time.perf_counter()
+        nearest = [
+            top_k_indices(haversine_many(p[0], p[1], drivers[:, 0], drivers[:, 1]), k)
+            for p in pickups
+        ]
+        columns = np.unique(np.concatenate(nearest))
+        costs = np.full((len(pickups), len(columns)), np.inf)
+        for row, (pickup, rows) in enumerate(zip(pickups, nearest)):
+            costs[row, np.searchsorted(columns, rows)] = eta(pickup, rows)
+        batch_etas = [costs[row, col] for row, col in solve_assignment(costs)]
+        batch_seconds = time.perf_counter() - started
+        # Matrix elements when nearby pickups are routed in groups, as
+        # services.dispatch does
+        order = sorted(
+            range(len(pickups)), key=lambda row: geohash.encode(*pickups[row])
+        )
+        batch_routes = 0
+        for start in range(0, len(order), options["group_size"]):
+            group = order[start : start + options["group_size"]]
+            batch_routes += len(group) * len(
+                np.unique(np.concatenate([nearest[row] for row in group]))
+            )
+
+        self.stdout.write(
+            f"{'mode':<8} {'assigned':>9} {'mean ETA':>9} {'p95 ETA':>8} "
+            f"{'req/s':>10} {'routes':>8}"
+        )
+        for mode, etas, seconds, routes in (
+            ("greedy", greedy_etas, greedy_seconds, greedy_routes),
+            ("batch", batch_etas, batch_seconds, batch_routes),
+        ):
+            self.stdout.write(
+                f"{mode:<8} {len(etas):>9} {np.mean(etas):>9.2f} "
+                f"{np.percentile(etas, 95):>8.2f} {len(pickups) / seconds:>10.0f} "
+                f"{routes:>8}"
+            )
+        self.stdout.write(
+            "ETAs in minutes; req/s excludes routing latency; routes counts "
+            "matrix elements (greedy: one matrix per request, batch: one per group "
+            "of nearby requests)."
+        )
@@ -0,0 +1,87 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from services.benchmarks import (
+    EndpointBenchmark,
+    compare_reports,
+    over_budget,
+    seed_volume,
+)
+
+
+class Command(BaseCommand):
+    help = "Measure query counts and p50/p95 latency of every endpoint on seeded data"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--services", type=int, default=2000)
+        parser.add_argument("--drivers", type=int, default=500)
+        parser.add_argument("--clients", type=int, default=50)
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument(
+            "--ors-latency",
+            type=float,
+            default=0.05,
+            help="Fixed latency of the fake ORS server in seconds",
+        )
+        parser.add_argument("--output", help="Write the JSON report to this file")
+        parser.add_argument(
+            "--compare", help="JSON report of a previous run to diff against"
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        # Seed and measure in a throwaway test database, never the real one
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            users = seed_volume(
+                services=options["services"],
+                drivers=options["drivers"],
+                clients=options["clients"],
+                seed=options["seed"],
+            )
+            report = EndpointBenchmark(
+                users,
+                iterations=options["iterations"],
+                ors_latency=options["ors_latency"],
+                seed=options["seed"],
+            ).run()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(
+            f"{'endpoint':<20} {'queries':>8} {'budget':>7} {'p50 ms':>9} {'p95 ms':>9}"
+        )
+        for name, row in report.items():
+            if name.startswith("_"):
+                continue
+            self.stdout.write(
+                f"{name:<20} {row['queries']:>8} {row['budget']:>7} "
+                f"{row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f}"
+            )
+
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                baseline = json.load(f)
+            self.stdout.write(
+                f"\n{'endpoint':<20} {'queries':>10} {'p50 ms':>18} {'p95 ms':>18}"
+            )
+            for name, before, after in compare_reports(baseline, report):
+                self.stdout.write(
+                    f"{name:<20} {before['queries']:>4} -> {after['queries']:<3} "
+                    f"{before['p50_ms']:>8.2f} -> {after['p50_ms']:<8.2f}"
+                    f"{before['p95_ms']:>8.2f} -> {after['p95_ms']:<8.2f}"
+                )
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
+
+        failed = over_budget(report)
+        if failed:
+            raise CommandError(f"Over query budget: {', '.join(failed)}")
@@ -0,0 +1,123 @@
+import random
+import time
+from contextlib import ExitStack
+from unittest.mock import patch
+
+import numpy as np
+import openrouteservice
+from django.core.management.base import BaseCommand, CommandError
+
+from drivers.models import Driver
+from drivers.spatial_index import driver_index
+from services.fake_ors import FakeORSServer
+from services.helpers import get_candidate_routes, rank_with_eta_model, route_cache
+
+
+class Command(BaseCommand):
+    help = "Compare ranking with the local ETA model against pure ORS: accuracy and latency"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pickups", type=int, default=50)
+        parser.add_argument("--candidates", type=int, default=10)
+        parser.add_argument("--refine-top", type=int, default=2)
+        parser.add_argument(
+            "--fake-ors-latency",
+            type=float,
+            help="Route against a local fake ORS answering after this many seconds "
+            "instead of the configured server",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        with ExitStack() as stack:
+            if options["fake_ors_latency"] is not None:
+                fake = stack.enter_context(
+                    FakeORSServer(latency=options["fake_ors_latency"])
+                )
+                stack.enter_context(
+                    patch(
+                        "services.helpers.client",
+                        openrouteservice.Client(
+                            base_url=fake.url, retry_over_query_limit=False
+                        ),
+                    )
+                )
+            rows = [self.compare(rng, options) for _ in range(options["pickups"])]
+        rows = [row for row in rows if row]
+        if not rows:
+            raise CommandError("No available drivers, run seed_data first")
+
+        ors_ms, local_ms, local_only_ms, errors, agree, regret = (
+            np.array(column) for column in zip(*rows)
+        )
+        self.stdout.write(f"{'method':>8} {'p50 ms':>9} {'p95 ms':>9}")
+        refined = f"local+{options['refine_top']}"
+        for name, timings in (
+            ("ors", ors_ms),
+            (refined, local_ms),
+            ("local", local_only_ms),
+        ):
+            self.stdout.write(
+                f"{name:>8} {np.percentile(timings, 50):>9.2f} {np.percentile(timings, 95):>9.2f}"
+            )
+        self.stdout.write(
+            f"\nlocal ETA error vs ORS: mean {errors.mean():.2f} min, "
+            f"p95 {np.percentile(errors, 95):.2f} min\n"
+            f"best ORS driver chosen by {refined}: {agree.mean():.0%} of pickups, "
+            f"mean extra ETA when not: {regret[~agree].mean() if (~agree).any() else 0:.2f} min"
+        )
+
+    def compare(self, rng, options):
+        # Same bounding box used by seed_data
+        latitude, longitude = rng.uniform(4.5, 4.9), rng.uniform(-74.2, -74.1)
+        nearest = driver_index.nearest(latitude, longitude, options["candidates"])
+        drivers = Driver.objects.select_related("current_address").in_bulk(
+            [driver_id for driver_id, _ in nearest]
+        )
+        nearest = [
+            (drivers[driver_id], km)
+            for driver_id, km in nearest
+            if driver_id in drivers
+        ]
+        if not nearest:
+            return None
+        candidates, distances = zip(*nearest)
+        pickup = (longitude, latitude)
+
+        route_cache.clear()
+        start = time.perf_counter()
+        routes = get_candidate_routes(pickup, candidates)
+        ors_ms = (time.perf_counter() - start) * 1000
+
+        route_cache.clear()
+        start = time.perf_counter()
+        ranked = rank_with_eta_model(
+            pickup, candidates, distances, options["refine_top"]
+        )
+        local_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        local = rank_with_eta_model(pickup, candidates, distances, refine_top=0)
+        local_only_ms = (time.perf_counter() - start) * 1000
+
+        routed = [driver for driver in candidates if routes.get(driver.id)]
+        best = min(routed, key=lambda driver: routes[driver.id][1])
+        chosen = ranked[0][0]
+        errors = [
+            abs(minutes - routes[driver.id][1])
+            for driver, _, minutes in local
+            if routes.get(driver.id)
+        ]
+        regret = (
+            routes[chosen.id][1] - routes[best.id][1] if routes.get(chosen.id) else 0
+        )
+        # Ties on ORS minutes count as the same choice
+        return (
+            ors_ms,
+            local_ms,
+            local_only_ms,
+            float(np.mean(errors)),
+            regret == 0,
+            regret,
+        )
@@ -0,0 +1,63 @@
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from services.helpers import haversine_distance, haversine_many, top_k_indices
+
+
+class Command(BaseCommand):
+    help = "Compare the scalar and vectorized Haversine prefilters"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            default="10,100,1000,10000,100000",
+            help="Comma separated numbers of drivers to benchmark",
+        )
+        parser.add_argument("--candidates", type=int, default=10)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options["sizes"].split(",")]
+        k = options["candidates"]
+        pickup_lat, pickup_lon = 4.693408, -74.112279
+
+        self.stdout.write(
+            f"{'drivers':>10} {'scalar ms':>12} {'numpy ms':>12} {'speedup':>9}"
+        )
+        for size in sizes:
+            # Same bounding box used by seed_data
+            lats = [random.uniform(4.5, 4.9) for _ in range(size)]
+            lons = [random.uniform(-74.2, -74.1) for _ in range(size)]
+
+            def scalar():
+                distances = [
+                    (i, haversine_distance(pickup_lat, pickup_lon, lat, lon))
+                    for i, (lat, lon) in enumerate(zip(lats, lons))
+                ]
+                distances.sort(key=lambda x: x[1])
+                return [i for i, _ in distances[:k]]
+
+            def vectorized():
+                # Includes the list -> array conversion values_list rows need
+                distances = haversine_many(
+                    pickup_lat, pickup_lon, np.asarray(lats), np.asarray(lons)
+                )
+                return top_k_indices(distances, k).tolist()
+
+            assert scalar() == vectorized()
+            scalar_ms = self.best_of(scalar, options["repeat"])
+            numpy_ms = self.best_of(vectorized, options["repeat"])
+            self.stdout.write(
+                f"{size:>10} {scalar_ms:>12.3f} {numpy_ms:>12.3f} {scalar_ms / numpy_ms:>8.1f}x"
+            )
+
+    def best_of(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        return min(timings)
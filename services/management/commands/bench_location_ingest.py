@@ -0,0 +1,69 @@
+import io
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from drivers.ingest import BINARY_RECORD, ingest_locations, parse_binary, parse_ndjson
+from drivers.location import update_driver_location
+from drivers.models import Driver
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare per-ping updates with the chunked bulk location ingest (rolled back)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--records", type=int, default=10000)
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        driver_ids = list(Driver.objects.values_list("id", flat=True))
+        if not driver_ids:
+            raise CommandError("No drivers found, run seed_data first")
+
+        rng = random.Random(options["seed"])
+        # Same bounding box used by seed_data
+        records = [
+            (
+                rng.choice(driver_ids),
+                rng.uniform(4.5, 4.9),
+                rng.uniform(-74.2, -74.1),
+                2e9 + i,
+            )
+            for i in range(options["records"])
+        ]
+        ndjson = b"\n".join(
+            json.dumps({"driver_id": d, "lat": lat, "lon": lon, "ts": ts}).encode()
+            for d, lat, lon, ts in records
+        )
+        binary = b"".join(BINARY_RECORD.pack(*record) for record in records)
+
+        def pings():
+            for driver_id, lat, lon, _ in records:
+                update_driver_location(driver_id, lat, lon)
+
+        def bulk(parser, body):
+            return lambda: ingest_locations(
+                parser(io.BytesIO(body)), chunk_size=options["chunk_size"]
+            )
+
+        self.stdout.write(f"{'mode':>10} {'seconds':>9} {'records/s':>11}")
+        for name, func in [
+            ("pings", pings),
+            ("ndjson", bulk(parse_ndjson, ndjson)),
+            ("binary", bulk(parse_binary, binary)),
+        ]:
+            # Every run starts from the same state and leaves no trace
+            with transaction.atomic():
+                start = time.perf_counter()
+                func()
+                elapsed = time.perf_counter() - start
+                transaction.set_rollback(True)
+            self.stdout.write(
+                f"{name:>10} {elapsed:>9.3f} {len(records) / elapsed:>11.0f}"
+            )
@@ -0,0 +1,112 @@
+import random
+import time
+from contextlib import ExitStack
+
+import numpy as np
+import openrouteservice
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from services import helpers
+from services.fake_ors import FakeORSServer
+from services.helpers import ROUTE_PROFILE
+from services.road_graph import LocalRoutingClient
+
+
+class Command(BaseCommand):
+    help = "Compare the local road graph against ORS: matrix latency and ETA agreement"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--graph", default=settings.ROAD_GRAPH_PATH)
+        parser.add_argument("--pickups", type=int, default=50)
+        parser.add_argument("--candidates", type=int, default=10)
+        parser.add_argument(
+            "--radius-km",
+            type=float,
+            default=3.0,
+            help="Candidates are drawn within this distance of the pickup",
+        )
+        parser.add_argument(
+            "--fake-ors-latency",
+            type=float,
+            help="Compare against a local fake ORS answering after this many seconds "
+            "instead of the configured server",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        local = LocalRoutingClient(options["graph"])
+        graph = local.graph
+        with ExitStack() as stack:
+            if options["fake_ors_latency"] is not None:
+                fake = stack.enter_context(
+                    FakeORSServer(latency=options["fake_ors_latency"])
+                )
+                ors = openrouteservice.Client(
+                    base_url=fake.url, retry_over_query_limit=False
+                )
+            elif isinstance(helpers.client, LocalRoutingClient):
+                ors = openrouteservice.Client(
+                    key=helpers.ORS_API_KEY, base_url=helpers.ORS_BASE_URL
+                )
+            else:
+                ors = helpers.client
+
+            timings = {"ors": [], "graph": []}
+            errors, agree = [], []
+            for _ in range(options["pickups"]):
+                # Pickups and candidates on the graph's own nodes, so both
+                # backends can route every pair
+                nodes = rng.sample(range(len(graph)), 1)
+                pickup = (graph.longitudes[nodes[0]], graph.latitudes[nodes[0]])
+                near = np.flatnonzero(
+                    np.hypot(
+                        (graph.latitudes - pickup[1]) * 111,
+                        (graph.longitudes - pickup[0]) * 111,
+                    )
+                    <= options["radius_km"]
+                )
+                picks = rng.sample(list(near), min(options["candidates"], len(near)))
+                locations = [pickup] + [
+                    (graph.longitudes[i], graph.latitudes[i]) for i in picks
+                ]
+                durations = {}
+                for name, backend in (("ors", ors), ("graph", local)):
+                    start = time.perf_counter()
+                    matrix = backend.distance_matrix(
+                        locations=locations,
+                        profile=ROUTE_PROFILE,
+                        sources=[0],
+                        destinations=list(range(1, len(locations))),
+                        metrics=["distance", "duration"],
+                    )
+                    timings[name].append((time.perf_counter() - start) * 1000)
+                    durations[name] = np.array(
+                        [
+                            np.nan if d is None else d / 60
+                            for d in matrix["durations"][0]
+                        ]
+                    )
+
+                both = ~np.isnan(durations["ors"]) & ~np.isnan(durations["graph"])
+                if both.any():
+                    errors.extend(
+                        np.abs(durations["ors"][both] - durations["graph"][both])
+                    )
+                    agree.append(
+                        np.nanargmin(np.where(both, durations["ors"], np.nan))
+                        == np.nanargmin(np.where(both, durations["graph"], np.nan))
+                    )
+
+        self.stdout.write(f"{'backend':>8} {'p50 ms':>9} {'p95 ms':>9}")
+        for name, values in timings.items():
+            self.stdout.write(
+                f"{name:>8} {np.percentile(values, 50):>9.2f} {np.percentile(values, 95):>9.2f}"
+            )
+        errors = np.array(errors)
+        self.stdout.write(
+            f"\ngraph ETA difference vs ORS: mean {errors.mean():.2f} min, "
+            f"p95 {np.percentile(errors, 95):.2f} min\n"
+            f"same fastest candidate: {np.mean(agree):.0%} of pickups"
+        )
@@ -0,0 +1,29 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from services.road_graph import RoadGraph
+
+
+class Command(BaseCommand):
+    help = "Build the in-process routing graph (ROUTING_BACKEND=graph) from an OSM XML extract"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "input", help="OSM XML extract of the service area, e.g. bogota.osm"
+        )
+        parser.add_argument(
+            "--output",
+            default=settings.ROAD_GRAPH_PATH,
+            help="Where to write the graph (default: ROAD_GRAPH_PATH)",
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        graph = RoadGraph.from_osm(options["input"])
+        graph.save(options["output"])
+        self.stdout.write(
+            f"Wrote {len(graph)} nodes and {len(graph.indices)} edges to {options['output']} "
+            f"in {time.perf_counter() - start:.1f}s"
+        )
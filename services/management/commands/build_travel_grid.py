@@ -0,0 +1,95 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from services import helpers
+from services.helpers import ROUTE_PROFILE, ors
+from services.travel_grid import TravelGrid, UNREACHABLE, build_travel_grid
+
+
+def route_seconds(origins, destinations):
+    """
+    Travel seconds between (longitude, latitude) points with the configured
+    routing backend, NaN where there is no route.
+    """
+    locations = [tuple(point) for point in (*origins, *destinations)]
+    matrix = ors.call(
+        lambda: helpers.client.distance_matrix(
+            locations=locations,
+            profile=ROUTE_PROFILE,
+            sources=list(range(len(origins))),
+            destinations=list(range(len(origins), len(locations))),
+            metrics=["duration"],
+        ),
+        hedge=False,
+    )
+    return np.array(
+        [
+            [np.nan if value is None else value for value in row]
+            for row in matrix["durations"]
+        ],
+        dtype=np.float64,
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Precompute the cell-to-cell travel time grid used to score candidate drivers"
+    )
+
+    def add_arguments(self, parser):
+        # Same bounding box used by seed_data
+        parser.add_argument("--south", type=float, default=4.5)
+        parser.add_argument("--north", type=float, default=4.9)
+        parser.add_argument("--west", type=float, default=-74.2)
+        parser.add_argument("--east", type=float, default=-74.1)
+        parser.add_argument(
+            "--cell-degrees",
+            type=float,
+            default=0.005,
+            help="Cell side in degrees (0.005 is ~550 m)",
+        )
+        parser.add_argument(
+            "--output",
+            default=getattr(settings, "TRAVEL_GRID_PATH", None),
+            help="Where to write the grid (default: TRAVEL_GRID_PATH)",
+        )
+
+    def handle(self, *args, **options):
+        if not options["output"]:
+            raise CommandError("Set TRAVEL_GRID_PATH or pass --output")
+        if options["south"] >= options["north"] or options["west"] >= options["east"]:
+            raise CommandError("Empty bounding box")
+
+        cells = len(
+            TravelGrid(
+                None,
+                options["south"],
+                options["west"],
+                options["north"],
+                options["east"],
+                options["cell_degrees"],
+            )
+        )
+        # Stay under the per-request element limit of the matrix endpoint
+        max_elements = getattr(settings, "ORS_MATRIX_MAX_ELEMENTS", 3500)
+        self.stdout.write(f"Routing {cells} x {cells} cells...")
+        start = time.perf_counter()
+        grid = build_travel_grid(
+            options["output"],
+            route_seconds,
+            options["south"],
+            options["west"],
+            options["north"],
+            options["east"],
+            options["cell_degrees"],
+            rows_per_request=max(1, max_elements // cells),
+        )
+        reachable = np.count_nonzero(np.asarray(grid.times) != UNREACHABLE)
+        self.stdout.write(
+            f"Wrote {options['output']} ({grid.times.nbytes / 1e6:.1f} MB, "
+            f"{reachable / grid.times.size:.0%} of pairs routable) "
+            f"in {time.perf_counter() - start:.1f}s"
+        )
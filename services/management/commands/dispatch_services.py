@@ -0,0 +1,49 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from services.dispatch import dispatch_pending_batch
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Assign pending service requests in batches with a global matching"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--window",
+            type=float,
+            default=getattr(settings, "DISPATCH_WINDOW_SECONDS", 2.0),
+            help="Seconds to collect pending requests before each batch",
+        )
+        parser.add_argument(
+            "--max-batch",
+            type=int,
+            default=getattr(settings, "DISPATCH_MAX_BATCH", 100),
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Dispatch a single batch and exit"
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            try:
+                assigned = dispatch_pending_batch(max_batch=options["max_batch"])
+            except Exception:
+                # A failed batch rolls back and stays pending; the daemon
+                # keeps dispatching the next ones
+                logger.exception("Dispatch batch failed")
+                close_old_connections()
+                assigned = 0
+            if assigned:
+                self.stdout.write(f"Assigned {assigned} service request(s)")
+            if options["once"]:
+                return
+            # A full batch means there is a backlog, so skip the wait
+            if assigned < options["max_batch"]:
+                time.sleep(max(0.0, options["window"] - (time.monotonic() - started)))
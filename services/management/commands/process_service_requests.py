@@ -0,0 +1,68 @@
+import logging
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from services.service_request_management import process_pending_services
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Assign drivers to pending service requests"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Number of worker threads, each with its own DB connection",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait when the queue is empty",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Drain the queue once and exit"
+        )
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        workers = [
+            threading.Thread(target=self.work, args=(options, stop), daemon=True)
+            for _ in range(options["workers"])
+        ]
+        for worker in workers:
+            worker.start()
+
+        try:
+            for worker in workers:
+                while worker.is_alive():
+                    worker.join(timeout=0.5)
+        except KeyboardInterrupt:
+            stop.set()
+            for worker in workers:
+                worker.join()
+
+    def work(self, options, stop):
+        try:
+            while not stop.is_set():
+                try:
+                    assigned = process_pending_services()
+                except Exception:
+                    # The request being assigned stays pending; the worker
+                    # keeps draining the queue after the poll interval
+                    logger.exception("Processing pending services failed")
+                    close_old_connections()
+                    assigned = 0
+                if assigned:
+                    self.stdout.write(f"Assigned {assigned} service request(s)")
+                if options["once"]:
+                    return
+                if not assigned:
+                    stop.wait(options["poll_interval"])
+        finally:
+            connection.close()
@@ -0,0 +1,138 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from services.benchmarks import QUERY_BUDGETS, seed_volume
+from services.fake_ors import latency_distribution
+from services.traffic import TrafficReplay, generate_trace, read_trace
+
+
+class Command(BaseCommand):
+    help = "Replay a JSONL trace of pickups and completions against the real views and report throughput, latency, queries and driver utilization"
+
+    def add_arguments(self, parser):
+        parser.add_argument("trace", help="JSONL trace to replay")
+        parser.add_argument(
+            "--generate",
+            action="store_true",
+            help="Write a new synthetic trace to the trace path first",
+        )
+        parser.add_argument(
+            "--requests", type=int, default=1000, help="Pickups in a generated trace"
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=10.0,
+            help="Pickups per second in a generated trace",
+        )
+        parser.add_argument(
+            "--service-seconds",
+            type=float,
+            default=30.0,
+            help="Mean time from pickup to completion in a generated trace",
+        )
+        parser.add_argument("--drivers", type=int, default=500)
+        parser.add_argument(
+            "--concurrency", type=int, default=200, help="Requests in flight at most"
+        )
+        parser.add_argument(
+            "--speed",
+            type=float,
+            default=1.0,
+            help="Replay the trace this many times faster than recorded",
+        )
+        parser.add_argument(
+            "--view",
+            choices=["sync", "async"],
+            default="sync",
+            help="Creation view the pickups go to",
+        )
+        parser.add_argument(
+            "--ors-latency",
+            default="lognormal:0.08,0.5",
+            help="Fake ORS latency in seconds: 0.2, uniform:LOW,HIGH, "
+            "exponential:MEAN or lognormal:MEDIAN,SIGMA",
+        )
+        parser.add_argument("--output", help="Write the JSON report to this file")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            ors_latency = latency_distribution(options["ors_latency"], options["seed"])
+        except ValueError as e:
+            raise CommandError(e)
+        if options["generate"]:
+            count = generate_trace(
+                options["trace"],
+                requests=options["requests"],
+                rate=options["rate"],
+                service_seconds=options["service_seconds"],
+                seed=options["seed"],
+            )
+            self.stdout.write(f"Wrote {count} events to {options['trace']}")
+        try:
+            events = read_trace(options["trace"])
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read trace: {e}")
+
+        # Seed and replay in a throwaway test database, never the real one
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            users = seed_volume(
+                services=0, drivers=options["drivers"], clients=1, seed=options["seed"]
+            )
+            report = TrafficReplay(
+                users,
+                concurrency=options["concurrency"],
+                speed=options["speed"],
+                ors_latency=ors_latency,
+                view=options["view"],
+            ).run(events)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        budgets = {
+            "pickup": QUERY_BUDGETS[
+                (
+                    "services-create-async"
+                    if options["view"] == "async"
+                    else "services-create"
+                )
+            ],
+            "complete": QUERY_BUDGETS["services-complete"],
+        }
+        self.stdout.write(
+            f"{'event':<9} {'sent':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+            f"{'queries':>8} {'max':>4} {'budget':>7}  status"
+        )
+        for name in ("pickup", "complete"):
+            row = report[name]
+            if not row["requests"]:
+                self.stdout.write(f"{name:<9} {0:>6}")
+                continue
+            self.stdout.write(
+                f"{name:<9} {row['requests']:>6} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} "
+                f"{row['p99_ms']:>9.1f} {row['queries_mean']:>8.1f} {row['queries_max']:>4} "
+                f"{budgets[name]:>7}  {json.dumps(row['status'])}"
+            )
+        meta = report["_meta"]
+        self.stdout.write(
+            f"\n{meta['throughput']:.1f} req/s over {meta['elapsed_s']:.1f} s, "
+            f"driver utilization {meta['utilization_mean']:.1%} mean, "
+            f"{meta['utilization_peak']:.1%} peak of {meta['drivers']} drivers"
+        )
+        self.stdout.write(f"ORS calls: {json.dumps(meta['ors_calls'])}")
+        if report["complete"]["skipped"]:
+            self.stdout.write(
+                f"{report['complete']['skipped']} completions skipped, their pickup got no driver"
+            )
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"\nReport written to {options['output']}")
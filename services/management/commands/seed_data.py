@@ -1,63 +1,65 @@
-from faker import Faker
-from django.core.management.base import BaseCommand
-from addresses.models import Address
-from drivers.models import Driver
-from django.contrib.auth.models import User
-from users.models import UserProfile
-import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from services.seeding import BulkSeeder
+
 
 class Command(BaseCommand):
-    help = 'Create addresses and drivers with Faker'
-
-    def handle(self, *args, **kwargs):
-        calles_bogota = [
-            "Calle 45", "Calle 68", "Carrera 10", "Avenida El Dorado", "Avenida Boyacá",
-            "Calle 100", "Calle 13", "Calle 26", "Carrera 7", "Carrera 15", 
-            "Avenida Suba", "Avenida Caracas", "Avenida Ciudad de Cali", "Calle 80",
-            "Calle 53", "Calle 50", "Carrera 19", "Carrera 30", "Calle 170", 
-            "Calle 182", "Avenida Boyacá", "Avenida NQS", "Calle 39", "Calle 23",
-            "Calle 56", "Calle 92", "Calle 42", "Carrera 5", "Carrera 24"
-        ]
-        # Latitude and longitude range for Bogotá
-        lat_min, lat_max = 4.5, 4.9
-        lon_min, lon_max = -74.2, -74.1
-
-        fake = Faker('es_CO')
-
-        # Create 20 addresses
-        for _ in range(20):
-            street = f"{random.choice(calles_bogota)} {random.randint(1, 99)}"
-            lat = round(random.uniform(lat_min, lat_max), 6)  # Generar latitud
-            lon = round(random.uniform(lon_min, lon_max), 6)  # Generar longitud
-            address = Address.objects.create(
-                street=street,
-                city='Bogotá',
-                latitude=lat,
-                longitude=lon
-            )
-            self.stdout.write(f"Address created: {address}")
-
-        # Create 20 drivers
-        for _ in range(20):
-            # Create a random user
-            user = User.objects.create_user(
-                username=fake.user_name(),
-                password='password',
-                email=fake.email()
-            )
+    help = 'Create addresses, drivers, clients and service history in bulk'
 
-            # Create the user profile and mark as driver
-            user_profile, created = UserProfile.objects.get_or_create(
-                user=user,
-                defaults={'is_driver': True}  # Mark this user as a driver
-            )
+    def add_arguments(self, parser):
+        parser.add_argument('--addresses', type=int, default=20,
+                            help='Standalone addresses, besides those of drivers and services')
+        parser.add_argument('--drivers', type=int, default=20)
+        parser.add_argument('--clients', type=int, default=0)
+        parser.add_argument('--services', type=int, default=0,
+                            help='Completed or cancelled services in the history')
+        parser.add_argument('--busy-ratio', type=float, default=0.0,
+                            help='Share of drivers on an in-progress service (needs clients)')
+        parser.add_argument('--days', type=int, default=90,
+                            help='Days of history the services are spread over')
+        parser.add_argument('--hotspots', type=int, default=0,
+                            help='Cluster most coordinates around this many hotspots')
+        parser.add_argument('--chunk-size', type=int, default=10000,
+                            help='Rows inserted per statement')
+        parser.add_argument('--copy', action='store_true',
+                            help='Insert with COPY instead of bulk_create (PostgreSQL only)')
+        parser.add_argument('--password', default='password',
+                            help='Password of every created user')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['copy'] and connection.vendor != 'postgresql':
+            raise CommandError('--copy needs PostgreSQL')
+        verbose = options['verbosity'] > 1
+        seeder = BulkSeeder(
+            chunk_size=options['chunk_size'],
+            copy=options['copy'],
+            hotspots=options['hotspots'],
+            password=options['password'],
+            seed=options['seed'],
+            log=self.stdout.write if verbose else None,
+        )
 
-            # Create a driver and link to a random address
-            driver = Driver.objects.create(
-                user=user,  # Assign the User object, not the UserProfile
-                current_address=Address.objects.order_by('?').first(),  # Assign a random address
-                is_available=True
+        start = time.perf_counter()
+        try:
+            created = seeder.seed(
+                addresses=options['addresses'],
+                drivers=options['drivers'],
+                clients=options['clients'],
+                services=options['services'],
+                busy_ratio=options['busy_ratio'],
+                days=options['days'],
             )
+        except ValueError as e:
+            raise CommandError(e)
+        elapsed = time.perf_counter() - start
 
-            self.stdout.write(f"Driver created: {driver.user.username} with user profile as driver")
-            
+        for table, count in created.items():
+            self.stdout.write(f"{table:<28} {count:>10}")
+        rows = sum(created.values())
+        self.stdout.write(
+            f"{rows} rows in {elapsed:.1f} s ({rows / max(elapsed, 1e-9):.0f} rows/s)"
+        )
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from services.eta import train_eta_model
+from services.models import EtaSpeedFactor
+
+
+class Command(BaseCommand):
+    help = "Refit the local ETA speed factors from the service history (run periodically, e.g. from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=getattr(settings, "ETA_TRAINING_DAYS", 30),
+            help="Train on the service requests of the last DAYS days",
+        )
+        parser.add_argument(
+            "--min-samples",
+            type=int,
+            default=getattr(settings, "ETA_MIN_SAMPLES", 20),
+            help="Samples a zone/slot needs to get its own factor",
+        )
+
+    def handle(self, *args, **options):
+        samples = train_eta_model(
+            days=options["days"], min_samples=options["min_samples"]
+        )
+        if not samples:
+            self.stdout.write(
+                "No completed service requests to train on, factors left unchanged"
+            )
+            return
+
+        factors = EtaSpeedFactor.objects.count()
+        overall = EtaSpeedFactor.objects.get(zone="", slot__isnull=True)
+        self.stdout.write(
+            f"Trained {factors} speed factors on {samples} samples "
+            f"(overall {overall.minutes_per_km:.2f} min/km)"
+        )
@@ -0,0 +1,37 @@
+# Generated by Django 4.2 on 2026-10-18 18:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0002_servicerequest_client'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='servicerequest',
+            index=models.Index(
+                fields=['status', 'created_at'], name='service_status_created_idx'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='servicerequest',
+            index=models.Index(
+                fields=['assigned_driver', 'status'], name='service_driver_status_idx'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='servicerequest',
+            index=models.Index(
+                fields=['-created_at', '-id'], name='service_created_idx'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='servicerequest',
+            index=models.Index(
+                fields=['client', '-created_at'], name='service_client_created_idx'
+            ),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2 on 2026-10-18 18:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0003_servicerequest_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EtaSpeedFactor',
+            fields=[
+                (
+                    'id',
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                ('zone', models.CharField(blank=True, max_length=12)),
+                ('slot', models.SmallIntegerField(blank=True, null=True)),
+                ('minutes_per_km', models.FloatField()),
+                ('samples', models.IntegerField()),
+                ('trained_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='servicerequest',
+            name='pickup_distance_km',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='etaspeedfactor',
+            constraint=models.UniqueConstraint(
+                fields=('zone', 'slot'), name='eta_factor_zone_slot_uniq'
+            ),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2 on 2026-10-18 20:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0004_eta_model'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='servicerequest',
+            name='eta_source',
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ('routed', 'Routed'),
+                    ('grid', 'Travel grid'),
+                    ('model', 'ETA model'),
+                ],
+                max_length=10,
+                null=True,
+            ),
+        ),
+    ]
@@ -11,16 +11,74 @@ class ServiceRequest(models.Model):
         COMPLETED = "completed", "Completed"
         CANCELLED = "cancelled", "Cancelled"
 
+    class EtaSource(models.TextChoices):
+        # A route from ORS or the road graph
+        ROUTED = "routed", "Routed"
+        # The precomputed travel grid
+        GRID = "grid", "Travel grid"
+        # The local ETA model, when no route was asked for or ORS was down
+        MODEL = "model", "ETA model"
+
     client = models.ForeignKey(User, on_delete=models.CASCADE)
     pickup_address = models.ForeignKey(Address, on_delete=models.CASCADE)
     assigned_driver = models.ForeignKey(
         Driver, on_delete=models.SET_NULL, null=True, blank=True
     )
     estimated_time_minutes = models.IntegerField(null=True, blank=True)
+    # Where estimated_time_minutes came from; the local ETA model only trains
+    # on routed ones, never on its own estimates
+    eta_source = models.CharField(
+        max_length=10, choices=EtaSource.choices, null=True, blank=True
+    )
+    # Straight-line distance from the driver at assignment time; pairs with
+    # estimated_time_minutes as training data for the local ETA model
+    pickup_distance_km = models.FloatField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     status = models.CharField(
         max_length=20, choices=Status.choices, default=Status.PENDING
     )
 
+    class Meta:
+        indexes = [
+            # Pending queue (oldest first) and the list filtered by status
+            models.Index(
+                fields=["status", "created_at"], name="service_status_created_idx"
+            ),
+            # Completion checks and the list filtered by driver
+            models.Index(
+                fields=["assigned_driver", "status"], name="service_driver_status_idx"
+            ),
+            # Keyset pagination of the whole history and of one client's
+            models.Index(fields=["-created_at", "-id"], name="service_created_idx"),
+            models.Index(
+                fields=["client", "-created_at"], name="service_client_created_idx"
+            ),
+        ]
+
     def __str__(self):
         return f"Service {self.id} - {self.status}"
+
+
+class EtaSpeedFactor(models.Model):
+    """
+    Minutes per straight-line kilometre learned from the service history by
+    `manage.py train_eta_model`. An empty zone or a null slot is the
+    fallback over every zone or every time of day.
+    """
+
+    zone = models.CharField(max_length=12, blank=True)
+    slot = models.SmallIntegerField(null=True, blank=True)
+    minutes_per_km = models.FloatField()
+    samples = models.IntegerField()
+    trained_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["zone", "slot"], name="eta_factor_zone_slot_uniq"
+            ),
+        ]
+
+    def __str__(self):
+        slot = "*" if self.slot is None else self.slot
+        return f"{self.zone or '*'}/{slot}: {self.minutes_per_km:.2f} min/km"
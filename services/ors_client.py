@@ -0,0 +1,601 @@
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+import weakref
+
+import httpx
+import openrouteservice
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class RoutingError(Exception):
+    pass
+
+
+class CircuitOpen(RoutingError):
+    pass
+
+
+class DeadlineExceeded(RoutingError):
+    pass
+
+
+class QueueFull(RoutingError):
+    pass
+
+
+class Deadline:
+    """
+    Time budget shared by every routing request of one assignment.
+    A deadline of None seconds never expires.
+    """
+
+    def __init__(self, seconds=None):
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+
+    def remaining(self):
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() == 0.0
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing service. After `threshold` consecutive failures
+    the circuit opens and every call is refused for `cooldown` seconds; then
+    a single trial call is let through, which closes the circuit again on
+    success or reopens it on failure.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, threshold=None, cooldown=None):
+        self.threshold = threshold or getattr(settings, "ORS_BREAKER_THRESHOLD", 5)
+        self.cooldown = cooldown or getattr(
+            settings, "ORS_BREAKER_COOLDOWN_SECONDS", 30
+        )
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def allow(self):
+        """
+        Returns whether a call may be made now.
+        """
+        with self._lock:
+            if (
+                self.state == self.OPEN
+                and time.monotonic() - self._opened_at >= self.cooldown
+            ):
+                self.state = self.HALF_OPEN
+                self._trial = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self.failures >= self.threshold
+            ):
+                if self.state == self.CLOSED:
+                    logger.warning(
+                        "Opening the ORS circuit after %d consecutive failures",
+                        self.failures,
+                    )
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial = False
+
+
+class BaseRoutingClient:
+    """
+    Hedging settings, circuit breaker and call counters shared by the
+    thread-based and the asyncio routing clients.
+    """
+
+    def __init__(self, hedge_after=None, breaker=None):
+        self.hedge_after = (
+            hedge_after
+            if hedge_after is not None
+            else getattr(settings, "ORS_HEDGE_AFTER_SECONDS", 0.5)
+        )
+        self.breaker = breaker or CircuitBreaker()
+        self._lock = threading.Lock()
+        self._reset_counters()
+
+    def _reset_counters(self):
+        self.counters = dict.fromkeys(
+            (
+                "calls",
+                "failures",
+                "timeouts",
+                "short_circuits",
+                "hedges",
+                "hedge_wins",
+                "pruned",
+                "abandoned",
+            ),
+            0,
+        )
+
+    def _count(self, counter, amount=1):
+        with self._lock:
+            self.counters[counter] += amount
+
+    def record_pruned(self, count):
+        """
+        Counts candidates the caller chose not to route, as `pruned`.
+        """
+        self._count("pruned", count)
+
+    def _next_wait(self, deadline, pending_keys, started, hedge_after):
+        # Wakes up at the deadline or when the next call is due for a hedge
+        timeout = deadline.remaining()
+        unhedged = [
+            started[key] + hedge_after - time.monotonic()
+            for key in pending_keys
+            if started[key] is not None
+        ]
+        if hedge_after and unhedged:
+            next_hedge = max(0.0, min(unhedged))
+            timeout = next_hedge if timeout is None else min(timeout, next_hedge)
+        return timeout
+
+    def _due_for_hedge(self, pending_keys, started, hedge_after):
+        now = time.monotonic()
+        due = []
+        for key in pending_keys:
+            if started[key] is not None and now - started[key] >= hedge_after:
+                # Each call is hedged at most once
+                started[key] = None
+                if self._can_hedge():
+                    self._count("hedges")
+                    due.append(key)
+        return due
+
+    def _can_hedge(self):
+        return self.breaker.allow()
+
+    def reset(self):
+        """
+        Closes the circuit and resets the counters.
+        """
+        self.breaker.reset()
+        with self._lock:
+            self._reset_counters()
+
+    def stats(self):
+        """
+        Returns the call counters and the circuit state.
+        """
+        with self._lock:
+            return {**self.counters, "circuit": self.breaker.state}
+
+
+def pooled_session(pool_size=None):
+    """
+    Returns a requests session keeping up to `pool_size` (ORS_HTTP_POOL_SIZE)
+    keep-alive connections per host, so concurrent routing calls reuse
+    connections instead of paying a TCP/TLS handshake each.
+    """
+    pool_size = pool_size or getattr(settings, "ORS_HTTP_POOL_SIZE", 16)
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class PooledORSClient(openrouteservice.Client):
+    """
+    openrouteservice.Client sending its requests through a pooled_session
+    (or `session`), exposed as `session`. The client takes no session
+    argument and sends through its `_session`, so the one it creates is
+    replaced here; openrouteservice is pinned in requirements.txt for that.
+    """
+
+    def __init__(self, *args, session=None, pool_size=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.session = session or pooled_session(pool_size)
+        self._session = self.session
+
+
+def session_stats(session):
+    """
+    Returns the HTTP requests sent and connections opened by the session
+    and the share of requests that reused a connection.
+    """
+    sent = opened = 0
+    for adapter in set(session.adapters.values()):
+        for key in list(adapter.poolmanager.pools.keys()):
+            pool = adapter.poolmanager.pools.get(key)
+            if pool is not None:
+                sent += pool.num_requests
+                opened += pool.num_connections
+    return {
+        "http_requests": sent,
+        "http_connections": opened,
+        "connection_reuse": round(1 - opened / sent, 3) if sent else None,
+    }
+
+
+class RoutingClient(BaseRoutingClient):
+    """
+    Runs OpenRouteService calls on a persistent thread pool under a deadline
+    and a circuit breaker.
+
+    Calls still running when the deadline expires are abandoned and count as
+    failures. A call that has not answered after `hedge_after` seconds is
+    sent a second time and the first answer wins, which cuts the tail
+    latency of the odd slow request; set ORS_HEDGE_AFTER_SECONDS to 0 to
+    disable hedging.
+
+    At most `max_queue` calls may wait for a worker; further calls fail
+    at once with QueueFull instead of piling up behind a slow ORS. They do
+    not count against the circuit, since ORS never saw them.
+    """
+
+    def __init__(
+        self,
+        max_workers=None,
+        hedge_after=None,
+        breaker=None,
+        max_queue=None,
+        session=None,
+    ):
+        super().__init__(hedge_after, breaker)
+        self.max_workers = max_workers or getattr(settings, "ORS_MAX_WORKERS", 16)
+        self.max_queue = max_queue or getattr(settings, "ORS_MAX_QUEUE", 64)
+        self.session = session
+        self._queued = 0
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="ors"
+        )
+
+    def _reset_counters(self):
+        super()._reset_counters()
+        self.counters["rejected"] = 0
+        self.queue_wait = {"count": 0, "total": 0.0, "max": 0.0}
+
+    def _reserve(self):
+        # Takes a queue slot, released when the call starts or is cancelled
+        with self._lock:
+            if self._queued >= self.max_queue:
+                self.counters["rejected"] += 1
+                return False
+            self._queued += 1
+            return True
+
+    def _release(self, waited=None):
+        with self._lock:
+            self._queued -= 1
+            if waited is not None:
+                self.queue_wait["count"] += 1
+                self.queue_wait["total"] += waited
+                self.queue_wait["max"] = max(self.queue_wait["max"], waited)
+
+    def _submit(self, fn):
+        submitted = time.monotonic()
+
+        def run():
+            self._release(time.monotonic() - submitted)
+            return fn()
+
+        future = self._executor.submit(run)
+        future.add_done_callback(lambda f: f.cancelled() and self._release())
+        return future
+
+    def _can_hedge(self):
+        if not self._reserve():
+            return False
+        if self.breaker.allow():
+            return True
+        self._release()
+        return False
+
+    def call_many(self, calls, deadline=None, hedge=True, give_up=None):
+        """
+        Runs every callable of the `calls` dict concurrently.
+        Returns ({key: result}, {key: exception}); a failed, refused or
+        timed out call only fails its own key.
+        After each answer, `give_up(results, pending_keys)` may return the
+        pending keys no longer worth waiting for; they are cancelled and
+        left out of both dicts.
+        """
+        deadline = deadline or Deadline()
+        hedge_after = self.hedge_after if hedge else 0
+        results, errors = {}, {}
+        pending = {}
+        started = {}
+        hedges = set()
+
+        for key, fn in calls.items():
+            if not self._reserve():
+                errors[key] = QueueFull("ORS call queue is full")
+                continue
+            if not self.breaker.allow():
+                self._release()
+                self._count("short_circuits")
+                errors[key] = CircuitOpen("ORS circuit is open")
+                continue
+            pending[self._submit(fn)] = key
+            started[key] = time.monotonic()
+        self._count("calls", len(pending))
+
+        while pending and not deadline.expired():
+            done, _ = concurrent.futures.wait(
+                pending,
+                timeout=self._next_wait(
+                    deadline, set(pending.values()), started, hedge_after
+                ),
+                return_when=concurrent.futures.FIRST_COMPLETED,
+            )
+            for future in done:
+                key = pending.pop(future)
+                if key in results:
+                    continue
+                try:
+                    result = future.result()
+                except Exception as e:
+                    self.breaker.record_failure()
+                    self._count("failures")
+                    if key not in pending.values():
+                        errors[key] = e
+                    continue
+                self.breaker.record_success()
+                results[key] = result
+                if future in hedges:
+                    self._count("hedge_wins")
+                for other in [f for f, k in pending.items() if k == key]:
+                    other.cancel()
+                    del pending[other]
+
+            if give_up and done and pending:
+                dropped = set(give_up(results, set(pending.values()))) & set(
+                    pending.values()
+                )
+                for future in [f for f, k in pending.items() if k in dropped]:
+                    future.cancel()
+                    del pending[future]
+                self._count("abandoned", len(dropped))
+
+            if hedge_after:
+                for key in self._due_for_hedge(
+                    set(pending.values()), started, hedge_after
+                ):
+                    future = self._submit(calls[key])
+                    pending[future] = key
+                    hedges.add(future)
+
+        for key in set(pending.values()):
+            self.breaker.record_failure()
+            self._count("timeouts")
+            errors[key] = DeadlineExceeded("ORS did not answer before the deadline")
+        for future in pending:
+            future.cancel()
+        return results, errors
+
+    def call(self, fn, deadline=None, hedge=True):
+        """
+        Runs a single call, raising its exception (or CircuitOpen /
+        DeadlineExceeded / QueueFull) if it fails.
+        """
+        results, errors = self.call_many({None: fn}, deadline, hedge)
+        if None in errors:
+            raise errors[None]
+        return results[None]
+
+    def stats(self):
+        """
+        Returns the call counters, the circuit state, the queue depth and
+        wait times and, with a session, its connection reuse.
+        """
+        stats = super().stats()
+        with self._lock:
+            waits = dict(self.queue_wait)
+            stats["queue_depth"] = self._queued
+        stats["queue_wait_avg_ms"] = (
+            round(waits["total"] / waits["count"] * 1000, 3) if waits["count"] else None
+        )
+        stats["queue_wait_max_ms"] = round(waits["max"] * 1000, 3)
+        if self.session is not None:
+            stats.update(session_stats(self.session))
+        return stats
+
+
+class AsyncRoutingClient(BaseRoutingClient):
+    """
+    asyncio counterpart of RoutingClient: the calls are coroutines awaited
+    on the running event loop, so many assignments can wait on ORS at once
+    without a thread each. Calls left at the deadline are cancelled.
+    """
+
+    async def call_many(self, calls, deadline=None, hedge=True):
+        """
+        Awaits the coroutine functions of the `calls` dict concurrently.
+        Returns ({key: result}, {key: exception}) like RoutingClient.
+        """
+        deadline = deadline or Deadline()
+        hedge_after = self.hedge_after if hedge else 0
+        results, errors = {}, {}
+        pending = {}
+        started = {}
+        hedges = set()
+
+        for key, fn in calls.items():
+            if not self.breaker.allow():
+                self._count("short_circuits")
+                errors[key] = CircuitOpen("ORS circuit is open")
+                continue
+            pending[asyncio.ensure_future(fn())] = key
+            started[key] = time.monotonic()
+        self._count("calls", len(pending))
+
+        try:
+            while pending and not deadline.expired():
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=self._next_wait(
+                        deadline, set(pending.values()), started, hedge_after
+                    ),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for task in done:
+                    key = pending.pop(task)
+                    if key in results:
+                        continue
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        self.breaker.record_failure()
+                        self._count("failures")
+                        if key not in pending.values():
+                            errors[key] = e
+                        continue
+                    self.breaker.record_success()
+                    results[key] = result
+                    if task in hedges:
+                        self._count("hedge_wins")
+                    for other in [t for t, k in pending.items() if k == key]:
+                        other.cancel()
+                        del pending[other]
+
+                if hedge_after:
+                    due = self._due_for_hedge(
+                        set(pending.values()), started, hedge_after
+                    )
+                    for key in due:
+                        task = asyncio.ensure_future(calls[key]())
+                        pending[task] = key
+                        hedges.add(task)
+        finally:
+            for task in pending:
+                task.cancel()
+
+        for key in set(pending.values()):
+            self.breaker.record_failure()
+            self._count("timeouts")
+            errors[key] = DeadlineExceeded("ORS did not answer before the deadline")
+        return results, errors
+
+    async def call(self, fn, deadline=None, hedge=True):
+        results, errors = await self.call_many({None: fn}, deadline, hedge)
+        if None in errors:
+            raise errors[None]
+        return results[None]
+
+
+class AsyncORSClient:
+    """
+    Minimal asyncio client for the OpenRouteService matrix and directions
+    endpoints, with the same arguments and responses as the methods of
+    openrouteservice.Client that services.helpers uses.
+
+    Requests go over a pool of keep-alive HTTP connections (one httpx pool
+    per event loop, since connections cannot be shared between loops). A
+    pool is closed when its loop shuts down, so the short-lived loops that
+    async_to_sync runs each async view on under WSGI do not leak one per
+    request; under ASGI the pool lives as long as the server's loop.
+    """
+
+    def __init__(self, key=None, base_url=None, timeout=None, max_connections=None):
+        self.key = key
+        self.base_url = base_url
+        self.timeout = timeout or getattr(settings, "ORS_TIMEOUT_SECONDS", 5)
+        self.max_connections = max_connections or getattr(
+            settings, "ORS_HTTP_POOL_SIZE", 16
+        )
+        self._clients = weakref.WeakKeyDictionary()
+        self._ssl_context = None
+
+    async def _client(self):
+        loop = asyncio.get_running_loop()
+        entry = self._clients.get(loop)
+        if entry is not None:
+            return entry[0]
+
+        # Loading the CA bundle takes tens of milliseconds, so every pool
+        # shares one SSL context
+        if self._ssl_context is None:
+            self._ssl_context = httpx.create_ssl_context()
+        client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={"Authorization": self.key or ""},
+            timeout=self.timeout,
+            verify=self._ssl_context,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+            ),
+        )
+        closer = _close_on_shutdown(client)
+        self._clients[loop] = (client, closer)
+        await closer.__anext__()
+        return client
+
+    async def _post(self, url, body):
+        response = await (await self._client()).post(url, json=body)
+        response.raise_for_status()
+        return response.json()
+
+    async def distance_matrix(
+        self, locations, profile, sources=None, destinations=None, metrics=None
+    ):
+        body = {"locations": [list(location) for location in locations]}
+        if sources:
+            body["sources"] = sources
+        if destinations:
+            body["destinations"] = destinations
+        if metrics:
+            body["metrics"] = metrics
+        return await self._post(f"/v2/matrix/{profile}/json", body)
+
+    async def directions(self, coordinates, profile, format="geojson"):
+        body = {"coordinates": [list(point) for point in coordinates]}
+        return await self._post(f"/v2/directions/{profile}/{format}", body)
+
+    async def aclose(self):
+        """
+        Closes the connection pool of the running event loop.
+        """
+        entry = self._clients.pop(asyncio.get_running_loop(), None)
+        if entry is not None:
+            await entry[1].aclose()
+
+
+async def _close_on_shutdown(client):
+    # A started async generator is finalized by its loop's
+    # shutdown_asyncgens(), which asyncio.run and async_to_sync call before
+    # closing the loop
+    try:
+        yield
+    finally:
+        await client.aclose()
@@ -0,0 +1,344 @@
+import threading
+import xml.etree.ElementTree as ET
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import cKDTree
+
+EARTH_RADIUS_KM = 6356.752
+
+# Cruising speed per OSM highway type for the cycling profile; other types
+# (motorways, footways, steps...) are not routable
+CYCLING_SPEEDS_KMH = {
+    "cycleway": 18,
+    "trunk": 15,
+    "trunk_link": 15,
+    "primary": 15,
+    "primary_link": 15,
+    "secondary": 15,
+    "secondary_link": 15,
+    "tertiary": 15,
+    "tertiary_link": 15,
+    "unclassified": 15,
+    "residential": 15,
+    "road": 12,
+    "service": 12,
+    "living_street": 10,
+    "track": 10,
+    "pedestrian": 6,
+}
+
+ONEWAY_FORWARD = ("yes", "true", "1")
+
+
+def pairwise_haversine(lat1, lon1, lat2, lon2):
+    """
+    Vectorized haversine distance in kilometers between paired points.
+    """
+    lat1, lon1, lat2, lon2 = (
+        np.radians(np.asarray(a, dtype=np.float64)) for a in (lat1, lon1, lat2, lon2)
+    )
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def _directions(tags):
+    if tags.get("oneway:bicycle") == "no":
+        return True, True
+    oneway = tags.get("oneway")
+    if oneway in ONEWAY_FORWARD or tags.get("junction") == "roundabout":
+        return True, False
+    if oneway == "-1":
+        return False, True
+    return True, True
+
+
+def parse_osm(path, speeds=CYCLING_SPEEDS_KMH):
+    """
+    Reads the routable ways of an OSM XML extract in two streaming passes:
+    the ways first, then the coordinates of the nodes they use.
+    Returns ({osm_node_id: (lat, lon)}, [(node_ids, speed_kmh, forward,
+    backward)]).
+    """
+    ways = []
+    for _, element in ET.iterparse(path):
+        if element.tag == "way":
+            tags = {tag.get("k"): tag.get("v") for tag in element.iter("tag")}
+            speed = speeds.get(tags.get("highway"))
+            if (
+                speed
+                and tags.get("access") not in ("no", "private")
+                and tags.get("bicycle") != "no"
+            ):
+                refs = [int(nd.get("ref")) for nd in element.iter("nd")]
+                ways.append((refs, speed, *_directions(tags)))
+            element.clear()
+        elif element.tag in ("node", "relation"):
+            element.clear()
+
+    used = {ref for refs, _, _, _ in ways for ref in refs}
+    coordinates = {}
+    for _, element in ET.iterparse(path):
+        if element.tag == "node":
+            node_id = int(element.get("id"))
+            if node_id in used:
+                coordinates[node_id] = (
+                    float(element.get("lat")),
+                    float(element.get("lon")),
+                )
+            element.clear()
+        elif element.tag in ("way", "relation"):
+            element.clear()
+    return coordinates, ways
+
+
+class RoadGraph:
+    """
+    Directed road network in compressed sparse row arrays: the edges leaving
+    node u are indices[indptr[u]:indptr[u + 1]], with their travel time in
+    `seconds` and length in `meters`.
+
+    One-to-many queries run a single Dijkstra search per origin (SciPy's
+    compiled implementation) bounded by a travel time limit, which settles
+    every target of the origin at once; targets beyond the limit are
+    searched again without it.
+    """
+
+    def __init__(
+        self, latitudes, longitudes, indptr, indices, seconds, meters, max_snap_km=0.5
+    ):
+        self.latitudes = np.asarray(latitudes, dtype=np.float64)
+        self.longitudes = np.asarray(longitudes, dtype=np.float64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.seconds = np.asarray(seconds, dtype=np.float64)
+        self.meters = np.asarray(meters, dtype=np.float64)
+        self.max_snap_km = max_snap_km
+
+        n = len(self.latitudes)
+        # Edge u -> v has key u * n + v; CSR order keeps the keys sorted
+        self._edge_keys = (
+            np.repeat(np.arange(n, dtype=np.int64), np.diff(self.indptr)) * n
+            + self.indices
+        )
+        self.matrix = csr_matrix(
+            (self.seconds, self.indices, self.indptr), shape=(n, n)
+        )
+        self.max_speed_ms = (
+            float((self.meters / self.seconds).max()) if len(self.seconds) else 1.0
+        )
+        # Equirectangular projection in km: exact enough to snap within a city
+        self._cos_lat = np.cos(np.radians(self.latitudes.mean())) if n else 1.0
+        self._tree = cKDTree(self._project(self.latitudes, self.longitudes))
+
+    def __len__(self):
+        return len(self.latitudes)
+
+    @classmethod
+    def from_osm(cls, path, speeds=CYCLING_SPEEDS_KMH, **kwargs):
+        coordinates, ways = parse_osm(path, speeds)
+        node_ids = sorted(coordinates)
+        position = {node_id: i for i, node_id in enumerate(node_ids)}
+        latitudes = np.array([coordinates[node_id][0] for node_id in node_ids])
+        longitudes = np.array([coordinates[node_id][1] for node_id in node_ids])
+
+        sources, targets, speeds_ms = [], [], []
+        for refs, speed, forward, backward in ways:
+            nodes = [position[ref] for ref in refs if ref in position]
+            for u, v in zip(nodes, nodes[1:]):
+                if forward:
+                    sources.append(u)
+                    targets.append(v)
+                    speeds_ms.append(speed / 3.6)
+                if backward:
+                    sources.append(v)
+                    targets.append(u)
+                    speeds_ms.append(speed / 3.6)
+        sources = np.array(sources, dtype=np.int64)
+        targets = np.array(targets, dtype=np.int64)
+        meters = 1000 * pairwise_haversine(
+            latitudes[sources],
+            longitudes[sources],
+            latitudes[targets],
+            longitudes[targets],
+        )
+        # Zero weights would read as missing edges
+        meters = np.maximum(meters, 0.01)
+        seconds = meters / np.array(speeds_ms)
+
+        # Sorted by (source, target, seconds): rows are contiguous and
+        # parallel edges keep the fastest one
+        order = np.lexsort((seconds, targets, sources))
+        sources, targets = sources[order], targets[order]
+        keep = np.ones(len(order), dtype=bool)
+        keep[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+        sources, targets = sources[keep], targets[keep]
+        indptr = np.zeros(len(node_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(node_ids)), out=indptr[1:])
+        return cls(
+            latitudes,
+            longitudes,
+            indptr,
+            targets,
+            seconds[order][keep],
+            meters[order][keep],
+            **kwargs,
+        )
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        with np.load(path) as data:
+            return cls(
+                data["latitudes"],
+                data["longitudes"],
+                data["indptr"],
+                data["indices"],
+                data["seconds"],
+                data["meters"],
+                **kwargs,
+            )
+
+    def save(self, path):
+        np.savez(
+            path,
+            latitudes=self.latitudes,
+            longitudes=self.longitudes,
+            indptr=self.indptr,
+            indices=self.indices,
+            seconds=self.seconds,
+            meters=self.meters,
+        )
+
+    def _project(self, latitudes, longitudes):
+        km_per_degree = EARTH_RADIUS_KM * np.pi / 180
+        return np.column_stack(
+            (
+                np.asarray(longitudes) * self._cos_lat * km_per_degree,
+                np.asarray(latitudes) * km_per_degree,
+            )
+        )
+
+    def snap(self, latitudes, longitudes):
+        """
+        Returns the closest node to every point, or -1 for points farther
+        than max_snap_km from the road network.
+        """
+        distances, nodes = self._tree.query(self._project(latitudes, longitudes))
+        return np.where(distances <= self.max_snap_km, nodes, -1)
+
+    def _tree_meters(self, predecessors):
+        """
+        Returns the length of the path to every node of a shortest path
+        tree, summed by pointer jumping in O(log depth) array passes.
+        """
+        n = len(self)
+        reached = np.flatnonzero(predecessors >= 0)
+        ancestors = np.arange(n)
+        ancestors[reached] = predecessors[reached]
+        meters = np.zeros(n)
+        edges = np.searchsorted(self._edge_keys, predecessors[reached] * n + reached)
+        meters[reached] = self.meters[edges]
+        while (ancestors != ancestors[ancestors]).any():
+            meters += meters[ancestors]
+            ancestors = ancestors[ancestors]
+        return meters
+
+    def travel(self, origins, destinations):
+        """
+        Returns (meters, seconds) arrays of shape (len(origins),
+        len(destinations)) for the fastest route between every pair of
+        (longitude, latitude) points, NaN where there is none.
+        """
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 2)
+        destinations = np.asarray(destinations, dtype=np.float64).reshape(-1, 2)
+        meters = np.full((len(origins), len(destinations)), np.nan)
+        seconds = np.full((len(origins), len(destinations)), np.nan)
+        if not len(self) or not len(origins) or not len(destinations):
+            return meters, seconds
+
+        sources = self.snap(origins[:, 1], origins[:, 0])
+        targets = self.snap(destinations[:, 1], destinations[:, 0])
+        routable = np.flatnonzero(targets >= 0)
+        for row, source in enumerate(sources):
+            if source < 0 or not len(routable):
+                continue
+            # Start with twice the time needed at top speed in a straight
+            # line to the farthest target, plus slack for short hops
+            straight_m = (
+                pairwise_haversine(
+                    self.latitudes[source],
+                    self.longitudes[source],
+                    self.latitudes[targets[routable]],
+                    self.longitudes[targets[routable]],
+                ).max()
+                * 1000
+            )
+            limit = 2 * straight_m / self.max_speed_ms + 120
+            times, predecessors = dijkstra(
+                self.matrix, indices=source, limit=limit, return_predecessors=True
+            )
+            if not np.isfinite(times[targets[routable]]).all():
+                times, predecessors = dijkstra(
+                    self.matrix, indices=source, return_predecessors=True
+                )
+            found = routable[np.isfinite(times[targets[routable]])]
+            seconds[row, found] = times[targets[found]]
+            meters[row, found] = self._tree_meters(predecessors)[targets[found]]
+        return meters, seconds
+
+
+def _to_lists(values):
+    # Unroutable pairs are null in ORS matrix responses
+    return [
+        [None if np.isnan(value) else float(value) for value in row] for row in values
+    ]
+
+
+class LocalRoutingClient:
+    """
+    In-process replacement for openrouteservice.Client backed by a
+    RoadGraph. Implements the distance_matrix and directions calls used by
+    services.helpers with the same response shapes, so the route cache,
+    the deadline and the circuit breaker work unchanged. The graph file is
+    loaded on the first request.
+    """
+
+    def __init__(self, path=None, graph=None):
+        self.path = path
+        self._graph = graph
+        self._lock = threading.Lock()
+
+    @property
+    def graph(self):
+        if self._graph is None:
+            with self._lock:
+                if self._graph is None:
+                    self._graph = RoadGraph.load(self.path)
+        return self._graph
+
+    def distance_matrix(
+        self,
+        locations,
+        profile=None,
+        sources=None,
+        destinations=None,
+        metrics=None,
+        **kwargs,
+    ):
+        sources = range(len(locations)) if sources is None else sources
+        destinations = range(len(locations)) if destinations is None else destinations
+        meters, seconds = self.graph.travel(
+            [locations[i] for i in sources], [locations[i] for i in destinations]
+        )
+        return {"distances": _to_lists(meters), "durations": _to_lists(seconds)}
+
+    def directions(self, coordinates, profile=None, format="geojson", **kwargs):
+        meters, seconds = self.graph.travel([coordinates[0]], [coordinates[-1]])
+        if np.isnan(seconds[0, 0]):
+            raise ValueError(f"No route between {coordinates[0]} and {coordinates[-1]}")
+        summary = {"distance": float(meters[0, 0]), "duration": float(seconds[0, 0])}
+        return {"features": [{"properties": {"summary": summary}}]}
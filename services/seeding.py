@@ -0,0 +1,313 @@
+import csv
+import io
+from contextlib import contextmanager
+from datetime import timedelta
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from addresses import geohash
+from addresses.models import Address
+from drivers.models import Driver
+from services.benchmarks import LAT_RANGE, LON_RANGE
+from services.models import ServiceRequest
+from users.models import UserProfile
+
+STREETS = [
+    "Calle 45",
+    "Calle 68",
+    "Carrera 10",
+    "Avenida El Dorado",
+    "Avenida Boyacá",
+    "Calle 100",
+    "Calle 13",
+    "Calle 26",
+    "Carrera 7",
+    "Carrera 15",
+    "Avenida Suba",
+    "Avenida Caracas",
+    "Avenida Ciudad de Cali",
+    "Calle 80",
+    "Calle 53",
+    "Calle 50",
+    "Carrera 19",
+    "Carrera 30",
+    "Calle 170",
+    "Calle 182",
+    "Avenida NQS",
+    "Calle 39",
+    "Calle 23",
+    "Calle 56",
+    "Calle 92",
+    "Calle 42",
+    "Carrera 5",
+    "Carrera 24",
+]
+
+# Share of the history in each final status
+HISTORY_STATUSES = {
+    ServiceRequest.Status.COMPLETED: 0.85,
+    ServiceRequest.Status.CANCELLED: 0.15,
+}
+
+KM_PER_DEGREE = 111.32
+
+
+def hotspot_centres(rng, hotspots):
+    """
+    Returns `hotspots` random (latitude, longitude) centres in the seed area.
+    """
+    return np.column_stack(
+        (rng.uniform(*LAT_RANGE, hotspots), rng.uniform(*LON_RANGE, hotspots))
+    )
+
+
+def sample_coordinates(rng, count, centres=(), hotspot_km=1.5, hotspot_share=0.7):
+    """
+    Returns `count` (latitudes, longitudes) inside the seed area. Uniform by
+    default; with hotspot `centres`, a `hotspot_share` of them are normally
+    spread (sigma `hotspot_km`) around them, the first centres drawing the
+    most points, like a city centre and its neighbourhoods.
+    """
+    latitudes = rng.uniform(*LAT_RANGE, count)
+    longitudes = rng.uniform(*LON_RANGE, count)
+    if len(centres) and count:
+        # Zipf-like weights: the second busiest hotspot gets half the first
+        weights = 1 / np.arange(1, len(centres) + 1)
+        clustered = rng.random(count) < hotspot_share
+        centre = rng.choice(len(centres), clustered.sum(), p=weights / weights.sum())
+        sigma = hotspot_km / KM_PER_DEGREE
+        latitudes[clustered] = rng.normal(centres[centre, 0], sigma)
+        longitudes[clustered] = rng.normal(centres[centre, 1], sigma)
+        latitudes = np.clip(latitudes, *LAT_RANGE)
+        longitudes = np.clip(longitudes, *LON_RANGE)
+    return latitudes.round(6), longitudes.round(6)
+
+
+@contextmanager
+def explicit_timestamps(model):
+    """
+    Lets bulk inserts keep the auto_now_add values they are given, so the
+    seeded history spans days instead of the seconds it takes to insert.
+    """
+    fields = [
+        field
+        for field in model._meta.concrete_fields
+        if getattr(field, "auto_now_add", False)
+    ]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class BulkSeeder:
+    """
+    Inserts large volumes of realistic rows in chunks of `chunk_size`: one
+    bulk_create per table and chunk or, with `copy` on PostgreSQL, one COPY
+    with ids reserved from the table's sequence. Users share a single
+    password hash, coordinates and geohashes are generated with numpy, and
+    memory stays bounded by the chunk size (plus the ids of the drivers and
+    clients the history refers to).
+    """
+
+    def __init__(
+        self,
+        chunk_size=10000,
+        copy=False,
+        hotspots=0,
+        password="password",
+        seed=0,
+        log=None,
+    ):
+        if copy and connection.vendor != "postgresql":
+            raise ValueError("COPY needs PostgreSQL")
+        self.chunk_size = chunk_size
+        self.copy = copy
+        self.password = make_password(password)
+        self.rng = np.random.default_rng(seed)
+        # Shared by every table and chunk, so clients cluster where drivers do
+        self.centres = hotspot_centres(self.rng, hotspots)
+        self.created = {}
+        self.log = log or (lambda message: None)
+        # Usernames continue after every existing user, so reruns never clash
+        self.offset = (User.objects.aggregate(Max("id"))["id__max"] or 0) + 1
+
+    def seed(
+        self, addresses=0, drivers=0, clients=0, services=0, busy_ratio=0.0, days=90
+    ):
+        """
+        Creates `addresses` standalone addresses, `drivers` drivers with their
+        own address (`busy_ratio` of them on an in-progress service) and
+        `clients` clients with `services` completed or cancelled services
+        spread over the last `days`. Returns the number of rows per table.
+        """
+        if services and not clients:
+            raise ValueError("Services need at least one client")
+        if services and not drivers:
+            raise ValueError("Services need at least one driver")
+        if busy_ratio and not clients:
+            raise ValueError("Busy drivers need at least one client")
+        for start, size in self.chunks(addresses):
+            self.insert_addresses(size)
+            self.log(f"Addresses: {start + size}/{addresses}")
+
+        client_ids = np.empty(0, dtype=np.int64)
+        for start, size in self.chunks(clients):
+            client_ids = np.concatenate(
+                (client_ids, self.insert_users(size, "client", is_driver=False))
+            )
+            self.log(f"Clients: {start + size}/{clients}")
+
+        driver_ids = np.empty(0, dtype=np.int64)
+        for start, size in self.chunks(drivers):
+            with transaction.atomic():
+                user_ids = self.insert_users(size, "driver", is_driver=True)
+                address_ids = self.insert_addresses(size)
+                busy = self.rng.random(size) < busy_ratio
+                ids = self.insert(
+                    Driver,
+                    {
+                        "user_id": user_ids,
+                        "current_address_id": address_ids,
+                        "is_available": ~busy,
+                    },
+                )
+                driver_ids = np.concatenate((driver_ids, ids))
+                if busy.any():
+                    # Busy drivers are on an in-progress service, as in production
+                    self.insert_services(
+                        client_ids, ids[busy], ServiceRequest.Status.IN_PROGRESS, days=0
+                    )
+            self.log(f"Drivers: {start + size}/{drivers}")
+
+        statuses = list(HISTORY_STATUSES)
+        for start, size in self.chunks(services):
+            with transaction.atomic():
+                status = self.rng.choice(
+                    len(statuses), size, p=list(HISTORY_STATUSES.values())
+                )
+                for index, value in enumerate(statuses):
+                    count = int((status == index).sum())
+                    if count:
+                        self.insert_services(
+                            client_ids, self.rng.choice(driver_ids, count), value, days
+                        )
+            self.log(f"Services: {start + size}/{services}")
+        return dict(self.created)
+
+    def chunks(self, count):
+        for start in range(0, count, self.chunk_size):
+            yield start, min(self.chunk_size, count - start)
+
+    def insert_addresses(self, count):
+        latitudes, longitudes = sample_coordinates(self.rng, count, self.centres)
+        streets = self.rng.choice(len(STREETS), count)
+        numbers = self.rng.integers(1, 100, count)
+        return self.insert(
+            Address,
+            {
+                "street": [f"{STREETS[s]} #{n}" for s, n in zip(streets, numbers)],
+                "city": ["Bogotá"] * count,
+                "latitude": latitudes,
+                "longitude": longitudes,
+                "geohash": geohash.encode_many(latitudes, longitudes),
+            },
+        )
+
+    def insert_users(self, count, role, is_driver):
+        # bulk_create and COPY skip post_save, so profiles are created here
+        usernames = [f"{role}_{self.offset + i}" for i in range(count)]
+        self.offset += count
+        user_ids = self.insert(
+            User,
+            {
+                "username": usernames,
+                "email": [f"{username}@example.com" for username in usernames],
+                "password": [self.password] * count,
+            },
+        )
+        self.insert(
+            UserProfile, {"user_id": user_ids, "is_driver": [is_driver] * count}
+        )
+        return user_ids
+
+    def insert_services(self, client_ids, driver_ids, status, days):
+        count = len(driver_ids)
+        age = self.rng.uniform(0, days * 86400, count)
+        now = timezone.now()
+        return self.insert(
+            ServiceRequest,
+            {
+                "client_id": self.rng.choice(client_ids, count),
+                "pickup_address_id": self.insert_addresses(count),
+                "assigned_driver_id": driver_ids,
+                "estimated_time_minutes": self.rng.integers(1, 61, count),
+                "created_at": [now - timedelta(seconds=float(a)) for a in age],
+                "status": [status] * count,
+            },
+        )
+
+    def insert(self, model, columns):
+        """
+        Inserts one row per value of the `columns` (attname -> sequence of
+        equal length) and returns their ids.
+        """
+        columns = {
+            name: values.tolist() if isinstance(values, np.ndarray) else list(values)
+            for name, values in columns.items()
+        }
+        count = len(next(iter(columns.values())))
+        table = model._meta.db_table
+        self.created[table] = self.created.get(table, 0) + count
+        if self.copy:
+            return self.copy_rows(model, columns, count)
+        names = list(columns)
+        objs = [model(**dict(zip(names, row))) for row in zip(*columns.values())]
+        with explicit_timestamps(model):
+            model.objects.bulk_create(objs, batch_size=self.chunk_size)
+        return np.array([obj.pk for obj in objs], dtype=np.int64)
+
+    def copy_rows(self, model, columns, count):
+        table = model._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                [table, count],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+            # Columns not given take their model default
+            fields = [
+                field for field in model._meta.concrete_fields if not field.primary_key
+            ]
+            values = [
+                (
+                    columns[field.attname]
+                    if field.attname in columns
+                    else [field.get_db_prep_save(field.get_default(), connection)]
+                    * count
+                )
+                for field in fields
+            ]
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in zip(ids, *values):
+                writer.writerow(["\\N" if value is None else value for value in row])
+            buffer.seek(0)
+            names = ", ".join(
+                connection.ops.quote_name(column)
+                for column in ["id"] + [field.column for field in fields]
+            )
+            cursor.copy_expert(
+                f"COPY {connection.ops.quote_name(table)} ({names}) "
+                "FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                buffer,
+            )
+        return np.array(ids, dtype=np.int64)
@@ -32,3 +32,9 @@ class ServiceRequestSerializer(serializers.ModelSerializer):
                     f"Invalid status. Valid statuses are: {', '.join(valid_statuses)}."
                 )
             return value
+
+
+class ServiceRequestStatusSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ServiceRequest
+        fields = ["id", "status", "assigned_driver", "estimated_time_minutes"]
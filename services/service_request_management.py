@@ -1,31 +1,115 @@
 # services/service_request_service.py
+import logging
+import threading
+
+from django.db import transaction
 from addresses.models import Address
+from delivery_system.metrics import timed
+from delivery_system.response_cache import invalidate_drivers
+from drivers.models import Driver
+from drivers.spatial_index import driver_index
+from .eta import eta_source
 from .models import ServiceRequest
-from services.helpers import find_nearest_driver
+from services.helpers import (
+    arank_nearest_drivers,
+    haversine_distance,
+    rank_nearest_drivers,
+)
 from rest_framework.exceptions import ValidationError
 
+logger = logging.getLogger(__name__)
+
+# Pending requests being ranked by a process_service_requests worker of this
+# process; the other workers skip them instead of routing them again
+_assigning = set()
+_assigning_lock = threading.Lock()
+
 
 def create_pickup_address(pickup_address_data):
     """
     Creates the pickup address from the provided data.
     """
     try:
-        pickup_address = Address.objects.create(**pickup_address_data)
+        with timed("address"):
+            pickup_address = Address.objects.create(**pickup_address_data)
         return pickup_address
     except Exception as e:
         raise ValidationError(f"Error creating pickup address: {str(e)}")
 
 
+async def acreate_pickup_address(pickup_address_data):
+    """
+    Async version of create_pickup_address.
+    """
+    try:
+        with timed("address"):
+            return await Address.objects.acreate(**pickup_address_data)
+    except Exception as e:
+        raise ValidationError(f"Error creating pickup address: {str(e)}")
+
+
 def assign_driver_to_service(pickup_address):
     """
     Assigns the nearest driver to the service request.
+    Candidates are claimed in ranking order; if another request claimed a
+    driver first, the next-best one is tried without routing again.
+    Call it inside the transaction that creates the service request so a
+    failure releases the claimed driver. That transaction then spans the
+    routing: callers that can should call rank_drivers first and only wrap
+    claim_ranked_driver and the write in the transaction.
+    """
+    return claim_ranked_driver(rank_drivers(pickup_address))
+
+
+def rank_drivers(pickup_address):
+    """
+    First half of assign_driver_to_service: returns the ranked
+    (driver, distance_km, duration_minutes) tuples for claim_ranked_driver.
+    Meant to run outside any transaction, so no connection or row lock is
+    held while ORS answers.
+    """
+    try:
+        return rank_nearest_drivers(pickup_address)
+    except Exception as e:
+        raise ValidationError(str(e))
+
+
+async def arank_drivers(pickup_address):
+    """
+    Async version of rank_drivers.
+    """
+    try:
+        return await arank_nearest_drivers(pickup_address)
+    except Exception as e:
+        raise ValidationError(str(e))
+
+
+def claim_ranked_driver(ranked_drivers):
+    """
+    Claims the first driver of the ranking that is still available.
+    Returns the (driver, estimated_time) pair.
     """
-    available_nearest_driver, _, estimated_time = find_nearest_driver(pickup_address)
-    if not available_nearest_driver:
-        raise ValidationError("No available drivers")
-    if estimated_time is None:
-        raise ValidationError("Unable to estimate time for the driver")
-    return available_nearest_driver, estimated_time
+    with timed("claim"):
+        for driver, _, estimated_time in ranked_drivers:
+            if estimated_time is None:
+                continue
+            if claim_driver(driver):
+                return driver, estimated_time
+    raise ValidationError("No available drivers")
+
+
+def pickup_distance(driver, pickup_address):
+    """
+    Returns the straight-line km between the driver and the pickup, recorded
+    with each assignment to train the local ETA model.
+    """
+    address = driver.current_address
+    return haversine_distance(
+        address.latitude,
+        address.longitude,
+        pickup_address.latitude,
+        pickup_address.longitude,
+    )
 
 
 def create_service_request(client, pickup_address, assigned_driver, estimated_time):
@@ -33,40 +117,199 @@ def create_service_request(client, pickup_address, assigned_driver, estimated_ti
     Creates a service request with the pickup address and the assigned driver.
     """
     try:
-        service_request = ServiceRequest.objects.create(
-            client=client,
-            pickup_address=pickup_address,
-            assigned_driver=assigned_driver,
-            estimated_time_minutes=estimated_time,
-            status="in progress",
-        )
+        with timed("create"):
+            service_request = ServiceRequest.objects.create(
+                client=client,
+                pickup_address=pickup_address,
+                assigned_driver=assigned_driver,
+                estimated_time_minutes=estimated_time,
+                eta_source=eta_source(estimated_time),
+                pickup_distance_km=pickup_distance(assigned_driver, pickup_address),
+                status=ServiceRequest.Status.IN_PROGRESS,
+            )
         return service_request
     except Exception as e:
         raise ValidationError(f"Error creating service request: {str(e)}")
 
 
+def claim_driver(driver):
+    """
+    Marks the driver as unavailable with a single conditional UPDATE.
+    Returns False when the driver was no longer available, i.e. another
+    request claimed it first.
+    """
+    claimed = Driver.objects.filter(id=driver.id, is_available=True).update(
+        is_available=False
+    )
+    if not claimed:
+        return False
+
+    driver.is_available = False
+    # update() bypasses post_save, so the spatial index is told directly
+    transaction.on_commit(lambda: driver_index.remove(driver.id))
+    invalidate_drivers([driver.id])
+    return True
+
+
 def update_driver_availability(assigned_driver):
     """
     Updates the driver's availability to unavailable.
     """
     try:
-        assigned_driver.is_available = False
-        assigned_driver.save()
+        claimed = claim_driver(assigned_driver)
     except Exception as e:
         raise ValidationError(f"Error updating driver availability: {str(e)}")
+    if not claimed:
+        raise ValidationError("Driver is no longer available")
 
 
 def update_service_driver(service, status_service):
     """
-    Updates the service status to the specified status and sets the driver's availability to False.
+    Updates the service status to the specified status and sets the driver's
+    availability to True, atomically and only if the service is still open,
+    so completing a service twice cannot free a driver that is already on
+    another job.
     """
     try:
-        service.status = status_service
-        assigned_driver = service.assigned_driver
-        assigned_driver.is_available = True
-        service.save()
-        assigned_driver.save()
+        with transaction.atomic():
+            updated = (
+                ServiceRequest.objects.filter(id=service.id)
+                .exclude(
+                    status__in=[
+                        ServiceRequest.Status.COMPLETED,
+                        ServiceRequest.Status.CANCELLED,
+                    ]
+                )
+                .update(status=status_service)
+            )
+            if not updated:
+                raise ValidationError("Service is already closed")
+
+            if service.assigned_driver_id:
+                Driver.objects.filter(id=service.assigned_driver_id).update(
+                    is_available=True
+                )
+                transaction.on_commit(
+                    lambda: reindex_driver(service.assigned_driver_id)
+                )
+                invalidate_drivers([service.assigned_driver_id])
+    except ValidationError:
+        raise
     except Exception as e:
         raise ValidationError(
             f"Error updating service status or driver availability: {str(e)}"
         )
+    service.status = status_service
+
+
+def reindex_driver(driver_id):
+    """
+    Puts a driver that became available back into the spatial index.
+    """
+    position = (
+        Driver.objects.filter(id=driver_id, is_available=True)
+        .values_list("current_address__latitude", "current_address__longitude")
+        .first()
+    )
+    if position is not None:
+        driver_index.upsert(driver_id, *position)
+
+
+def create_pending_service_request(client, pickup_address):
+    """
+    Creates a pending service request to be assigned later by the
+    process_service_requests workers.
+    """
+    try:
+        return ServiceRequest.objects.create(
+            client=client,
+            pickup_address=pickup_address,
+            status=ServiceRequest.Status.PENDING,
+        )
+    except Exception as e:
+        raise ValidationError(f"Error creating service request: {str(e)}")
+
+
+def assign_next_pending_service(exclude_ids=()):
+    """
+    Assigns the nearest driver to the oldest pending service request and
+    moves it to in progress.
+    The request is ranked without any lock, then locked (SELECT ... FOR
+    UPDATE SKIP LOCKED) and re-checked only to claim the driver and save
+    the assignment, so no row lock or transaction is held during routing.
+    Workers of this process skip requests another one is ranking.
+    Returns the (service_request, assigned) pair, or None when the queue is
+    empty. Requests that cannot be assigned yet, or that another worker
+    assigned meanwhile, are returned unassigned.
+    """
+    with _assigning_lock:
+        service_request = (
+            ServiceRequest.objects.select_related("pickup_address")
+            .filter(status=ServiceRequest.Status.PENDING)
+            .exclude(id__in=[*exclude_ids, *_assigning])
+            .order_by("created_at", "id")
+            .first()
+        )
+        if service_request is None:
+            return None
+        _assigning.add(service_request.id)
+
+    try:
+        try:
+            ranked_drivers = rank_drivers(service_request.pickup_address)
+        except ValidationError as e:
+            logger.info("Service %s still pending: %s", service_request.id, e)
+            return service_request, False
+
+        with transaction.atomic():
+            still_pending = (
+                ServiceRequest.objects.select_for_update(skip_locked=True)
+                .filter(id=service_request.id, status=ServiceRequest.Status.PENDING)
+                .exists()
+            )
+            if not still_pending:
+                return service_request, False
+
+            try:
+                assigned_driver, estimated_time = claim_ranked_driver(ranked_drivers)
+            except ValidationError as e:
+                logger.info("Service %s still pending: %s", service_request.id, e)
+                return service_request, False
+
+            service_request.assigned_driver = assigned_driver
+            service_request.estimated_time_minutes = estimated_time
+            service_request.eta_source = eta_source(estimated_time)
+            service_request.pickup_distance_km = pickup_distance(
+                assigned_driver, service_request.pickup_address
+            )
+            service_request.status = ServiceRequest.Status.IN_PROGRESS
+            service_request.save(
+                update_fields=[
+                    "assigned_driver",
+                    "estimated_time_minutes",
+                    "eta_source",
+                    "pickup_distance_km",
+                    "status",
+                ]
+            )
+            return service_request, True
+    finally:
+        with _assigning_lock:
+            _assigning.discard(service_request.id)
+
+
+def process_pending_services():
+    """
+    Drains the pending queue once. Returns how many requests were assigned.
+    """
+    assigned_count = 0
+    skipped_ids = []
+    while True:
+        result = assign_next_pending_service(exclude_ids=skipped_ids)
+        if result is None:
+            return assigned_count
+        service_request, assigned = result
+        if assigned:
+            assigned_count += 1
+        else:
+            skipped_ids.append(service_request.id)
@@ -1,14 +1,78 @@
-from django.test import TestCase
+import asyncio
+import concurrent.futures
+import os
+import tempfile
+import threading
+import time
+from unittest import skipUnless
+
+from asgiref.sync import async_to_sync
+from django.db import OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.exceptions import ValidationError
 from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth.models import User
 
+from addresses import geohash
 from addresses.models import Address
 from drivers.models import Driver
 from services.models import ServiceRequest
 
-from unittest.mock import patch, MagicMock
-from .helpers import haversine_distance, find_nearest_driver
+import numpy as np
+import openrouteservice
+from unittest.mock import AsyncMock, MagicMock, patch
+from delivery_system.explain import analyze, assert_no_sequential_scans
+from delivery_system.response_cache import response_cache
+from drivers.spatial_index import driver_index
+from .benchmarks import QUERY_BUDGETS, EndpointBenchmark, over_budget, seed_volume
+from .dispatch import dispatch_pending_batch, route_batch, solve_assignment
+from .management.commands.process_service_requests import (
+    Command as ProcessServiceRequestsCommand,
+)
+from .eta import eta_model, eta_source, train_eta_model
+from .fake_ors import FakeORSServer, latency_distribution
+from .road_graph import LocalRoutingClient, RoadGraph
+from .seeding import BulkSeeder, sample_coordinates
+from .traffic import TrafficReplay, generate_trace, read_trace
+from .travel_grid import build_travel_grid, get_travel_grid
+from .ors_client import (
+    AsyncORSClient,
+    AsyncRoutingClient,
+    CircuitBreaker,
+    CircuitOpen,
+    Deadline,
+    DeadlineExceeded,
+    PooledORSClient,
+    QueueFull,
+    RoutingClient,
+    session_stats,
+)
+from .service_request_management import (
+    assign_driver_to_service,
+    claim_driver,
+    claim_ranked_driver,
+    create_pending_service_request,
+    create_service_request,
+    assign_next_pending_service,
+    process_pending_services,
+    update_service_driver,
+)
+from .helpers import (
+    CandidateSizer,
+    RouteCache,
+    aors,
+    candidate_sizer,
+    route_cache,
+    haversine_distance,
+    haversine_many,
+    find_nearest_driver,
+    ors,
+    prefilter_candidates,
+    rank_nearest_drivers,
+)
 from geopy.distance import geodesic
 
 
@@ -85,10 +149,14 @@ class CompleteServiceViewTests(TestCase):
 
 
 class DriverTests(TestCase):
+    def setUp(self):
+        driver_index.clear()
+        route_cache.clear()
+        ors.reset()
 
     @patch("services.helpers.openrouteservice.Client.directions")
-    @patch("services.helpers.Driver.objects.filter")
-    def test_find_nearest_driver(self, mock_filter, mock_directions):
+    @patch("services.helpers.openrouteservice.Client.distance_matrix")
+    def test_find_nearest_driver(self, mock_matrix, mock_directions):
         # Create mock Address instances
         address_1 = Address.objects.create(
             street="Street 1", city="City 1", latitude=10.0, longitude=20.0
@@ -113,37 +181,12 @@ class DriverTests(TestCase):
             is_available=True,
         )
 
-        # Mock the response from OpenRouteService for both drivers
-        mock_route_1 = {
-            "features": [
-                {
-                    "properties": {
-                        "summary": {
-                            "distance": 1000,  # in meters
-                            "duration": 600,  # in seconds
-                        }
-                    }
-                }
-            ]
-        }
-
-        mock_route_2 = {
-            "features": [
-                {
-                    "properties": {
-                        "summary": {
-                            "distance": 2000,  # in meters
-                            "duration": 1200,  # in seconds
-                        }
-                    }
-                }
-            ]
+        # Mock the matrix response from OpenRouteService for both drivers
+        mock_matrix.return_value = {
+            "distances": [[1000, 2000]],  # in meters
+            "durations": [[600, 1200]],  # in seconds
         }
 
-        # Configure the mock responses
-        mock_directions.side_effect = [mock_route_1, mock_route_2]
-        mock_filter.return_value = [driver_1, driver_2]
-
         # Create a mock pickup address with latitude and longitude
         pickup_address = MagicMock()
         pickup_address.latitude = 12.0
@@ -159,6 +202,78 @@ class DriverTests(TestCase):
         self.assertEqual(min_distance, 1.0)  # in kilometers
         self.assertEqual(estimated_time_minutes, 10)  # in minutes
 
+        # A single matrix request replaces the per-driver directions calls
+        self.assertEqual(mock_matrix.call_count, 1)
+        mock_directions.assert_not_called()
+
+    @override_settings(ROUTE_PRUNING=False)
+    @patch("services.helpers.openrouteservice.Client.directions")
+    @patch("services.helpers.openrouteservice.Client.distance_matrix")
+    def test_find_nearest_driver_falls_back_to_directions(
+        self, mock_matrix, mock_directions
+    ):
+        drivers = []
+        for i, (lat, lon) in enumerate([(10.0, 20.0), (15.0, 25.0), (11.0, 21.0)]):
+            address = Address.objects.create(
+                street=f"Street {i}", city="City", latitude=lat, longitude=lon
+            )
+            user = User.objects.create(username=f"fallback{i}")
+            drivers.append(Driver.objects.create(user=user, current_address=address))
+
+        # The matrix cannot route the closest driver, the others are answered
+        mock_matrix.return_value = {
+            "distances": [[None, 1000, 2000]],
+            "durations": [[None, 600, 1200]],
+        }
+        mock_directions.return_value = {
+            "features": [
+                {"properties": {"summary": {"distance": 500, "duration": 300}}}
+            ]
+        }
+        pickup_address = MagicMock()
+        pickup_address.latitude = 12.0
+        pickup_address.longitude = 22.0
+
+        result = find_nearest_driver(pickup_address)
+
+        self.assertEqual(result, (drivers[2], 0.5, 5))
+        self.assertEqual(mock_matrix.call_count, 1)
+
+        # A failing matrix request falls back to directions for every candidate
+        route_cache.clear()
+        mock_matrix.side_effect = RuntimeError("matrix unavailable")
+        mock_directions.reset_mock()
+        with self.assertLogs("services.helpers", level="WARNING"):
+            find_nearest_driver(pickup_address)
+        self.assertEqual(mock_directions.call_count, 3)
+
+    def test_find_nearest_driver_against_fake_ors(self):
+        pickup = (4.693408, -74.112279)
+        drivers = []
+        for i, (lat, lon) in enumerate([(4.75, -74.05), (4.70, -74.11), (4.6, -74.2)]):
+            address = Address.objects.create(
+                street=f"Street {i}", city="Bogotá", latitude=lat, longitude=lon
+            )
+            user = User.objects.create(username=f"fake{i}")
+            drivers.append(Driver.objects.create(user=user, current_address=address))
+        pickup_address = MagicMock()
+        pickup_address.latitude, pickup_address.longitude = pickup
+
+        with FakeORSServer() as fake:
+            with patch(
+                "services.helpers.client",
+                openrouteservice.Client(
+                    base_url=fake.url, retry_over_query_limit=False
+                ),
+            ):
+                driver, distance_km, minutes = find_nearest_driver(pickup_address)
+
+        self.assertEqual(driver, drivers[1])
+        self.assertEqual(fake.calls, {"directions": 0, "matrix": 1})
+        expected_m, expected_s = fake.route((pickup[1], pickup[0]), (-74.11, 4.70))
+        self.assertAlmostEqual(distance_km, expected_m / 1000)
+        self.assertEqual(minutes, int(expected_s / 60))
+
     def test_haversine_distance(self):
         # Test Haversine distance calculation
         lat1, lon1 = 10.0, 20.0
@@ -170,3 +285,1713 @@ class DriverTests(TestCase):
 
         # Assert that the result is approximately equal to the expected value
         self.assertAlmostEqual(result, expected_distance, delta=0.5)
+
+    def test_haversine_many_matches_scalar(self):
+        lats = [4.5, 4.7110, 15.0, -33.9]
+        lons = [-74.2, -74.0721, 25.0, 151.2]
+        result = haversine_many(4.693408, -74.112279, lats, lons)
+
+        for distance, lat, lon in zip(result, lats, lons):
+            self.assertAlmostEqual(
+                distance, haversine_distance(4.693408, -74.112279, lat, lon)
+            )
+
+    def test_prefilter_candidates_scans_available_drivers(self):
+        drivers = []
+        for i, (lat, lon) in enumerate([(4.80, -74.15), (4.61, -74.08), (4.65, -74.1)]):
+            address = Address.objects.create(
+                street=f"Street {i}", city="Bogotá", latitude=lat, longitude=lon
+            )
+            user = User.objects.create(username=f"scan{i}")
+            drivers.append(Driver.objects.create(user=user, current_address=address))
+        drivers[2].is_available = False
+        drivers[2].save()
+
+        result = prefilter_candidates(4.60971, -74.08175, 5)
+
+        self.assertEqual(
+            [driver_id for driver_id, _ in result], [drivers[1].id, drivers[0].id]
+        )
+        self.assertEqual(
+            prefilter_candidates(4.60971, -74.08175, 1)[0][0], drivers[1].id
+        )
+
+    def test_prefilter_candidates_widens_geohash_rings(self):
+        points = [(4.5 + (i % 10) * 0.04, -74.2 + (i // 10) * 0.025) for i in range(40)]
+        for i, (lat, lon) in enumerate(points):
+            address = Address.objects.create(
+                street=f"Street {i}", city="Bogotá", latitude=lat, longitude=lon
+            )
+            user = User.objects.create(username=f"ring{i}")
+            Driver.objects.create(user=user, current_address=address)
+        expected = sorted(
+            Driver.objects.select_related("current_address"),
+            key=lambda d: haversine_distance(
+                4.693408,
+                -74.112279,
+                d.current_address.latitude,
+                d.current_address.longitude,
+            ),
+        )[:3]
+
+        # Found within the geohash rings, without the full-scan fallback
+        with self.assertNumQueries(8):
+            result = prefilter_candidates(4.693408, -74.112279, 3)
+
+        self.assertEqual(
+            [driver_id for driver_id, _ in result], [d.id for d in expected]
+        )
+
+
+class RouteCacheTests(TestCase):
+    def setUp(self):
+        driver_index.clear()
+        route_cache.clear()
+        ors.reset()
+
+    def test_snapped_coordinates_share_an_entry(self):
+        cache = RouteCache(max_entries=10, ttl=60, precision=3)
+        cache.set((-74.11231, 4.69341), (-74.0721, 4.711), (3.2, 12))
+
+        self.assertEqual(cache.get((-74.11229, 4.69338), (-74.0721, 4.711)), (3.2, 12))
+        self.assertIsNone(cache.get((-74.2, 4.69338), (-74.0721, 4.711)))
+        self.assertIsNone(
+            cache.get((-74.11231, 4.69341), (-74.0721, 4.711), profile="driving-car")
+        )
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 2)
+
+    def test_lru_eviction_and_ttl(self):
+        cache = RouteCache(max_entries=2, ttl=60)
+        cache.set((0, 0), (0, 1), (1.0, 1))
+        cache.set((0, 0), (0, 2), (2.0, 2))
+        cache.get((0, 0), (0, 1))
+        cache.set((0, 0), (0, 3), (3.0, 3))
+
+        # (0, 2) was the least recently used entry
+        self.assertIsNone(cache.get((0, 0), (0, 2)))
+        self.assertEqual(cache.get((0, 0), (0, 1)), (1.0, 1))
+
+        with patch(
+            "services.helpers.time.monotonic", return_value=time.monotonic() + 61
+        ):
+            self.assertIsNone(cache.get((0, 0), (0, 1)))
+
+    def test_zero_settings_are_not_replaced_by_the_defaults(self):
+        disabled = RouteCache(ttl=0)
+        disabled.set((0, 0), (0, 1), (1.0, 1))
+        self.assertIsNone(disabled.get((0, 0), (0, 1)))
+
+        coarse = RouteCache(ttl=60, precision=0)
+        coarse.set((-74.1, 4.6), (-74.2, 4.7), (1.0, 1))
+        self.assertEqual(coarse.get((-74.3, 4.9), (-74.4, 4.8)), (1.0, 1))
+
+    @override_settings(
+        CACHES={"routes": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    )
+    def test_shared_backend(self):
+        writer = RouteCache(backend="routes")
+        reader = RouteCache(backend="routes")
+        writer.set((0, 0), (0, 1), (1.0, 1))
+
+        self.assertEqual(reader.get((0, 0), (0, 1)), (1.0, 1))
+
+    def test_async_lookups_await_the_shared_backend(self):
+        shared = MagicMock()
+        shared.get.side_effect = shared.set.side_effect = AssertionError(
+            "blocking call on the event loop"
+        )
+        shared.aget = AsyncMock(return_value=(1.0, 1))
+        shared.aset = AsyncMock()
+        cache = RouteCache(backend="routes")
+
+        async def lookups():
+            await cache.aset((0, 0), (0, 2), (2.0, 2))
+            return await cache.aget((0, 0), (0, 1)), await cache.aget((0, 0), (0, 2))
+
+        with patch("services.helpers.caches", {"routes": shared}):
+            self.assertEqual(asyncio.run(lookups()), ((1.0, 1), (2.0, 2)))
+
+        # The local tier answered the second lookup
+        shared.aget.assert_awaited_once()
+        shared.aset.assert_awaited_once()
+        self.assertEqual(cache.get((0, 0), (0, 1)), (1.0, 1))
+
+    @patch("services.helpers.openrouteservice.Client.distance_matrix")
+    def test_cache_hit_skips_ors(self, mock_matrix):
+        address = Address.objects.create(
+            street="Cl. 70 #10-15", city="Bogotá", latitude=4.7110, longitude=-74.0721
+        )
+        user = User.objects.create(username="cached")
+        driver = Driver.objects.create(user=user, current_address=address)
+        mock_matrix.return_value = {"distances": [[5000]], "durations": [[900]]}
+        pickup_address = MagicMock()
+        pickup_address.latitude = 4.693408
+        pickup_address.longitude = -74.112279
+
+        first = find_nearest_driver(pickup_address)
+        pickup_address.latitude = 4.693409  # same pickup after snapping
+        second = find_nearest_driver(pickup_address)
+
+        self.assertEqual(first, (driver, 5.0, 15))
+        self.assertEqual(second, first)
+        self.assertEqual(mock_matrix.call_count, 1)
+
+
+class ServiceAssignmentQueueTests(TestCase):
+    def setUp(self):
+        driver_index.clear()
+        route_cache.clear()
+        ors.reset()
+        self.client = APIClient()
+        self.client_user = User.objects.create(username="queued_client")
+        self.client.force_authenticate(user=self.client_user)
+
+        address = Address.objects.create(
+            street="Cl. 70 #10-15", city="Bogotá", latitude=4.7110, longitude=-74.0721
+        )
+        user = User.objects.create(username="queued_driver")
+        self.driver = Driver.objects.create(user=user, current_address=address)
+
+        self.pickup_address_data = {
+            "street": "Cl. 68a #90a – 31",
+            "city": "Bogotá",
+            "latitude": 4.693408,
+            "longitude": -74.112279,
+        }
+
+    def test_worker_survives_a_failed_pass(self):
+        stop = threading.Event()
+        calls = []
+
+        def process():
+            calls.append(None)
+            if len(calls) == 1:
+                raise OperationalError("database is locked")
+            stop.set()
+            return 0
+
+        with patch(
+            "services.management.commands.process_service_requests."
+            "process_pending_services",
+            side_effect=process,
+        ), self.assertLogs(
+            "services.management.commands.process_service_requests", "ERROR"
+        ):
+            # On a thread of its own, like in the command: work() closes
+            # its connection when it stops
+            worker = threading.Thread(
+                target=ProcessServiceRequestsCommand().work,
+                args=({"once": False, "poll_interval": 0}, stop),
+            )
+            worker.start()
+            worker.join(timeout=5)
+
+        self.assertEqual(len(calls), 2)
+
+    @override_settings(SERVICE_ASSIGNMENT_ASYNC=True)
+    @patch("services.service_request_management.rank_nearest_drivers")
+    def test_create_returns_202_and_worker_assigns(self, mock_find):
+        response = self.client.post(
+            reverse("service-list-create"),
+            {"pickup_address": self.pickup_address_data},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()["status"], ServiceRequest.Status.PENDING)
+        status_url = reverse("service-status", kwargs={"pk": response.json()["id"]})
+        self.assertEqual(response["Location"], status_url)
+        mock_find.assert_not_called()
+
+        mock_find.return_value = [(self.driver, 3.2, 12)]
+        self.assertEqual(process_pending_services(), 1)
+
+        status_response = self.client.get(status_url)
+        self.assertEqual(
+            status_response.json(),
+            {
+                "id": response.json()["id"],
+                "status": ServiceRequest.Status.IN_PROGRESS,
+                "assigned_driver": self.driver.id,
+                "estimated_time_minutes": 12,
+            },
+        )
+        self.driver.refresh_from_db()
+        self.assertFalse(self.driver.is_available)
+
+    @patch("services.service_request_management.rank_nearest_drivers")
+    def test_unassignable_requests_stay_pending(self, mock_find):
+        pickup_address = Address.objects.create(**self.pickup_address_data)
+        first = create_pending_service_request(self.client_user, pickup_address)
+        second = create_pending_service_request(self.client_user, pickup_address)
+
+        # The oldest request cannot be assigned, the next one still is
+        mock_find.side_effect = [
+            Exception("No available drivers"),
+            [(self.driver, 1.0, 4)],
+        ]
+
+        self.assertEqual(process_pending_services(), 1)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.status, ServiceRequest.Status.PENDING)
+        self.assertEqual(second.status, ServiceRequest.Status.IN_PROGRESS)
+        self.assertEqual(second.assigned_driver, self.driver)
+
+    @patch("services.service_request_management.rank_nearest_drivers")
+    def test_ranking_holds_no_transaction(self, mock_find):
+        depth = len(connection.atomic_blocks)
+
+        def rank(pickup_address):
+            # Neither the create view nor the queue worker is in a
+            # transaction of its own while ORS answers
+            self.assertEqual(len(connection.atomic_blocks), depth)
+            return [(self.driver, 3.2, 12)]
+
+        mock_find.side_effect = rank
+        response = self.client.post(
+            reverse("service-list-create"),
+            {"pickup_address": self.pickup_address_data},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+
+        Driver.objects.filter(id=self.driver.id).update(is_available=True)
+        pickup_address = Address.objects.create(**self.pickup_address_data)
+        create_pending_service_request(self.client_user, pickup_address)
+        self.assertEqual(process_pending_services(), 1)
+        self.assertEqual(mock_find.call_count, 2)
+
+    @patch("services.service_request_management.rank_nearest_drivers")
+    def test_request_assigned_while_ranking_is_left_alone(self, mock_find):
+        pickup_address = Address.objects.create(**self.pickup_address_data)
+        service = create_pending_service_request(self.client_user, pickup_address)
+
+        def rank(pickup_address):
+            # Another worker assigns the request meanwhile
+            ServiceRequest.objects.filter(id=service.id).update(
+                status=ServiceRequest.Status.CANCELLED
+            )
+            return [(self.driver, 3.2, 12)]
+
+        mock_find.side_effect = rank
+        self.assertEqual(assign_next_pending_service(), (service, False))
+        self.driver.refresh_from_db()
+        self.assertTrue(self.driver.is_available)
+
+
+class BatchDispatchTests(TestCase):
+    def setUp(self):
+        driver_index.clear()
+        route_cache.clear()
+        ors.reset()
+        self.client_user = User.objects.create(username="batch_client")
+
+    def create_driver(self, username, longitude):
+        address = Address.objects.create(
+            street="Calle 26", city="Bogotá", latitude=4.65, longitude=longitude
+        )
+        user = User.objects.create(username=username)
+        return Driver.objects.create(user=user, current_address=address)
+
+    def create_pending(self, longitude):
+        pickup_address = Address.objects.create(
+            street="Carrera 7", city="Bogotá", latitude=4.65, longitude=longitude
+        )
+        return create_pending_service_request(self.client_user, pickup_address)
+
+    def test_solve_assignment_minimises_total_cost(self):
+        costs = np.array([[1.4, 1.6], [1.0, 4.0]])
+        self.assertEqual(sorted(solve_assignment(costs)), [(0, 1), (1, 0)])
+
+        # Pairs with non-finite costs are never matched
+        costs = np.array([[np.inf, 2.0], [np.inf, 1.0]])
+        self.assertEqual(solve_assignment(costs), [(1, 1)])
+
+    def test_parallel_components_match_single_solve(self):
+        rng = np.random.default_rng(0)
+        costs = np.full((40, 60), np.inf)
+        for block in range(4):
+            rows = slice(block * 10, block * 10 + 10)
+            cols = slice(block * 15, block * 15 + 15)
+            costs[rows, cols] = rng.uniform(1, 30, (10, 15))
+
+        single = solve_assignment(costs)
+        parallel = solve_assignment(costs, parallel_threshold=10)
+
+        self.assertEqual(len(parallel), 40)
+        self.assertAlmostEqual(
+            sum(costs[r, c] for r, c in single), sum(costs[r, c] for r, c in parallel)
+        )
+
+    def test_batch_beats_greedy_order(self):
+        """
+        Greedy would give the first request driver A, leaving the second
+        request the far driver B. The batch assigns both near drivers.
+        """
+        driver_a = self.create_driver("driver_a", -74.100)
+        driver_b = self.create_driver("driver_b", -74.070)
+        first = self.create_pending(-74.086)
+        second = self.create_pending(-74.110)
+
+        with FakeORSServer(speed_kmh=6) as fake:
+            with patch(
+                "services.helpers.client",
+                openrouteservice.Client(
+                    base_url=fake.url, retry_over_query_limit=False
+                ),
+            ):
+                self.assertEqual(dispatch_pending_batch(), 2)
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.assigned_driver, driver_b)
+        self.assertEqual(second.assigned_driver, driver_a)
+        self.assertEqual(first.status, ServiceRequest.Status.IN_PROGRESS)
+        self.assertEqual(fake.calls["matrix"], 1)
+        self.assertFalse(Driver.objects.filter(is_available=True).exists())
+        self.assertEqual(driver_index.nearest(4.65, -74.1, 2), [])
+
+    def test_routing_failure_leaves_batch_pending(self):
+        driver = self.create_driver("driver_a", -74.100)
+        service = self.create_pending(-74.086)
+
+        with patch(
+            "services.dispatch.get_route_matrix", side_effect=CircuitOpen("open")
+        ):
+            with self.assertLogs("services.dispatch", "WARNING"):
+                self.assertEqual(dispatch_pending_batch(), 0)
+
+        service.refresh_from_db()
+        driver.refresh_from_db()
+        self.assertEqual(service.status, ServiceRequest.Status.PENDING)
+        self.assertTrue(driver.is_available)
+
+    def test_drivers_claimed_while_routing_are_skipped(self):
+        """
+        Drivers are only locked after routing, so one claimed meanwhile must
+        be re-checked and left out of the matching.
+        """
+        driver_a = self.create_driver("driver_a", -74.100)
+        driver_b = self.create_driver("driver_b", -74.070)
+        service = self.create_pending(-74.100)
+
+        def route_then_claim(*args):
+            durations = route_batch(*args)
+            claim_driver(driver_a)
+            return durations
+
+        with FakeORSServer(speed_kmh=6) as fake:
+            with patch(
+                "services.helpers.client",
+                openrouteservice.Client(
+                    base_url=fake.url, retry_over_query_limit=False
+                ),
+            ), patch("services.dispatch.route_batch", route_then_claim):
+                self.assertEqual(dispatch_pending_batch(), 1)
+
+        service.refresh_from_db()
+        self.assertEqual(service.assigned_driver, driver_b)
+
+    @override_settings(DRIVER_SPATIAL_INDEX=False)
+    def test_uses_ring_query_without_spatial_index(self):
+        driver = self.create_driver("driver_a", -74.100)
+        service = self.create_pending(-74.101)
+        driver_index.clear()
+
+        with FakeORSServer(speed_kmh=6) as fake:
+            with patch(
+                "services.helpers.client",
+                openrouteservice.Client(
+                    base_url=fake.url, retry_over_query_limit=False
+                ),
+            ):
+                self.assertEqual(dispatch_pending_batch(), 1)
+
+        service.refresh_from_db()
+        self.assertEqual(service.assigned_driver, driver)
+
+
+class DriverClaimTests(TestCase):
+    def setUp(self):
+        driver_index.clear()
+        route_cache.clear()
+        ors.reset()
+        self.client_user = User.objects.create(username="claim_client")
+        self.drivers = []
+        for i, longitude in enumerate([-74.10, -74.09, -74.08]):
+            address = Address.objects.create(
+                street=f"Calle {i}", city="Bogotá", latitude=4.65, longitude=longitude
+            )
+            user = User.objects.create(username=f"claim_driver{i}")
+            self.drivers.append(
+                Driver.objects.create(user=user, current_address=address)
+            )
+        self.pickup_address = Address.objects.create(
+            street="Carrera 7", city="Bogotá", latitude=4.65, longitude=-74.105
+        )
+
+    def test_claim_is_conditional(self):
+        driver = self.drivers[0]
+        stale_copy = Driver.objects.get(id=driver.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(claim_driver(driver))
+        self.assertFalse(claim_driver(stale_copy))
+        self.assertNotIn(
+            driver.id,
+            [driver_id for driver_id, _ in driver_index.nearest(4.65, -74.1, 3)],
+        )
+
+    @patch("services.helpers.openrouteservice.Client.distance_matrix")
+    def test_falls_through_to_next_candidate_without_rerouting(self, mock_matrix):
+        mock_matrix.return_value = {
+            "distances": [[500, 1500, 2500]],
+            "durations": [[120, 360, 600]],
+        }
+        # Another request claims the best driver after the ranking was made
+        original_claim = claim_driver
+
+        def claim_after_race(driver):
+            if driver == self.drivers[0]:
+                Driver.objects.filter(id=driver.id).update(is_available=False)
+            return original_claim(driver)
+
+        with patch(
+            "services.service_request_management.claim_driver", claim_after_race
+        ):
+            driver, estimated_time = assign_driver_to_service(self.pickup_address)
+
+        self.assertEqual(driver, self.drivers[1])
+        self.assertEqual(estimated_time, 6)
+        self.assertEqual(mock_matrix.call_count, 1)
+
+    def test_completion_is_a_single_transition(self):
+        service = ServiceRequest.objects.create(
+            client=self.client_user,
+            pickup_address=self.pickup_address,
+            assigned_driver=self.drivers[0],
+            status=ServiceRequest.Status.IN_PROGRESS,
+        )
+        claim_driver(self.drivers[0])
+
+        update_service_driver(service, ServiceRequest.Status.COMPLETED)
+        self.drivers[0].refresh_from_db()
+        self.assertTrue(self.drivers[0].is_available)
+
+        # The driver takes a new job; completing the old service again must
+        # not free them
+        claim_driver(self.drivers[0])
+        with self.assertRaises(ValidationError):
+            update_service_driver(service, ServiceRequest.Status.COMPLETED)
+        self.drivers[0].refresh_from_db()
+        self.assertFalse(self.drivers[0].is_available)
+
+
+@skipUnless(
+    connection.vendor == "postgresql", "Needs row-level locking under concurrency"
+)
+class DriverClaimConcurrencyTests(TransactionTestCase):
+    def test_no_double_assignment_under_parallel_requests(self):
+        driver_index.clear()
+        client_user = User.objects.create(username="stress_client")
+        drivers = []
+        for i in range(5):
+            address = Address.objects.create(
+                street=f"Calle {i}", city="Bogotá", latitude=4.65, longitude=-74.1
+            )
+            user = User.objects.create(username=f"stress_driver{i}")
+            drivers.append(Driver.objects.create(user=user, current_address=address))
+        ranking = [(driver, 1.0, 5) for driver in drivers]
+        requests_count = 50
+        barrier = threading.Barrier(requests_count)
+
+        def request_service(i):
+            try:
+                pickup_address = Address.objects.create(
+                    street="Carrera 7", city="Bogotá", latitude=4.65, longitude=-74.1
+                )
+                barrier.wait()
+                with transaction.atomic():
+                    driver, estimated_time = assign_driver_to_service(pickup_address)
+                    create_service_request(
+                        client_user, pickup_address, driver, estimated_time
+                    )
+                return driver.id
+            except ValidationError:
+                return None
+            finally:
+                connection.close()
+
+        with patch(
+            "services.service_request_management.rank_nearest_drivers",
+            return_value=ranking,
+        ):
+            with concurrent.futures.ThreadPoolExecutor(requests_count) as executor:
+                results = list(executor.map(request_service, range(requests_count)))
+
+        assigned = [driver_id for driver_id in results if driver_id is not None]
+        self.assertEqual(sorted(assigned), sorted(driver.id for driver in drivers))
+        self.assertEqual(
+            ServiceRequest.objects.values("assigned_driver").distinct().count(), 5
+        )
+        self.assertFalse(Driver.objects.filter(is_available=True).exists())
+
+
+class ServiceRequestListTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username="history")
+        self.client.force_authenticate(user=self.user)
+        self.other_client = User.objects.create(username="other_client")
+
+        self.drivers = []
+        for i in range(3):
+            address = Address.objects.create(
+                street=f"Driver St {i}", city="Bogotá", latitude=4.6, longitude=-74.08
+            )
+            user = User.objects.create(username=f"list_driver_{i}")
+            self.drivers.append(
+                Driver.objects.create(user=user, current_address=address)
+            )
+
+        pickup = Address.objects.create(
+            street="Pickup St", city="Bogotá", latitude=4.65, longitude=-74.1
+        )
+        self.services = [
+            ServiceRequest.objects.create(
+                client=self.user if i % 2 else self.other_client,
+                pickup_address=pickup,
+                assigned_driver=self.drivers[i % 3],
+                status=(
+                    ServiceRequest.Status.COMPLETED
+                    if i % 3 == 0
+                    else ServiceRequest.Status.IN_PROGRESS
+                ),
+            )
+            for i in range(12)
+        ]
+        self.url = reverse("service-list-create")
+
+    def walk(self, url):
+        ids = []
+        pages = 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(row["id"] for row in response.data["results"])
+            url = response.data["next"]
+            pages += 1
+        return ids, pages
+
+    def test_pages_are_ordered_newest_first(self):
+        ids, pages = self.walk(f"{self.url}?page_size=5")
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(ids, [service.id for service in reversed(self.services)])
+
+    def test_ties_on_created_at_are_broken_by_id(self):
+        ServiceRequest.objects.update(created_at=self.services[0].created_at)
+
+        ids, _ = self.walk(f"{self.url}?page_size=5")
+
+        self.assertEqual(ids, sorted((s.id for s in self.services), reverse=True))
+
+    def test_page_cost_does_not_depend_on_its_size(self):
+        # A single JOIN query for the whole page, whatever its size
+        with self.assertNumQueries(1):
+            small = self.client.get(f"{self.url}?page_size=2")
+        with self.assertNumQueries(1):
+            large = self.client.get(f"{self.url}?page_size=12")
+
+        self.assertEqual(len(small.data["results"]), 2)
+        self.assertEqual(len(large.data["results"]), 12)
+        row = large.data["results"][0]
+        self.assertEqual(row["client"], "history")
+        self.assertEqual(row["assigned_driver"]["user"], "list_driver_2")
+        self.assertEqual(row["pickup_address"]["street"], "Pickup St")
+
+    def test_filters(self):
+        ids, _ = self.walk(f"{self.url}?status=completed")
+        self.assertEqual(len(ids), 4)
+
+        ids, _ = self.walk(
+            f"{self.url}?client={self.user.id}&driver={self.drivers[1].id}"
+        )
+        expected = [
+            s.id
+            for s in self.services
+            if s.client == self.user and s.assigned_driver == self.drivers[1]
+        ]
+        self.assertEqual(sorted(ids), expected)
+
+        self.assertEqual(self.client.get(f"{self.url}?status=lost").status_code, 400)
+        self.assertEqual(self.client.get(f"{self.url}?driver=abc").status_code, 400)
+        self.assertEqual(
+            self.client.get(f"{self.url}?cursor=nonsense").status_code, 404
+        )
+
+
+class EndpointBudgetTests(TransactionTestCase):
+    """
+    Query-count regression guard for every endpoint. Runs on a
+    TransactionTestCase so the on_commit hooks that keep the spatial index
+    in step fire as they do in production.
+    """
+
+    def test_endpoints_stay_within_query_budgets(self):
+        response_cache.clear()
+        users = seed_volume(services=300, drivers=60, clients=10)
+
+        report = EndpointBenchmark(users, iterations=5, ors_latency=0).run()
+
+        for name, row in report.items():
+            if name.startswith("_"):
+                continue
+            with self.subTest(endpoint=name):
+                self.assertLess(max(row["status"]), 300, row)
+                self.assertLessEqual(row["queries"], row["budget"], row)
+        self.assertEqual(over_budget(report), [])
+
+
+class BulkSeedTests(TestCase):
+    def test_seeds_consistent_rows_in_chunks(self):
+        seeder = BulkSeeder(chunk_size=7, hotspots=2, password="secret")
+
+        created = seeder.seed(
+            addresses=5, drivers=12, clients=3, services=20, busy_ratio=0.5, days=30
+        )
+
+        busy = Driver.objects.filter(is_available=False)
+        self.assertEqual(created["drivers_driver"], 12)
+        self.assertEqual(created["services_servicerequest"], 20 + busy.count())
+        self.assertEqual(Address.objects.count(), 5 + 12 + 20 + busy.count())
+        self.assertEqual(User.objects.filter(userprofile__is_driver=True).count(), 12)
+        self.assertEqual(User.objects.filter(userprofile__is_driver=False).count(), 3)
+        # Every busy driver is on one in-progress service
+        self.assertEqual(
+            set(busy),
+            {
+                service.assigned_driver
+                for service in ServiceRequest.objects.filter(
+                    status=ServiceRequest.Status.IN_PROGRESS
+                )
+            },
+        )
+        for address in Address.objects.all()[:10]:
+            self.assertEqual(
+                address.geohash, geohash.encode(address.latitude, address.longitude)
+            )
+        driver_user = User.objects.filter(username__startswith="driver_").first()
+        self.assertTrue(driver_user.check_password("secret"))
+        history = ServiceRequest.objects.exclude(
+            status=ServiceRequest.Status.IN_PROGRESS
+        )
+        oldest = history.order_by("created_at").first().created_at
+        self.assertGreater((timezone.now() - oldest).days, 1)
+
+    def test_hotspots_cluster_coordinates(self):
+        rng = np.random.default_rng(0)
+        centres = np.array([[4.7, -74.15]])
+
+        latitudes, longitudes = sample_coordinates(
+            rng, 1000, centres, hotspot_share=1.0
+        )
+
+        distances = haversine_many(4.7, -74.15, latitudes, longitudes)
+        self.assertLess(np.median(distances), 3)
+        self.assertTrue(((latitudes >= 4.5) & (latitudes <= 4.9)).all())
+        self.assertTrue(((longitudes >= -74.2) & (longitudes <= -74.1)).all())
+
+    def test_rejects_services_without_clients(self):
+        with self.assertRaises(ValueError):
+            BulkSeeder().seed(drivers=2, services=5)
+
+
+class TrafficReplayTests(TransactionTestCase):
+    def test_replays_pickups_and_completions(self):
+        users = seed_volume(services=0, drivers=10, clients=1)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "trace.jsonl")
+            generate_trace(path, requests=6, rate=100, service_seconds=0.05)
+            events = read_trace(path)
+
+        report = TrafficReplay(users, concurrency=1, ors_latency=0).run(events)
+
+        self.assertEqual(len(events), 12)
+        self.assertEqual(report["pickup"]["status"], {201: 6})
+        self.assertEqual(report["complete"]["status"], {200: 6})
+        self.assertLessEqual(
+            report["pickup"]["queries_max"], QUERY_BUDGETS["services-create"]
+        )
+        self.assertLessEqual(
+            report["complete"]["queries_max"], QUERY_BUDGETS["services-complete"]
+        )
+        self.assertGreater(report["_meta"]["utilization_peak"], 0)
+        self.assertFalse(Driver.objects.filter(is_available=False).exists())
+
+    def test_latency_distributions(self):
+        self.assertEqual(latency_distribution("0.2"), 0.2)
+        self.assertEqual(latency_distribution("fixed:0.2"), 0.2)
+        uniform = latency_distribution("uniform:0.1,0.3")
+        self.assertTrue(all(0.1 <= uniform() <= 0.3 for _ in range(100)))
+        lognormal = latency_distribution("lognormal:0.1,0.5")
+        self.assertAlmostEqual(np.median([lognormal() for _ in range(2000)]), 0.1, 2)
+        for spec in ("slow", "uniform:0.1", "gamma:1,2"):
+            with self.assertRaises(ValueError):
+                latency_distribution(spec)
+
+
+class QueryPlanTests(TestCase):
+    """
+    Runs the hot queries of the views, the pending queue and
+    find_nearest_driver on a seeded, analyzed database and fails if any of
+    them reads a table sequentially.
+    """
+
+    TABLES = {
+        "addresses_address",
+        "drivers_driver",
+        "services_servicerequest",
+        "auth_user",
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_volume(services=3000, drivers=1000, clients=100)
+        cls.pending = ServiceRequest.objects.filter(
+            status=ServiceRequest.Status.IN_PROGRESS
+        )[:5]
+        ServiceRequest.objects.filter(id__in=[s.id for s in cls.pending]).update(
+            status=ServiceRequest.Status.PENDING
+        )
+        analyze()
+
+    def setUp(self):
+        driver_index.clear()
+        route_cache.clear()
+        ors.reset()
+        response_cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.users["client"])
+
+    def test_list_and_detail_views(self):
+        service = ServiceRequest.objects.first()
+        urls = [
+            reverse("service-list-create"),
+            reverse("service-list-create") + "?status=completed",
+            reverse("service-list-create") + f"?client={self.users['client'].id}",
+            reverse("service-list-create") + f"?driver={service.assigned_driver_id}",
+            reverse("service-retrieve-update-destroy", kwargs={"pk": service.id}),
+            reverse("driver-list-create"),
+            reverse("address-list-create"),
+        ]
+        for url in urls:
+            with self.subTest(url=url), assert_no_sequential_scans(self.TABLES):
+                # Second page too, so the keyset filter is explained as well
+                response = self.client.get(
+                    url + ("&" if "?" in url else "?") + "page_size=5"
+                )
+                if response.data.get("next"):
+                    self.client.get(response.data["next"])
+
+    @patch("services.helpers.openrouteservice.Client.distance_matrix")
+    def test_find_nearest_driver(self, mock_matrix):
+        mock_matrix.side_effect = lambda locations, **kwargs: {
+            "distances": [[1000.0] * (len(locations) - 1)],
+            "durations": [[60.0 * (i + 1) for i in range(len(locations) - 1)]],
+        }
+        pickup_address = Address(latitude=4.7, longitude=-74.15)
+
+        for spatial_index in (True, False):
+            with self.subTest(spatial_index=spatial_index), self.settings(
+                DRIVER_SPATIAL_INDEX=spatial_index
+            ), assert_no_sequential_scans(self.TABLES):
+                find_nearest_driver(pickup_address)
+
+    @patch("services.service_request_management.rank_nearest_drivers")
+    def test_pending_queue_and_completion(self, mock_rank):
+        driver = Driver.objects.filter(is_available=True).first()
+        mock_rank.return_value = [(driver, 1.0, 5)]
+
+        with assert_no_sequential_scans(self.TABLES):
+            assign_next_pending_service()
+
+        service = ServiceRequest.objects.filter(
+            status=ServiceRequest.Status.IN_PROGRESS
+        ).first()
+        with assert_no_sequential_scans(self.TABLES):
+            update_service_driver(service, ServiceRequest.Status.COMPLETED)
+
+    def test_sequential_scans_are_reported(self):
+        with self.assertRaises(AssertionError):
+            with assert_no_sequential_scans(self.TABLES):
+                list(ServiceRequest.objects.filter(estimated_time_minutes=7))
+
+        # A LIMIT does not hide a scan that filters the rows it walks
+        with self.assertRaises(AssertionError):
+            with assert_no_sequential_scans(self.TABLES):
+                list(
+                    ServiceRequest.objects.filter(estimated_time_minutes=7).order_by(
+                        "id"
+                    )[:5]
+                )
+
+
+class EtaModelTests(TestCase):
+    def setUp(self):
+        driver_index.clear()
+        route_cache.clear()
+        ors.reset()
+        eta_model.clear()
+        self.client_user = User.objects.create(username="eta_client")
+
+    def create_history(
+        self,
+        latitude,
+        longitude,
+        minutes_per_km,
+        count,
+        source=ServiceRequest.EtaSource.ROUTED,
+    ):
+        pickup = Address.objects.create(
+            street="Pickup", city="Bogotá", latitude=latitude, longitude=longitude
+        )
+        ServiceRequest.objects.bulk_create(
+            [
+                ServiceRequest(
+                    client=self.client_user,
+                    pickup_address=pickup,
+                    pickup_distance_km=2.0,
+                    estimated_time_minutes=int(2.0 * minutes_per_km),
+                    eta_source=source,
+                    status=ServiceRequest.Status.COMPLETED,
+                )
+                for _ in range(count)
+            ]
+        )
+
+    def test_training_learns_zone_factors_with_fallbacks(self):
+        # A congested zone in the north and a fast one in the south
+        self.create_history(4.75, -74.05, 8, 30)
+        self.create_history(4.55, -74.15, 3, 30)
+        self.create_history(4.65, -74.10, 5, 3)
+
+        self.assertEqual(train_eta_model(min_samples=20), 63)
+
+        slot = eta_model.slot()
+        self.assertEqual(eta_model.factor(eta_model.zone(4.75, -74.05), slot), 8)
+        self.assertEqual(eta_model.factor(eta_model.zone(4.55, -74.15), slot), 3)
+        # Too few samples of its own: falls back to the overall median
+        self.assertEqual(eta_model.factor(eta_model.zone(4.65, -74.10), slot), 5)
+        np.testing.assert_allclose(
+            eta_model.estimate([1.0, 2.0], 4.75, -74.05), [8, 16]
+        )
+
+    def test_training_ignores_unrouted_etas(self):
+        self.create_history(4.75, -74.05, 8, 30)
+        # The model's own estimates, and rows from before sources were kept
+        self.create_history(4.75, -74.05, 2, 30, ServiceRequest.EtaSource.MODEL)
+        self.create_history(4.75, -74.05, 2, 30, ServiceRequest.EtaSource.GRID)
+        self.create_history(4.75, -74.05, 2, 30, None)
+
+        self.assertEqual(train_eta_model(min_samples=20), 30)
+        self.assertEqual(
+            eta_model.factor(eta_model.zone(4.75, -74.05), eta_model.slot()), 8
+        )
+
+    def test_untrained_model_uses_default_speed(self):
+        self.assertAlmostEqual(float(eta_model.estimate(1.0, 4.6, -74.1)), 5.2)
+
+    @patch("services.helpers.openrouteservice.Client.directions")
+    @patch("services.helpers.openrouteservice.Client.distance_matrix")
+    def test_ranks_locally_and_refines_only_the_top(self, mock_matrix, mock_directions):
+        drivers = []
+        for i, latitude in enumerate([4.70, 4.71, 4.72, 4.73]):
+            address = Address.objects.create(
+                street=f"Driver {i}", city="Bogotá", latitude=latitude, longitude=-74.1
+            )
+            user = User.objects.create(username=f"eta_driver_{i}")
+            drivers.append(Driver.objects.create(user=user, current_address=address))
+        pickup = Address(latitude=4.69, longitude=-74.1)
+        mock_matrix.return_value = {
+            "distances": [[1500.0, 2000.0]],
+            "durations": [[600.0, 360.0]],
+        }
+
+        with self.settings(ETA_MODEL_RANKING=True, ETA_REFINE_TOP=2):
+            ranked = rank_nearest_drivers(pickup)
+
+        locations = mock_matrix.call_args.kwargs["locations"]
+        self.assertEqual(len(locations), 3)
+        # ORS swapped the two refined drivers; the rest keep local estimates
+        self.assertEqual(
+            [driver for driver, _, _ in ranked], [drivers[1], drivers[0], *drivers[2:]]
+        )
+        self.assertEqual(ranked[0][2], 6)
+        self.assertEqual(
+            ranked[2][2],
+            round(
+                eta_model.estimate(
+                    haversine_distance(4.69, -74.1, 4.72, -74.1), 4.69, -74.1
+                ).item()
+            ),
+        )
+
+        # ORS down: every ETA is local and the assignment still succeeds
+        route_cache.clear()
+        mock_matrix.side_effect = RuntimeError("ORS down")
+        mock_directions.side_effect = RuntimeError("ORS down")
+        with self.settings(ETA_MODEL_RANKING=True), self.assertLogs(
+            "services.helpers", level="WARNING"
+        ):
+            ranked = rank_nearest_drivers(pickup)
+        self.assertEqual([driver for driver, _, _ in ranked], drivers)
+
+        # The local estimates are stored as such, so they are never trained on
+        pickup.street, pickup.city = "Pickup", "Bogotá"
+        pickup.save()
+        driver, minutes = claim_ranked_driver(ranked)
+        service = create_service_request(self.client_user, pickup, driver, minutes)
+        service.status = ServiceRequest.Status.COMPLETED
+        service.save()
+        service.refresh_from_db()
+        self.assertEqual(service.eta_source, ServiceRequest.EtaSource.MODEL)
+        self.assertEqual(train_eta_model(), 0)
+
+    def test_assignment_records_straight_line_distance(self):
+        address = Address.objects.create(
+            street="Driver", city="Bogotá", latitude=4.70, longitude=-74.1
+        )
+        driver = Driver.objects.create(
+            user=User.objects.create(username="eta_recorded"), current_address=address
+        )
+        pickup = Address.objects.create(
+            street="Pickup", city="Bogotá", latitude=4.69, longitude=-74.1
+        )
+
+        service = create_service_request(self.client_user, pickup, driver, 5)
+
+        self.assertEqual(service.eta_source, ServiceRequest.EtaSource.ROUTED)
+        self.assertAlmostEqual(
+            service.pickup_distance_km, haversine_distance(4.70, -74.1, 4.69, -74.1)
+        )
+
+
+class RoutingClientTests(TestCase):
+    def setUp(self):
+        driver_index.clear()
+        route_cache.clear()
+        ors.reset()
+        self.routing = RoutingClient(
+            max_workers=4,
+            hedge_after=0.05,
+            breaker=CircuitBreaker(threshold=3, cooldown=0.1),
+        )
+
+    def test_slow_call_is_hedged(self):
+        calls = []
+
+        def route():
+            calls.append(1)
+            if len(calls) == 1:
+                time.sleep(0.5)
+                return "slow"
+            return "fast"
+
+        started = time.monotonic()
+        self.assertEqual(self.routing.call(route), "fast")
+
+        self.assertLess(time.monotonic() - started, 0.4)
+        self.assertEqual(len(calls), 2)
+        stats = self.routing.stats()
+        self.assertEqual((stats["hedges"], stats["hedge_wins"]), (1, 1))
+
+    def test_failed_and_late_calls_only_fail_their_key(self):
+        def fail():
+            raise RuntimeError("boom")
+
+        started = time.monotonic()
+        results, errors = self.routing.call_many(
+            {"ok": lambda: 1, "failed": fail, "slow": lambda: time.sleep(0.5)},
+            Deadline(0.2),
+            hedge=False,
+        )
+
+        self.assertLess(time.monotonic() - started, 0.4)
+        self.assertEqual(results, {"ok": 1})
+        self.assertIsInstance(errors["failed"], RuntimeError)
+        self.assertIsInstance(errors["slow"], DeadlineExceeded)
+
+    def test_circuit_opens_after_consecutive_failures(self):
+        route = MagicMock(side_effect=RuntimeError("ORS down"))
+        with self.assertLogs("services.ors_client", level="WARNING"):
+            for _ in range(3):
+                with self.assertRaises(RuntimeError):
+                    self.routing.call(route, hedge=False)
+
+        # Refused without calling ORS while the circuit is open
+        with self.assertRaises(CircuitOpen):
+            self.routing.call(route)
+        self.assertEqual(route.call_count, 3)
+        self.assertEqual(self.routing.stats()["circuit"], CircuitBreaker.OPEN)
+
+        # After the cooldown one trial call closes it again
+        time.sleep(0.1)
+        route.side_effect = None
+        route.return_value = "route"
+        self.assertEqual(self.routing.call(route), "route")
+        self.assertEqual(self.routing.stats()["circuit"], CircuitBreaker.CLOSED)
+
+    def test_full_queue_refuses_calls_without_opening_circuit(self):
+        routing = RoutingClient(max_workers=1, max_queue=1, hedge_after=0)
+        release = threading.Event()
+
+        def route():
+            release.wait(1)
+            return "route"
+
+        threading.Timer(0.1, release.set).start()
+        results, errors = routing.call_many(
+            {"running": route, "queued": route, "refused": route}
+        )
+
+        self.assertEqual(results, {"running": "route", "queued": "route"})
+        self.assertIsInstance(errors["refused"], QueueFull)
+        stats = routing.stats()
+        self.assertEqual((stats["rejected"], stats["queue_depth"]), (1, 0))
+        self.assertEqual(stats["circuit"], CircuitBreaker.CLOSED)
+        self.assertGreaterEqual(stats["queue_wait_max_ms"], 50)
+
+    def test_pooled_session_reuses_connections(self):
+        with FakeORSServer() as fake:
+            ors_client = PooledORSClient(
+                base_url=fake.url, retry_over_query_limit=False, pool_size=2
+            )
+            for _ in range(3):
+                ors_client.directions(
+                    [(-74.1, 4.6), (-74.09, 4.61)], profile="cycling-road"
+                )
+
+        # Fails if openrouteservice stops sending through `_session`
+        self.assertEqual(
+            session_stats(ors_client.session),
+            {"http_requests": 3, "http_connections": 1, "connection_reuse": 0.667},
+        )
+
+    def test_routing_stats_are_admin_only(self):
+        api = APIClient()
+        api.force_authenticate(User.objects.create(username="ops"))
+        self.assertEqual(api.get(reverse("routing-stats")).status_code, 403)
+
+        api.force_authenticate(User.objects.create(username="admin", is_staff=True))
+        response = api.get(reverse("routing-stats"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("queue_depth", response.data["ors"])
+        self.assertEqual(response.data["ors"]["circuit"], CircuitBreaker.CLOSED)
+
+    @patch("services.helpers.openrouteservice.Client.distance_matrix")
+    def test_open_circuit_falls_back_to_straight_line_ranking(self, mock_matrix):
+        drivers = []
+        for i, latitude in enumerate([4.72, 4.70, 4.71]):
+            address = Address.objects.create(
+                street=f"Driver {i}", city="Bogotá", latitude=latitude, longitude=-74.1
+            )
+            user = User.objects.create(username=f"breaker_driver_{i}")
+            drivers.append(Driver.objects.create(user=user, current_address=address))
+        with self.assertLogs("services.ors_client", level="WARNING"):
+            for _ in range(ors.breaker.threshold):
+                ors.breaker.record_failure()
+
+        with self.assertLogs("services.helpers", level="WARNING"):
+            ranked = rank_nearest_drivers(Address(latitude=4.69, longitude=-74.1))
+
+        mock_matrix.assert_not_called()
+        self.assertEqual(
+            [driver for driver, _, _ in ranked], [drivers[1], drivers[2], drivers[0]]
+        )
+
+
+class RoutePruningTests(TestCase):
+    def setUp(self):
+        driver_index.clear()
+        route_cache.clear()
+        ors.reset()
+
+    def add_driver(self, name, latitude, longitude):
+        address = Address.objects.create(
+            street=name, city="Bogotá", latitude=latitude, longitude=longitude
+        )
+        user = User.objects.create(username=name)
+        return Driver.objects.create(user=user, current_address=address)
+
+    def rank(self, fake, pickup):
+        with patch(
+            "services.helpers.client",
+            openrouteservice.Client(base_url=fake.url, retry_over_query_limit=False),
+        ):
+            # A fixed candidate set, so only the pruning differs
+            return rank_nearest_drivers(
+                Address(latitude=pickup[0], longitude=pickup[1]), candidates_limit=10
+            )
+
+    def test_cached_routes_prune_the_matrix_request(self):
+        near = [self.add_driver(f"near{i}", 4.60 + 0.003 * i, -74.1) for i in range(3)]
+        with FakeORSServer() as fake:
+            self.rank(fake, (4.595, -74.1))
+            # Drivers who came online far away cannot beat the cached routes
+            for i in range(5):
+                self.add_driver(f"far{i}", 4.65 + 0.01 * i, -74.1)
+            driver_index.clear()
+            ranked = self.rank(fake, (4.595, -74.1))
+
+        self.assertEqual([driver for driver, _, _ in ranked[:3]], near)
+        self.assertEqual(fake.calls, {"directions": 0, "matrix": 1})
+        self.assertEqual(ors.stats()["pruned"], 5)
+        # The pruned drivers follow, closest first, with local estimates
+        self.assertEqual(
+            [driver.user.username for driver, _, _ in ranked[3:]],
+            [f"far{i}" for i in range(5)],
+        )
+        self.assertEqual(
+            {eta_source(minutes) for _, _, minutes in ranked[3:]},
+            {ServiceRequest.EtaSource.MODEL},
+        )
+
+    @override_settings(ROUTE_PRUNING_BATCH=3)
+    @patch("services.helpers.openrouteservice.Client.distance_matrix")
+    def test_directions_stop_once_the_rest_cannot_win(self, mock_matrix):
+        mock_matrix.side_effect = RuntimeError("matrix unavailable")
+        near = [self.add_driver(f"near{i}", 4.60 + 0.003 * i, -74.1) for i in range(3)]
+        for i in range(5):
+            self.add_driver(f"far{i}", 4.65 + 0.01 * i, -74.1)
+
+        with FakeORSServer() as fake, self.assertLogs("services.helpers", "WARNING"):
+            ranked = self.rank(fake, (4.595, -74.1))
+
+        self.assertEqual([driver for driver, _, _ in ranked[:3]], near)
+        self.assertEqual(len(ranked), 8)
+        self.assertEqual(fake.calls, {"directions": 3, "matrix": 0})
+        self.assertEqual(ors.stats()["pruned"], 5)
+
+    @patch("services.helpers.openrouteservice.Client.distance_matrix")
+    def test_pruning_keeps_the_chosen_driver(self, mock_matrix):
+        mock_matrix.side_effect = RuntimeError("matrix unavailable")
+        rng = np.random.default_rng(0)
+        for i, (lat, lon) in enumerate(
+            zip(rng.uniform(4.5, 4.9, 60), rng.uniform(-74.2, -74.1, 60))
+        ):
+            self.add_driver(f"random{i}", lat, lon)
+        pickups = list(zip(rng.uniform(4.5, 4.9, 10), rng.uniform(-74.2, -74.1, 10)))
+
+        chosen, calls = {}, {}
+        for pruning in (False, True):
+            route_cache.clear()
+            # Slower roads near the city edge, so the order differs from the
+            # straight-line one
+            with override_settings(ROUTE_PRUNING=pruning), FakeORSServer() as fake:
+                fake.route = lambda origin, destination, route=fake.route: tuple(
+                    value * (1 + 3 * abs(destination[0] + 74.15))
+                    for value in route(origin, destination)
+                )
+                with self.assertLogs("services.helpers", "WARNING"):
+                    chosen[pruning] = [
+                        self.rank(fake, pickup)[0][0] for pickup in pickups
+                    ]
+            calls[pruning] = fake.calls["directions"]
+
+        self.assertEqual(chosen[True], chosen[False])
+        self.assertLess(calls[True], calls[False])
+        self.assertGreater(ors.stats()["pruned"], 0)
+
+    def test_falls_through_to_pruned_drivers_when_routed_ones_are_taken(self):
+        near = self.add_driver("near", 4.60, -74.1)
+        pickup = Address.objects.create(
+            street="Pickup", city="Bogotá", latitude=4.595, longitude=-74.1
+        )
+        with FakeORSServer() as fake:
+            self.rank(fake, (4.595, -74.1))
+            far = [self.add_driver(f"far{i}", 4.65 + 0.01 * i, -74.1) for i in range(3)]
+            driver_index.clear()
+
+            def claimed_concurrently(driver):
+                # Another assignment takes the only routed driver first
+                if driver == near:
+                    Driver.objects.filter(id=near.id).update(is_available=False)
+                return claim_driver(driver)
+
+            with patch(
+                "services.helpers.client",
+                openrouteservice.Client(
+                    base_url=fake.url, retry_over_query_limit=False
+                ),
+            ), patch(
+                "services.service_request_management.claim_driver",
+                side_effect=claimed_concurrently,
+            ):
+                driver, minutes = assign_driver_to_service(pickup)
+
+        self.assertEqual(ors.stats()["pruned"], 3)
+        self.assertEqual(driver, far[0])
+        self.assertEqual(eta_source(minutes), ServiceRequest.EtaSource.MODEL)
+        self.assertFalse(Driver.objects.get(id=far[0].id).is_available)
+
+    def test_routing_client_abandons_calls_given_up(self):
+        routing = RoutingClient(max_workers=4, hedge_after=0)
+
+        started = time.monotonic()
+        results, errors = routing.call_many(
+            {"fast": lambda: 1, "slow": lambda: time.sleep(0.5)},
+            give_up=lambda results, pending: pending if results else set(),
+        )
+
+        self.assertLess(time.monotonic() - started, 0.4)
+        self.assertEqual((results, errors), ({"fast": 1}, {}))
+        self.assertEqual(routing.stats()["abandoned"], 1)
+
+
+class CandidateSizerTests(TestCase):
+    def setUp(self):
+        driver_index.clear()
+        route_cache.clear()
+        ors.reset()
+        candidate_sizer.clear()
+
+    def test_dense_pickup_routes_few_candidates(self):
+        sizer = CandidateSizer(min_candidates=3, max_candidates=15, spread=2.0)
+        # A driver on every 0.5 km grid point: the k-th closest is ~sqrt(k) away
+        distances = np.sort(np.hypot(*np.mgrid[-3:4, -3:4].reshape(2, -1)) * 0.5)[:15]
+
+        self.assertLessEqual(sizer.size(distances), 6)
+
+    def test_edge_pickup_routes_more_candidates(self):
+        sizer = CandidateSizer(min_candidates=3, max_candidates=15, spread=2.0)
+
+        # Closest drivers all about as far, as outside the city
+        self.assertEqual(sizer.size(np.linspace(5.0, 8.0, 15)), 15)
+        # Never fewer than min_candidates, never more than there are
+        self.assertEqual(sizer.size([0.1, 0.2, 20.0, 21.0, 22.0]), 3)
+        self.assertEqual(sizer.size([0.1, 5.0]), 2)
+        self.assertEqual(sizer.stats()["assignments"], 3)
+
+    def test_audit_counts_faster_driver_left_out(self):
+        drivers = []
+        for i, latitude in enumerate([4.600, 4.601, 4.602, 4.603, 4.65, 4.66]):
+            address = Address.objects.create(
+                street=f"Driver {i}", city="Bogotá", latitude=latitude, longitude=-74.1
+            )
+            user = User.objects.create(username=f"sized_driver_{i}")
+            drivers.append(Driver.objects.create(user=user, current_address=address))
+
+        with FakeORSServer() as fake, patch.object(candidate_sizer, "audit_rate", 1):
+            # Roads from the close drivers are blocked
+            fake.route = lambda origin, destination, route=fake.route: tuple(
+                value * (100 if max(origin[1], destination[1]) < 4.61 else 1)
+                for value in route(origin, destination)
+            )
+            with patch(
+                "services.helpers.client",
+                openrouteservice.Client(
+                    base_url=fake.url, retry_over_query_limit=False
+                ),
+            ), self.assertLogs("services.helpers", "INFO") as logs:
+                ranked = rank_nearest_drivers(Address(latitude=4.599, longitude=-74.1))
+
+        self.assertEqual(ranked[0][0], drivers[4])
+        self.assertEqual(len(ranked), len(drivers))
+        self.assertIn("ranked 5 by distance", logs.output[0])
+        stats = candidate_sizer.stats()
+        self.assertEqual((stats["audits"], stats["misses"]), (1, 1))
+        self.assertEqual(stats["miss_rate"], 1.0)
+
+
+class AsyncCreateTests(TestCase):
+    def setUp(self):
+        driver_index.clear()
+        route_cache.clear()
+        ors.reset()
+        aors.reset()
+        self.user = User.objects.create(username="async_client")
+        token = RefreshToken.for_user(self.user).access_token
+        self.auth = {"HTTP_AUTHORIZATION": f"Bearer {token}"}
+        self.url = reverse("service-create-async")
+        self.drivers = []
+        for i, latitude in enumerate([4.75, 4.70, 4.60]):
+            address = Address.objects.create(
+                street=f"Driver {i}", city="Bogotá", latitude=latitude, longitude=-74.11
+            )
+            user = User.objects.create(username=f"async_driver_{i}")
+            self.drivers.append(
+                Driver.objects.create(user=user, current_address=address)
+            )
+        self.pickup = {
+            "street": "Pickup",
+            "city": "Bogotá",
+            "latitude": 4.693408,
+            "longitude": -74.112279,
+        }
+
+    def post(self, data, **extra):
+        return self.client.post(
+            self.url, data, content_type="application/json", **extra
+        )
+
+    def test_creates_request_with_nearest_driver(self):
+        with FakeORSServer() as fake:
+            with patch(
+                "services.helpers.async_client", AsyncORSClient(base_url=fake.url)
+            ):
+                response = self.post({"pickup_address": self.pickup}, **self.auth)
+
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(fake.calls, {"directions": 0, "matrix": 1})
+        service = ServiceRequest.objects.get(id=response.json()["id"])
+        self.assertEqual(service.client, self.user)
+        self.assertEqual(service.assigned_driver, self.drivers[1])
+        self.assertEqual(service.status, ServiceRequest.Status.IN_PROGRESS)
+        self.drivers[1].refresh_from_db()
+        self.assertFalse(self.drivers[1].is_available)
+
+    def test_requires_authentication_and_pickup(self):
+        self.assertEqual(self.post({"pickup_address": self.pickup}).status_code, 401)
+        response = self.post(
+            {"pickup_address": self.pickup}, HTTP_AUTHORIZATION="Bearer nonsense"
+        )
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.post({}, **self.auth).status_code, 400)
+        self.assertFalse(ServiceRequest.objects.exists())
+
+    @override_settings(SERVICE_ASSIGNMENT_ASYNC=True)
+    def test_queues_request_when_assignment_is_async(self):
+        response = self.post({"pickup_address": self.pickup}, **self.auth)
+
+        self.assertEqual(response.status_code, 202)
+        service = ServiceRequest.objects.get(id=response.json()["id"])
+        self.assertEqual(service.status, ServiceRequest.Status.PENDING)
+        self.assertEqual(
+            response["Location"], reverse("service-status", kwargs={"pk": service.pk})
+        )
+
+    def test_async_routing_skips_failed_candidates(self):
+        routing = AsyncRoutingClient(
+            hedge_after=0.05, breaker=CircuitBreaker(threshold=3, cooldown=0.1)
+        )
+
+        async def slow():
+            await asyncio.sleep(0.5)
+
+        async def fail():
+            raise RuntimeError("boom")
+
+        async def ok():
+            return 1
+
+        started = time.monotonic()
+        results, errors = asyncio.run(
+            routing.call_many({"ok": ok, "failed": fail, "slow": slow}, Deadline(0.2))
+        )
+
+        self.assertLess(time.monotonic() - started, 0.4)
+        self.assertEqual(results, {"ok": 1})
+        self.assertIsInstance(errors["failed"], RuntimeError)
+        self.assertIsInstance(errors["slow"], DeadlineExceeded)
+        self.assertEqual(routing.stats()["hedges"], 1)
+
+    def test_async_client_pool_closes_with_its_loop(self):
+        pools = []
+
+        async def route(ors_client):
+            await ors_client.directions(
+                [(-74.1, 4.6), (-74.09, 4.61)], profile="cycling-road"
+            )
+            pools.append(await ors_client._client())
+
+        with FakeORSServer() as fake:
+            ors_client = AsyncORSClient(base_url=fake.url)
+            # A fresh loop per call, as async views get under WSGI
+            async_to_sync(route)(ors_client)
+            async_to_sync(route)(ors_client)
+
+        self.assertEqual(fake.calls["directions"], 2)
+        self.assertIsNot(pools[0], pools[1])
+        self.assertTrue(all(pool.is_closed for pool in pools))
+
+
+# A block of four streets around which the pickup (node 2) can only reach
+# node 1 the long way, since 1 -> 2 is one way. The footway is not routable
+# by bike and nodes 5-6 are on a road of their own far away.
+ROAD_NETWORK_OSM = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="1" lat="4.600" lon="-74.100"/>
+  <node id="2" lat="4.600" lon="-74.090"/>
+  <node id="3" lat="4.612" lon="-74.090"/>
+  <node id="4" lat="4.612" lon="-74.100"/>
+  <node id="5" lat="5.000" lon="-75.000"/>
+  <node id="6" lat="5.001" lon="-75.000"/>
+  <way id="1"><nd ref="1"/><nd ref="2"/>
+    <tag k="highway" v="residential"/><tag k="oneway" v="yes"/></way>
+  <way id="2"><nd ref="2"/><nd ref="3"/><nd ref="4"/><nd ref="1"/>
+    <tag k="highway" v="residential"/></way>
+  <way id="3"><nd ref="2"/><nd ref="4"/><tag k="highway" v="footway"/></way>
+  <way id="4"><nd ref="5"/><nd ref="6"/><tag k="highway" v="residential"/></way>
+</osm>
+"""
+
+
+class RoadGraphTests(TestCase):
+    def setUp(self):
+        driver_index.clear()
+        route_cache.clear()
+        ors.reset()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        osm_path = os.path.join(directory.name, "block.osm")
+        with open(osm_path, "w") as osm:
+            osm.write(ROAD_NETWORK_OSM)
+        self.graph_path = os.path.join(directory.name, "graph.npz")
+        RoadGraph.from_osm(osm_path).save(self.graph_path)
+        self.routing = LocalRoutingClient(self.graph_path)
+
+    def test_matrix_follows_one_way_streets(self):
+        node_1, node_2, node_3, node_4 = (
+            (-74.100, 4.600),
+            (-74.090, 4.600),
+            (-74.090, 4.612),
+            (-74.100, 4.612),
+        )
+        side_km = haversine_distance(4.600, -74.100, 4.600, -74.090)
+        end_km = haversine_distance(4.600, -74.090, 4.612, -74.090)
+
+        matrix = self.routing.distance_matrix(
+            locations=[node_2, node_1, node_3, (-75.0, 5.0)],
+            sources=[0, 1],
+            destinations=[1, 2, 3],
+        )
+
+        # 2 -> 1 goes around the block, 1 -> 2 takes the one-way street
+        distances = np.array(matrix["distances"][0][:2]) / 1000
+        np.testing.assert_allclose(distances, [2 * end_km + side_km, end_km], rtol=1e-4)
+        self.assertAlmostEqual(matrix["durations"][0][1], end_km / 15 * 3600, places=3)
+        self.assertAlmostEqual(
+            matrix["distances"][1][1] / 1000, side_km + end_km, places=4
+        )
+        # The isolated road cannot be reached
+        self.assertEqual([row[2] for row in matrix["distances"]], [None, None])
+
+        summary = self.routing.directions(coordinates=[node_2, node_4])["features"][0]
+        self.assertAlmostEqual(
+            summary["properties"]["summary"]["distance"] / 1000,
+            end_km + side_km,
+            places=4,
+        )
+        with self.assertRaises(ValueError):
+            self.routing.directions(coordinates=[node_2, (-75.0, 5.0)])
+
+    def test_find_nearest_driver_with_graph_backend(self):
+        drivers = []
+        # Driver 0 is closer in a straight line, driver 1 by road
+        for i, (latitude, longitude) in enumerate([(4.600, -74.100), (4.612, -74.090)]):
+            address = Address.objects.create(
+                street=f"Street {i}",
+                city="Bogotá",
+                latitude=latitude,
+                longitude=longitude,
+            )
+            user = User.objects.create(username=f"graph_driver_{i}")
+            drivers.append(Driver.objects.create(user=user, current_address=address))
+        pickup_address = Address(latitude=4.600, longitude=-74.090)
+
+        with patch("services.helpers.client", self.routing):
+            driver, distance_km, minutes = find_nearest_driver(pickup_address)
+
+        self.assertEqual(driver, drivers[1])
+        expected_km = haversine_distance(4.600, -74.090, 4.612, -74.090)
+        self.assertAlmostEqual(distance_km, expected_km, places=6)
+        self.assertEqual(minutes, int(expected_km / 15 * 60))
+
+
+class TravelGridTests(TestCase):
+    def setUp(self):
+        driver_index.clear()
+        route_cache.clear()
+        ors.reset()
+        eta_model.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "grid.npy")
+
+    def build(self, slow_west=False):
+        def route_seconds(origins, destinations):
+            # 100 s per 0.01 degree, three times slower going west when
+            # slow_west is set; the north-east cell is unreachable
+            delta = destinations[None, :, 0] - origins[:, None, 0]
+            seconds = 10000 * (
+                np.abs(delta) + np.abs(destinations[None, :, 1] - origins[:, None, 1])
+            )
+            if slow_west:
+                seconds = np.where(delta < 0, seconds * 3, seconds)
+            seconds[:, -1] = np.nan
+            return seconds
+
+        return build_travel_grid(
+            self.path, route_seconds, 4.6, -74.2, 4.62, -74.1, 0.01, rows_per_request=7
+        )
+
+    def test_lookup(self):
+        grid = self.build()
+        self.assertEqual((grid.rows, grid.cols), (2, 10))
+
+        minutes = grid.minutes(
+            4.605,
+            -74.195,
+            [4.605, 4.601, 4.615, 4.615, 4.7],
+            [-74.155, -74.199, -74.195, -74.105, -74.155],
+        )
+
+        np.testing.assert_allclose(minutes[0], 400 / 60)
+        # Same cell, unreachable cell and outside the grid carry no estimate
+        self.assertTrue(np.isnan(minutes[1]))
+        np.testing.assert_allclose(minutes[2], 100 / 60)
+        self.assertTrue(np.isnan(minutes[3:]).all())
+
+    def test_ranks_from_grid_without_ors(self):
+        self.build(slow_west=True)
+        drivers = []
+        # Driver 0 is closer in a straight line, but west of the pickup
+        for i, longitude in enumerate([-74.168, -74.135]):
+            address = Address.objects.create(
+                street=f"Street {i}", city="Bogotá", latitude=4.605, longitude=longitude
+            )
+            user = User.objects.create(username=f"grid_driver_{i}")
+            drivers.append(Driver.objects.create(user=user, current_address=address))
+        pickup = Address(latitude=4.605, longitude=-74.155)
+
+        with self.settings(TRAVEL_GRID_PATH=self.path), patch(
+            "services.helpers.openrouteservice.Client.distance_matrix"
+        ) as mock_matrix:
+            ranked = rank_nearest_drivers(pickup)
+
+        mock_matrix.assert_not_called()
+        self.assertEqual([driver for driver, _, _ in ranked], [drivers[1], drivers[0]])
+        self.assertEqual([minutes for _, _, minutes in ranked], [3, 5])
+
+    def test_rebuilt_grid_is_mapped_again(self):
+        self.build()
+        first = get_travel_grid(self.path)
+        self.assertIs(get_travel_grid(self.path), first)
+
+        os.utime(self.path, ns=(0, 0))
+        self.assertIsNot(get_travel_grid(self.path), first)
+        self.assertIsNone(get_travel_grid(self.path + ".missing"))
+
+
+class RequestTimingTests(TestCase):
+    def setUp(self):
+        driver_index.clear()
+        route_cache.clear()
+        ors.reset()
+        aors.reset()
+        self.user = User.objects.create(username="timed_client")
+        token = RefreshToken.for_user(self.user).access_token
+        self.auth = {"HTTP_AUTHORIZATION": f"Bearer {token}"}
+        for i, latitude in enumerate([4.75, 4.70, 4.60]):
+            address = Address.objects.create(
+                street=f"Driver {i}", city="Bogotá", latitude=latitude, longitude=-74.11
+            )
+            user = User.objects.create(username=f"timed_driver_{i}")
+            Driver.objects.create(user=user, current_address=address)
+        self.body = {
+            "pickup_address": {
+                "street": "Pickup",
+                "city": "Bogotá",
+                "latitude": 4.693408,
+                "longitude": -74.112279,
+            }
+        }
+
+    def create(self, url_name):
+        with FakeORSServer() as fake, patch(
+            "services.helpers.client",
+            openrouteservice.Client(base_url=fake.url, retry_over_query_limit=False),
+        ), patch("services.helpers.async_client", AsyncORSClient(base_url=fake.url)):
+            return self.client.post(
+                reverse(url_name),
+                self.body,
+                content_type="application/json",
+                **self.auth,
+            )
+
+    def phases(self, response):
+        return {
+            metric.split(";")[0]: metric
+            for metric in response["Server-Timing"].split(", ")
+        }
+
+    def test_server_timing_breaks_down_service_creation(self):
+        for url_name in ("service-list-create", "service-create-async"):
+            with self.subTest(view=url_name):
+                response = self.create(url_name)
+
+                self.assertEqual(response.status_code, 201, response.content)
+                phases = self.phases(response)
+                for phase in (
+                    "auth",
+                    "address",
+                    "candidates",
+                    "routing",
+                    "claim",
+                    "create",
+                    "serialize",
+                    "db",
+                    "total",
+                ):
+                    self.assertIn(phase, phases)
+                self.assertRegex(phases["db"], r'desc="\d+ queries"')
+
+    @override_settings(SERVER_TIMING=False)
+    def test_server_timing_header_can_be_disabled(self):
+        response = self.client.get(reverse("service-list-create"), **self.auth)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Server-Timing", response)
+
+    def test_metrics_endpoint_exposes_prometheus_text(self):
+        self.create("service-list-create")
+        url = reverse("metrics")
+        self.assertEqual(self.client.get(url, **self.auth).status_code, 403)
+
+        admin = User.objects.create(username="metrics_admin", is_staff=True)
+        token = RefreshToken.for_user(admin).access_token
+        response = self.client.get(url, HTTP_AUTHORIZATION=f"Bearer {token}")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(
+            response["Content-Type"].startswith("text/plain; version=0.0.4")
+        )
+        body = response.content.decode()
+        self.assertIn("# TYPE http_request_duration_seconds histogram", body)
+        self.assertIn(
+            'http_request_duration_seconds_count{view="service-list-create",'
+            'method="POST",status="201"}',
+            body,
+        )
+        self.assertIn(
+            'http_request_phase_seconds_bucket{view="service-list-create",'
+            'phase="routing",le="+Inf"}',
+            body,
+        )
+        self.assertIn('ors_events_total{client="ors",event="calls"} 1', body)
+        self.assertIn("routing_candidates_count", body)
+        self.assertIn('response_cache_lookups_total{result="hit"}', body)
+
+    @override_settings(METRICS_TOKEN="scrape-secret")
+    def test_metrics_endpoint_accepts_the_scrape_token(self):
+        url = reverse("metrics")
+
+        ok = self.client.get(url, HTTP_AUTHORIZATION="Bearer scrape-secret")
+        wrong = self.client.get(url, HTTP_AUTHORIZATION="Bearer nonsense")
+
+        self.assertEqual(ok.status_code, 200)
+        self.assertEqual(wrong.status_code, 403)
@@ -0,0 +1,297 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import json
+import random
+import time
+from contextlib import ExitStack
+from unittest.mock import patch
+
+import openrouteservice
+from asgiref.sync import ThreadSensitiveContext
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from drivers.models import Driver
+from drivers.spatial_index import driver_index
+from services.benchmarks import LAT_RANGE, LON_RANGE, _percentile
+from services.fake_ors import FakeORSServer
+from services.helpers import aors, candidate_sizer, ors, route_cache
+from services.ors_client import AsyncORSClient
+
+# Queries of the request being replayed, whichever thread and database
+# connection end up running it
+_request_queries = contextvars.ContextVar("request_queries", default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    counter = _request_queries.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def _install_query_counter(sender, connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+def generate_trace(path, requests=1000, rate=10.0, service_seconds=30.0, seed=0):
+    """
+    Writes a JSONL trace of `requests` pickups arriving as a Poisson process
+    at `rate` per second, each completed by its driver an exponentially
+    distributed time (mean `service_seconds`) later. One event per line,
+    ordered by their time `t` in seconds from the start of the trace:
+
+        {"t": 0.021, "event": "pickup", "id": 0, "latitude": 4.61, "longitude": -74.13}
+        {"t": 31.4, "event": "complete", "pickup": 0}
+
+    Returns the number of events written.
+    """
+    rng = random.Random(seed)
+    events, t = [], 0.0
+    for i in range(requests):
+        t += rng.expovariate(rate)
+        events.append(
+            {
+                "t": round(t, 4),
+                "event": "pickup",
+                "id": i,
+                "latitude": round(rng.uniform(*LAT_RANGE), 6),
+                "longitude": round(rng.uniform(*LON_RANGE), 6),
+            }
+        )
+        events.append(
+            {
+                "t": round(t + rng.expovariate(1 / service_seconds), 4),
+                "event": "complete",
+                "pickup": i,
+            }
+        )
+    events.sort(key=lambda event: event["t"])
+    with open(path, "w") as f:
+        for event in events:
+            f.write(json.dumps(event) + "\n")
+    return len(events)
+
+
+def read_trace(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class TrafficReplay:
+    """
+    Replays a trace against the real views through the full Django stack,
+    as an ASGI server would: each request in flight gets its own thread for
+    sync code and its own database connection, `concurrency` at most.
+
+    Requests are sent at their trace time divided by `speed`, whether or not
+    earlier ones have answered (open loop). Latencies are measured from that
+    time, so waiting for a free slot counts, and an overloaded deployment
+    shows up in the percentiles instead of slowing the trace down. Pickups
+    go to the sync or the async (`view="async"`) creation view, completions
+    are sent by a driver once their pickup got one. ORS is a local
+    FakeORSServer answering after `ors_latency` (seconds, or a callable
+    from fake_ors.latency_distribution).
+    """
+
+    def __init__(
+        self, users, concurrency=100, speed=1.0, ors_latency=0.05, view="sync"
+    ):
+        self.concurrency = concurrency
+        self.speed = speed
+        self.ors_latency = ors_latency
+        self.create_url = reverse(
+            "service-create-async" if view == "async" else "service-list-create"
+        )
+        self.auth = {
+            role: {
+                "Authorization": f"Bearer {RefreshToken.for_user(user).access_token}"
+            }
+            for role, user in users.items()
+        }
+
+    def run(self, events):
+        driver_index.clear()
+        route_cache.clear()
+        ors.reset()
+        aors.reset()
+        candidate_sizer.clear()
+        drivers = Driver.objects.count()
+
+        connection_created.connect(_install_query_counter)
+        try:
+            with ExitStack() as stack:
+                fake = stack.enter_context(FakeORSServer(latency=self.ors_latency))
+                stack.enter_context(
+                    patch(
+                        "services.helpers.client",
+                        openrouteservice.Client(
+                            base_url=fake.url, retry_over_query_limit=False
+                        ),
+                    )
+                )
+                stack.enter_context(
+                    patch(
+                        "services.helpers.async_client",
+                        AsyncORSClient(base_url=fake.url),
+                    )
+                )
+                # The event loop gets a thread of its own, as under an ASGI
+                # server, so requests never share this thread's connection
+                with concurrent.futures.ThreadPoolExecutor(1) as loop_thread:
+                    results, elapsed = loop_thread.submit(
+                        asyncio.run, self.replay(events)
+                    ).result()
+        finally:
+            connection_created.disconnect(_install_query_counter)
+        return self.report(results, elapsed, drivers, fake.calls)
+
+    async def replay(self, events):
+        client = AsyncClient(raise_request_exception=False)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        loop = asyncio.get_running_loop()
+        # Created service of each pickup, None when it got no driver
+        services = {
+            event["id"]: loop.create_future()
+            for event in events
+            if event["event"] == "pickup"
+        }
+        start = time.perf_counter()
+
+        async def request(method, url, data, auth):
+            async with semaphore:
+                async with ThreadSensitiveContext():
+                    queries = [0]
+                    _request_queries.set(queries)
+                    response = await getattr(client, method)(
+                        url, data, content_type="application/json", headers=auth
+                    )
+            return response, queries[0]
+
+        async def pickup(event):
+            response = None
+            try:
+                response, queries = await request(
+                    "post",
+                    self.create_url,
+                    {
+                        "pickup_address": {
+                            "street": f"Trace pickup {event['id']}",
+                            "city": "Bogotá",
+                            "latitude": event["latitude"],
+                            "longitude": event["longitude"],
+                        }
+                    },
+                    self.auth["client"],
+                )
+            finally:
+                # Unblocks the completion even if the request raised
+                created = response is not None and response.status_code == 201
+                services[event["id"]].set_result(
+                    response.json()["id"] if created else None
+                )
+            return response, queries
+
+        async def complete(event):
+            service_id = await services[event["pickup"]]
+            if service_id is None:
+                return None, 0
+            return await request(
+                "patch",
+                reverse("complete-service", kwargs={"pk": service_id}),
+                {"status": "completed"},
+                self.auth["driver"],
+            )
+
+        async def send(event):
+            due = start + event["t"] / self.speed
+            await asyncio.sleep(max(0.0, due - time.perf_counter()))
+            handle = pickup if event["event"] == "pickup" else complete
+            response, queries = await handle(event)
+            done = time.perf_counter()
+            return {
+                "event": event["event"],
+                "pickup": event.get("id", event.get("pickup")),
+                "status": response.status_code if response else None,
+                "ms": (done - due) * 1000,
+                "queries": queries,
+                "done": done - start,
+            }
+
+        results = await asyncio.gather(*(send(event) for event in events))
+        return results, time.perf_counter() - start
+
+    def report(self, results, elapsed, drivers, ors_calls):
+        """
+        Returns, per event type, the status codes, the p50/p95/p99 latency
+        and the mean and maximum queries per request, with the overall
+        throughput and driver utilization.
+        """
+        report = {}
+        for name in ("pickup", "complete"):
+            rows = [
+                row
+                for row in results
+                if row["event"] == name and row["status"] is not None
+            ]
+            statuses = {}
+            for row in rows:
+                statuses[row["status"]] = statuses.get(row["status"], 0) + 1
+            timings = [row["ms"] for row in rows]
+            queries = [row["queries"] for row in rows]
+            report[name] = {
+                "requests": len(rows),
+                "skipped": sum(row["event"] == name for row in results) - len(rows),
+                "status": dict(sorted(statuses.items())),
+                "p50_ms": _percentile(timings, 50),
+                "p95_ms": _percentile(timings, 95),
+                "p99_ms": _percentile(timings, 99),
+                "queries_mean": (
+                    round(sum(queries) / len(queries), 2) if queries else None
+                ),
+                "queries_max": max(queries, default=None),
+            }
+
+        # A driver is busy from the answer of its pickup to the one of its
+        # completion (or the end of the replay)
+        assigned = {
+            row["pickup"]: row["done"]
+            for row in results
+            if row["event"] == "pickup" and row["status"] == 201
+        }
+        freed = {
+            row["pickup"]: row["done"]
+            for row in results
+            if row["event"] == "complete" and row["status"] == 200
+        }
+        changes = sorted(
+            [(t, 1) for t in assigned.values()]
+            + [(freed.get(pickup, elapsed), -1) for pickup in assigned]
+        )
+        busy = peak = 0
+        busy_time, last = 0.0, 0.0
+        for t, change in changes:
+            busy_time += busy * (t - last)
+            busy, last = busy + change, t
+            peak = max(peak, busy)
+
+        sent = sum(row["status"] is not None for row in results)
+        report["_meta"] = {
+            "elapsed_s": round(elapsed, 3),
+            "throughput": round(sent / elapsed, 2) if elapsed else None,
+            "concurrency": self.concurrency,
+            "drivers": drivers,
+            "utilization_mean": (
+                round(busy_time / (drivers * elapsed), 4)
+                if drivers and elapsed
+                else None
+            ),
+            "utilization_peak": round(peak / drivers, 4) if drivers else None,
+            "ors_calls": dict(ors_calls),
+            "mean_candidates": candidate_sizer.stats()["mean_candidates"],
+        }
+        return report
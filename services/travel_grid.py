@@ -0,0 +1,152 @@
+import json
+import os
+import threading
+
+import numpy as np
+from django.conf import settings
+
+# Seconds are stored as uint16; this value marks pairs without a route
+UNREACHABLE = np.iinfo(np.uint16).max
+
+
+class TravelGrid:
+    """
+    Precomputed cell-to-cell travel times over a lat/lon bounding box tiled
+    in square cells of `cell_degrees`. Cells are numbered row by row from
+    the south-west corner.
+
+    The times live in a .npy file of shape (cells, cells) that is memory
+    mapped read-only, so every worker process on the host shares the same
+    pages. The bounds and cell size are kept next to it in a .json file.
+    """
+
+    def __init__(self, times, south, west, north, east, cell_degrees):
+        self.times = times
+        self.south, self.west = south, west
+        self.north, self.east = north, east
+        self.cell_degrees = cell_degrees
+        self.rows = int(np.ceil(round((north - south) / cell_degrees, 9)))
+        self.cols = int(np.ceil(round((east - west) / cell_degrees, 9)))
+
+    @staticmethod
+    def metadata_path(path):
+        return os.path.splitext(path)[0] + ".json"
+
+    @classmethod
+    def load(cls, path):
+        with open(cls.metadata_path(path)) as metadata:
+            bounds = json.load(metadata)
+        return cls(
+            np.load(path, mmap_mode="r"),
+            bounds["south"],
+            bounds["west"],
+            bounds["north"],
+            bounds["east"],
+            bounds["cell_degrees"],
+        )
+
+    def __len__(self):
+        return self.rows * self.cols
+
+    def centers(self):
+        """
+        Returns the (longitude, latitude) center of every cell.
+        """
+        rows, cols = np.divmod(np.arange(len(self)), self.cols)
+        return np.column_stack(
+            (
+                self.west + (cols + 0.5) * self.cell_degrees,
+                self.south + (rows + 0.5) * self.cell_degrees,
+            )
+        )
+
+    def cells(self, latitudes, longitudes):
+        """
+        Returns the cell of every point, or -1 for points outside the grid.
+        """
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        rows = np.floor((latitudes - self.south) / self.cell_degrees).astype(np.int64)
+        cols = np.floor((longitudes - self.west) / self.cell_degrees).astype(np.int64)
+        inside = (rows >= 0) & (rows < self.rows) & (cols >= 0) & (cols < self.cols)
+        return np.where(inside, rows * self.cols + cols, -1)
+
+    def minutes(self, latitude, longitude, latitudes, longitudes):
+        """
+        Returns the travel minutes from one point to arrays of points. Pairs
+        outside the grid, without a route or within the same cell (where the
+        grid carries no information) are NaN.
+        """
+        origin = self.cells(latitude, longitude)
+        targets = self.cells(latitudes, longitudes)
+        minutes = np.full(targets.shape, np.nan)
+        if origin < 0:
+            return minutes
+        known = (targets >= 0) & (targets != origin)
+        seconds = self.times[origin, targets[known]]
+        minutes[known] = np.where(seconds == UNREACHABLE, np.nan, seconds / 60)
+        return minutes
+
+
+_lock = threading.Lock()
+_loaded = {}
+
+
+def get_travel_grid(path=None):
+    """
+    Returns the grid at `path` (TRAVEL_GRID_PATH), or None when no grid is
+    configured or built. The file is mapped again when a rebuild replaced it.
+    """
+    path = path or getattr(settings, "TRAVEL_GRID_PATH", None)
+    if not path:
+        return None
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    with _lock:
+        loaded = _loaded.get(path)
+        if loaded is None or loaded[0] != mtime:
+            loaded = _loaded[path] = (mtime, TravelGrid.load(path))
+        return loaded[1]
+
+
+def build_travel_grid(
+    path, route_matrix, south, west, north, east, cell_degrees, rows_per_request
+):
+    """
+    Computes the travel time between the centers of every pair of cells
+    with `route_matrix(origins, destinations)`, which returns seconds with
+    NaN for unroutable pairs, and writes the grid to `path`. The file is
+    replaced atomically, so running workers keep their mapping of the
+    previous one until they reload. Returns the grid.
+    """
+    grid = TravelGrid(None, south, west, north, east, cell_degrees)
+    centers = grid.centers()
+    partial = path + ".partial"
+    times = np.lib.format.open_memmap(
+        partial, mode="w+", dtype=np.uint16, shape=(len(grid), len(grid))
+    )
+    for start in range(0, len(grid), rows_per_request):
+        seconds = route_matrix(centers[start : start + rows_per_request], centers)
+        times[start : start + rows_per_request] = np.where(
+            np.isnan(seconds),
+            UNREACHABLE,
+            np.minimum(np.round(seconds), UNREACHABLE - 1),
+        )
+    times.flush()
+    del times
+
+    with open(TravelGrid.metadata_path(path), "w") as metadata:
+        json.dump(
+            {
+                "south": south,
+                "west": west,
+                "north": north,
+                "east": east,
+                "cell_degrees": cell_degrees,
+            },
+            metadata,
+        )
+    os.replace(partial, path)
+    return TravelGrid.load(path)
@@ -1,8 +1,11 @@
 from django.urls import path
-from .views import ServiceRequestListCreateView, ServiceRequestRetrieveUpdateDestroyView, CompleteServiceView
+from .views import AsyncServiceRequestCreateView, RoutingStatsView, ServiceRequestListCreateView, ServiceRequestRetrieveUpdateDestroyView, CompleteServiceView, ServiceRequestStatusView
 
 urlpatterns = [
     path('services/', ServiceRequestListCreateView.as_view(), name='service-list-create'),
+    path('services/async/', AsyncServiceRequestCreateView.as_view(), name='service-create-async'),
     path('services/<int:pk>/', ServiceRequestRetrieveUpdateDestroyView.as_view(), name='service-retrieve-update-destroy'),
     path('services/<int:pk>/complete/', CompleteServiceView.as_view(), name='complete-service'),
+    path('services/<int:pk>/status/', ServiceRequestStatusView.as_view(), name='service-status'),
+    path('routing/stats/', RoutingStatsView.as_view(), name='routing-stats'),
 ]
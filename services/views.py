@@ -1,21 +1,86 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.http import JsonResponse
+from django.urls import reverse
+from django.views import View
 from rest_framework import generics, status
 from rest_framework.response import Response
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from rest_framework.permissions import IsAdminUser
+from rest_framework.views import APIView
 
+from delivery_system.metrics import TimedJWTAuthentication, timed
+from delivery_system.pagination import CreatedAtKeysetPagination
 from .models import ServiceRequest
-from .serializers import ServiceRequestSerializer
+from .serializers import ServiceRequestSerializer, ServiceRequestStatusSerializer
+from services.helpers import aors, candidate_sizer, ors, route_cache
 from services.service_request_management import (
+    acreate_pickup_address,
+    arank_drivers,
     create_pickup_address,
-    assign_driver_to_service,
+    claim_ranked_driver,
+    create_pending_service_request,
     create_service_request,
-    update_driver_availability,
+    rank_drivers,
     update_service_driver,
 )
 
 
+# Columns ServiceRequestSerializer reads, fetched with a single JOIN query
+SERVICE_REQUEST_FIELDS = [
+    "id",
+    "estimated_time_minutes",
+    "created_at",
+    "status",
+    "client__username",
+    "pickup_address__street",
+    "pickup_address__city",
+    "pickup_address__latitude",
+    "pickup_address__longitude",
+    "assigned_driver__is_available",
+    "assigned_driver__user__username",
+    "assigned_driver__current_address__street",
+    "assigned_driver__current_address__city",
+    "assigned_driver__current_address__latitude",
+    "assigned_driver__current_address__longitude",
+]
+
+
+def service_request_queryset():
+    return ServiceRequest.objects.select_related(
+        "client",
+        "pickup_address",
+        "assigned_driver__user",
+        "assigned_driver__current_address",
+    ).only(*SERVICE_REQUEST_FIELDS)
+
+
 class ServiceRequestListCreateView(generics.ListCreateAPIView):
     queryset = ServiceRequest.objects.all()
     serializer_class = ServiceRequestSerializer
+    pagination_class = CreatedAtKeysetPagination
+
+    def get_queryset(self):
+        # Optional ?status=, ?client= and ?driver= filters
+        queryset = service_request_queryset()
+        params = self.request.query_params
+
+        status_filter = params.get("status")
+        if status_filter is not None:
+            if status_filter not in ServiceRequest.Status.values:
+                raise ValidationError({"status": f"Unknown status '{status_filter}'."})
+            queryset = queryset.filter(status=status_filter)
+
+        for param, field in (("client", "client_id"), ("driver", "assigned_driver_id")):
+            value = params.get(param)
+            if value is not None:
+                if not value.isdigit():
+                    raise ValidationError({param: "Must be an integer id."})
+                queryset = queryset.filter(**{field: value})
+        return queryset
 
     def create(self, request, *args, **kwargs):
         pickup_address_data = request.data.get("pickup_address")
@@ -32,38 +97,139 @@ class ServiceRequestListCreateView(generics.ListCreateAPIView):
         except ValidationError as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Find an available driver and choose the closest one
-        try:
-            available_nearest_driver, estimated_time = assign_driver_to_service(
-                pickup_address
+        # Queue the request and let the process_service_requests workers assign it
+        if getattr(settings, "SERVICE_ASSIGNMENT_ASYNC", False):
+            try:
+                service_request = create_pending_service_request(
+                    request.user, pickup_address
+                )
+            except ValidationError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            serializer = self.get_serializer(service_request)
+            status_url = reverse("service-status", kwargs={"pk": service_request.pk})
+            return Response(
+                serializer.data,
+                status=status.HTTP_202_ACCEPTED,
+                headers={"Location": status_url},
             )
+
+        # Rank outside any transaction, so no connection is held in one while
+        # ORS answers; then claim the closest available driver and create the
+        # service request atomically, so a failure releases the driver again
+        try:
+            ranked_drivers = rank_drivers(pickup_address)
+            with transaction.atomic():
+                available_nearest_driver, estimated_time = claim_ranked_driver(
+                    ranked_drivers
+                )
+                service_request = create_service_request(
+                    request.user,
+                    pickup_address,
+                    available_nearest_driver,
+                    estimated_time,
+                )
         except ValidationError as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Create the service request
+        # Serialize the service request and return the response
+        with timed("serialize"):
+            data = self.get_serializer(service_request).data
+        return Response(data, status=status.HTTP_201_CREATED)
+
+
+class AsyncServiceRequestCreateView(View):
+    """
+    Async twin of ServiceRequestListCreateView.create for ASGI deployments.
+
+    While a request waits on OpenRouteService it only holds a coroutine, so
+    one worker can keep many assignments in flight. DRF views are sync only,
+    so this is a plain Django view that authenticates the JWT itself and
+    returns the same payloads and status codes.
+    """
+
+    http_method_names = ["post"]
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # Token authenticated like the DRF views, which are exempt as well
+        view.csrf_exempt = True
+        return view
+
+    async def post(self, request, *args, **kwargs):
         try:
-            client = request.user
-            service_request = create_service_request(
-                client, pickup_address, available_nearest_driver, estimated_time
+            authenticate = TimedJWTAuthentication().authenticate
+            authenticated = await sync_to_async(authenticate)(request)
+        except AuthenticationFailed as e:
+            return JsonResponse({"detail": str(e.detail)}, status=401)
+        if authenticated is None:
+            return JsonResponse(
+                {"detail": "Authentication credentials were not provided."},
+                status=401,
             )
+        user = authenticated[0]
+
+        try:
+            pickup_address_data = json.loads(request.body or b"{}").get(
+                "pickup_address"
+            )
+        except (ValueError, AttributeError):
+            return JsonResponse({"error": "Malformed JSON body"}, status=400)
+        if not pickup_address_data:
+            return JsonResponse({"error": "pickup_address is required"}, status=400)
+
+        try:
+            pickup_address = await acreate_pickup_address(pickup_address_data)
         except ValidationError as e:
-            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            return JsonResponse({"error": str(e)}, status=400)
+
+        if getattr(settings, "SERVICE_ASSIGNMENT_ASYNC", False):
+            try:
+                data = await sync_to_async(self.queue)(user, pickup_address)
+            except ValidationError as e:
+                return JsonResponse({"error": str(e)}, status=400)
+            response = JsonResponse(data, status=202)
+            response["Location"] = reverse("service-status", kwargs={"pk": data["id"]})
+            return response
 
-        # Update the driver status to unavailable
+        # Only the routing is awaited; claiming the driver and creating the
+        # request stay one transaction in the sync thread
         try:
-            update_driver_availability(available_nearest_driver)
+            ranked_drivers = await arank_drivers(pickup_address)
+            data = await sync_to_async(self.claim)(user, pickup_address, ranked_drivers)
         except ValidationError as e:
-            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            return JsonResponse({"error": str(e)}, status=400)
+        return JsonResponse(data, status=201)
 
-        # Serialize the service request and return the response
-        serializer = self.get_serializer(service_request)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    def queue(self, user, pickup_address):
+        service_request = create_pending_service_request(user, pickup_address)
+        return ServiceRequestSerializer(service_request).data
+
+    def claim(self, user, pickup_address, ranked_drivers):
+        with transaction.atomic():
+            driver, estimated_time = claim_ranked_driver(ranked_drivers)
+            service_request = create_service_request(
+                user, pickup_address, driver, estimated_time
+            )
+        with timed("serialize"):
+            return ServiceRequestSerializer(service_request).data
 
 
 class ServiceRequestRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
     queryset = ServiceRequest.objects.all()
     serializer_class = ServiceRequestSerializer
 
+    def get_queryset(self):
+        if self.request.method == "GET":
+            return service_request_queryset()
+        return super().get_queryset()
+
+
+class ServiceRequestStatusView(generics.RetrieveAPIView):
+    queryset = ServiceRequest.objects.all()
+    serializer_class = ServiceRequestStatusSerializer
+
 
 class CompleteServiceView(generics.UpdateAPIView):
     queryset = ServiceRequest.objects.all()
@@ -98,3 +264,22 @@ class CompleteServiceView(generics.UpdateAPIView):
 
         # Return response with updated service
         return Response({'msg': 'Service completed successfully'}, status=status.HTTP_200_OK)
+
+
+class RoutingStatsView(APIView):
+    """
+    Routing call counters, executor queue and connection reuse of the worker
+    serving the request.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(
+            {
+                "ors": ors.stats(),
+                "async_ors": aors.stats(),
+                "route_cache": route_cache.stats(),
+                "candidates": candidate_sizer.stats(),
+            }
+        )